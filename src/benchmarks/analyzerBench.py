@@ -0,0 +1,141 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the analyzers of the content of the pages.
+
+  Indexes the same synthetic English and Spanish history with each
+  analyzer, and reports the size of the index, its amount of distinct
+  terms and postings, the indexing time, the search latency and the recall
+  of queries written without the inflections or the accents of the pages.
+
+  > python benchmarks/analyzerBench.py [--docs 5000]
+                                       [--analyzers standard en auto]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from queryCache import QueryCache  # noqa: E402
+from whoosh.lang import stopwords_for_language  # noqa: E402
+
+INDEXNAME = 'AnalyzerBench'
+
+# Words of each language and the inflections they appear with.
+WORDS = {
+    'en': (['run', 'walk', 'play', 'search', 'cook', 'travel', 'learn',
+            'work', 'visit', 'build', 'paint', 'clean', 'jump', 'talk'],
+           ['', 's', 'ing', 'ed']),
+    'es': (['canción', 'corazón', 'información', 'búsqueda', 'página',
+            'música', 'película', 'lección', 'región', 'razón'],
+           ['', 'es'])
+}
+
+
+def inflect(word: str, suffix: str):
+    """Returns word with the suffix, dropping the accent of the plurals."""
+    if suffix == 'es':
+        word = word.replace('ó', 'o')
+    return word + suffix
+
+
+def build_corpus(docs: int, words: int, seed: int):
+    """
+      Returns the synthetic pages, and for each query the urls of the pages
+      that contain any inflection of its word.
+
+      :rtype: tuple
+    """
+    rand = random.Random(seed)
+    stopwords = {lang: sorted(stopwords_for_language(lang))
+                 for lang in WORDS}
+    fillers = [f'x{i}' for i in range(3000)]
+    documents = []
+    relevant = {}
+    for i in range(docs):
+        lang = 'en' if i % 2 == 0 else 'es'
+        stems, suffixes = WORDS[lang]
+        text = []
+        for _ in range(words):
+            kind = rand.random()
+            if kind < 0.4:
+                text.append(rand.choice(stopwords[lang]))
+            elif kind < 0.5:
+                stem = rand.choice(stems)
+                text.append(inflect(stem, rand.choice(suffixes)))
+                relevant.setdefault(stem, set()).add(f'http://{i}')
+            else:
+                text.append(rand.choice(fillers))
+        documents.append({'url': f'http://{i}', 'title': f'Page {i}',
+                          'content': ' '.join(text)})
+
+    # The queries use the bare words, without accents.
+    queries = {stem.replace('ó', 'o').replace('ú', 'u').replace('á', 'a')
+               .replace('í', 'i'): urls for stem, urls in relevant.items()}
+    return documents, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--analyzers', nargs='+',
+                        default=['standard', 'folding', 'en', 'auto'])
+    args = parser.parse_args()
+
+    documents, queries = build_corpus(args.docs, args.words, args.seed)
+
+    print(f'{"analyzer":>9} {"MB":>6} {"terms":>7} {"postings":>9} '
+          f'{"index s":>8} {"search ms":>10} {"recall":>7}')
+    for analyzer in args.analyzers:
+        index = Multiindex(tempfile.mkdtemp(prefix='wer-analyzers-'),
+                           cache=QueryCache(max_bytes=0), analyzer=analyzer)
+        try:
+            start = time.perf_counter()
+            for i in range(0, len(documents), 1000):
+                index.add_documents(INDEXNAME, documents[i:i + 1000])
+            index.merge(INDEXNAME, 'optimize')
+            indexing = time.perf_counter() - start
+
+            size = sum(s['bytes'] for s in index.segments(INDEXNAME))
+            terms = postings = 0
+            with index.searcher(INDEXNAME) as searcher:
+                reader = searcher.reader()
+                for field in reader.indexed_field_names():
+                    if field == 'content' or field.startswith('content_'):
+                        for term in reader.lexicon(field):
+                            terms += 1
+                            postings += reader.doc_frequency(field, term)
+
+            latencies = []
+            found = expected = 0
+            for query, urls in queries.items():
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    res = index.search_word(INDEXNAME, query)
+                    latencies.append(time.perf_counter() - start)
+                found += len(urls & {r['url'] for r in res})
+                expected += len(urls)
+            latencies.sort()
+
+            print(f'{analyzer:>9} {size / 2 ** 20:6.2f} {terms:7d} '
+                  f'{postings:9d} {indexing:8.2f} '
+                  f'{latencies[len(latencies) // 2] * 1000:10.2f} '
+                  f'{found / expected:7.2f}')
+        finally:
+            index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
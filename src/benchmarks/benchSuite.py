@@ -0,0 +1,428 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Reproducible benchmark suite of the WER server.
+
+  Builds a synthetic navigation history (pages of a set of domains whose
+  words follow a Zipf distribution over the vocabulary) and measures:
+
+    - ingest: throughput of Multiindex.add_document and of batches stored
+      with Multiindex.add_documents.
+    - search: latency of Multiindex.search_word for several kinds of
+      queries, whose amount of results goes from none to most of the pages.
+    - render: cost of Render.build_list_response for several result sizes.
+    - http: throughput and latency of the server driven end to end by
+      concurrent local clients searching and storing pages.
+
+  The results are written as JSON, together with the commit and the
+  parameters of the run, so runs of different commits can be compared:
+
+  > python benchmarks/benchSuite.py --output base.json
+  > python benchmarks/benchSuite.py --compare base.json
+
+  With --compare, the latencies that grew (or throughputs that dropped)
+  more than --tolerance are reported and the script exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from queryCache import QueryCache  # noqa: E402
+from render import Render  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+INDEXNAME = 'BenchSuite'
+DOMAINS = ['news', 'wiki', 'shop', 'blog', 'docs', 'forum', 'video', 'mail']
+
+
+class Corpus():
+    """Synthetic navigation history, fully determined by its parameters."""
+
+    def __init__(self, docs: int = 5000, vocabulary: int = 5000,
+                 words: int = 200, seed: int = 0):
+        """
+          :param docs: amount of pages.
+          :param vocabulary: amount of distinct words.
+          :param words: mean amount of words of each page.
+          :param seed: seed of the random generator.
+        """
+        rand = random.Random(seed)
+        self.vocabulary = [f'w{i}' for i in range(vocabulary)]
+        weights = [1 / (i + 1) for i in range(vocabulary)]
+        self.documents = []
+        for i in range(docs):
+            domain = rand.choice(DOMAINS)
+            length = max(1, int(rand.gauss(words, words / 4)))
+            content = rand.choices(self.vocabulary, weights, k=length)
+            self.documents.append({
+                'url': f'http://{domain}.example.com/{i}',
+                'title': f'{domain} {" ".join(content[:5])}',
+                'content': ' '.join(content)
+            })
+
+        # Queries whose amount of results go from all the pages to none.
+        common = self.vocabulary[:3]
+        middle = self.vocabulary[vocabulary // 20:vocabulary // 20 + 3]
+        rare = self.vocabulary[-3:]
+        phrase = self.documents[0]['content'].split()[:2]
+        self.queries = {
+            'common': common[0],
+            'and': f'{common[0]} {middle[0]}',
+            'or': ' OR '.join(middle),
+            'phrase': '"' + ' '.join(phrase) + '"',
+            'rare': rare[0],
+            'missing': 'unseen'
+        }
+
+    def http_documents(self):
+        """Returns the documents as the /store requests send them."""
+        return [{'url': d['url'], 'title': d['title'], 'text': d['content']}
+                for d in self.documents]
+
+
+def latency_stats(latencies: list):
+    """
+      Summarizes a list of latencies in seconds.
+
+      Returns a dictionary with the amount of samples and the mean, p50,
+      p99 and max latencies in milliseconds.
+      :rtype: dict
+    """
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+        'max_ms': values[-1] * 1000
+    }
+
+
+def bench_ingest(corpus: Corpus, single: int, batch: int):
+    """
+      Measures the throughput of storing the corpus one page at a time and
+      in batches.
+
+      :param corpus: pages to store.
+      :param single: amount of pages stored one at a time.
+      :param batch: amount of pages of each batch.
+
+      :rtype: dict
+    """
+    ret = {}
+    index = Multiindex(tempfile.mkdtemp(prefix='wer-suite-'))
+    try:
+        documents = corpus.documents[:single]
+        start = time.perf_counter()
+        for d in documents:
+            index.add_document(INDEXNAME, d['url'], d['title'], d['content'])
+        elapsed = time.perf_counter() - start
+        ret['add_document'] = {
+            'docs': len(documents), 'seconds': elapsed,
+            'docs_per_second': len(documents) / elapsed}
+
+        index.remove_index(INDEXNAME)
+        documents = corpus.documents
+        start = time.perf_counter()
+        for i in range(0, len(documents), batch):
+            index.add_documents(INDEXNAME, documents[i:i + batch])
+        elapsed = time.perf_counter() - start
+        ret['add_documents'] = {
+            'docs': len(documents), 'batch': batch, 'seconds': elapsed,
+            'docs_per_second': len(documents) / elapsed}
+    finally:
+        index.remove_index()
+    return ret
+
+
+def bench_search(index: Multiindex, corpus: Corpus, repeat: int):
+    """
+      Measures the latency of search_word for each kind of query.
+
+      :param index: multiindex holding the corpus.
+      :param corpus: corpus whose queries are run.
+      :param repeat: amount of times each query is run.
+
+      :rtype: dict
+    """
+    ret = {}
+    for kind, query in corpus.queries.items():
+        results = index.search_word(INDEXNAME, query)
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            index.search_word(INDEXNAME, query)
+            latencies.append(time.perf_counter() - start)
+        ret[kind] = dict(latency_stats(latencies), query=query,
+                         results=len(results))
+    return ret
+
+
+def bench_render(sizes: list, repeat: int):
+    """
+      Measures the cost of rendering lists of results of several sizes.
+
+      :param sizes: amounts of results.
+      :param repeat: amount of times each list is rendered.
+
+      :rtype: dict
+    """
+    render = Render()
+    ret = {}
+    for size in sizes:
+        res = [{'url': f'http://example.com/{i}', 'title': f'Page {i}'}
+               for i in range(size)]
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render.build_list_response(res)
+            latencies.append(time.perf_counter() - start)
+        ret[str(size)] = latency_stats(latencies)
+    return ret
+
+
+def request(url: str, method: str = 'GET', data=None):
+    """Sends an authenticated request and returns the response body."""
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(url, data=body, method=method, headers={
+        'Authorization': CREDENTIALS,
+        'Content-Type': 'application/json'
+    })
+    with urllib.request.urlopen(req) as response:
+        return response.read()
+
+
+def bench_http(path: str, corpus: Corpus, clients: int, duration: float,
+               store_ratio: float):
+    """
+      Drives the server with concurrent clients that search and store pages
+      for duration seconds.
+
+      :param path: multiindex directory already holding the corpus.
+      :param corpus: corpus whose queries are searched.
+      :param clients: amount of concurrent clients.
+      :param duration: seconds the clients run.
+      :param store_ratio: fraction of the requests that store a page.
+
+      :rtype: dict
+    """
+    server, _, writeBuffer, scheduler, _ = build_server(
+        'localhost', 0, path, INDEXNAME)
+    base = f'http://localhost:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    queries = list(corpus.queries.values())
+    documents = corpus.http_documents()
+    latencies = {'search': [], 'store': []}
+    errors = []
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def client(n):
+        rand = random.Random(n)
+        i = 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                if rand.random() < store_ratio:
+                    kind = 'store'
+                    doc = dict(rand.choice(documents),
+                               url=f'http://client{n}.example.com/{i}')
+                    request(f'{base}/store', 'POST', doc)
+                else:
+                    kind = 'search'
+                    query = urllib.parse.quote(rand.choice(queries))
+                    request(f'{base}/search/q={query}')
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+            i += 1
+
+    try:
+        threads = [threading.Thread(target=client, args=(n,))
+                   for n in range(clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+        if scheduler is not None:
+            scheduler.close()
+        writeBuffer.close()
+        Multiindex.shared(path).close()
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'clients': clients,
+        'requests_per_second': total / elapsed,
+        'errors': len(errors),
+        'search': latency_stats(latencies['search']),
+        'store': latency_stats(latencies['store'])
+    }
+
+
+def git_commit():
+    """Returns the current commit, or None outside a git repository."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = ''):
+    """
+      Returns the numeric values of the nested results keyed by their dotted
+      path, e.g., {'search.common.p50_ms': 1.2}.
+
+      :rtype: dict
+    """
+    ret = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            ret.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            ret[f'{prefix}{key}'] = value
+    return ret
+
+
+def compare(baseline: dict, current: dict, tolerance: float):
+    """
+      Compares the latencies and throughputs of two runs.
+
+      :param baseline: results of the reference run.
+      :param current: results of the new run.
+      :param tolerance: relative change allowed, e.g., 0.2 for 20%.
+
+      Returns the list of (metric, baseline, current) that regressed.
+      :rtype: list
+    """
+    old = flatten(baseline)
+    new = flatten(current)
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith(('mean_ms', 'p50_ms', 'p99_ms')):
+            worse = new[key] > old[key] * (1 + tolerance)
+        elif key.endswith('per_second'):
+            worse = new[key] < old[key] * (1 - tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append((key, old[key], new[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--words', type=int, default=200,
+                        help="mean amount of words of each page.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single', type=int, default=200,
+                        help="pages stored one at a time.")
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--render-sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--store-ratio', type=float, default=0.2)
+    parser.add_argument('--only', nargs='+',
+                        choices=['ingest', 'search', 'render', 'http'],
+                        default=['ingest', 'search', 'render', 'http'])
+    parser.add_argument('--output', help="file to write the results to.")
+    parser.add_argument('--compare', help="results of a previous run.")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    corpus = Corpus(args.docs, args.vocabulary, args.words, args.seed)
+    results = {}
+
+    if 'ingest' in args.only:
+        results['ingest'] = bench_ingest(corpus, args.single, args.batch)
+
+    if 'search' in args.only or 'http' in args.only:
+        path = tempfile.mkdtemp(prefix='wer-suite-')
+        # Without cache, so every query is actually run.
+        index = Multiindex(path, cache=QueryCache(max_bytes=0))
+        for i in range(0, len(corpus.documents), args.batch):
+            index.add_documents(INDEXNAME, corpus.documents[i:i + args.batch])
+        try:
+            if 'search' in args.only:
+                results['search'] = bench_search(index, corpus, args.repeat)
+        finally:
+            index.close()
+        try:
+            if 'http' in args.only:
+                results['http'] = bench_http(path, corpus, args.clients,
+                                             args.duration, args.store_ratio)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    if 'render' in args.only:
+        results['render'] = bench_render(args.render_sizes, args.repeat)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': vars(args),
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline['results'], results, args.tolerance)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old:.3f} -> {new:.3f}',
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the connection reuse of the WER server.
+
+  Starts the server on an ephemeral port and measures the requests per
+  second served to several concurrent clients that either reuse a single
+  HTTP/1.1 connection or open a new connection for each request, as every
+  request did before the server supported keep-alive.
+
+  > python benchmarks/keepAliveBench.py [--path /search/q=apple]
+"""
+
+import argparse
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+INDEXNAME = 'KeepAlive'
+
+
+def run_clients(port: int, path: str, clients: int, duration: float,
+                reuse: bool):
+    """
+      Runs clients threads requesting path for duration seconds.
+
+      :param reuse: if True each client reuses its connection, otherwise it
+      opens a new one for each request.
+
+      Returns the amount of requests served per second.
+      :rtype: float
+    """
+    headers = {'Authorization': CREDENTIALS}
+    if not reuse:
+        headers['Connection'] = 'close'
+    counts = [0] * clients
+    stop = time.monotonic() + duration
+
+    def client(n):
+        conn = http.client.HTTPConnection('localhost', port)
+        while time.monotonic() < stop:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if not reuse or response.will_close:
+                conn.close()
+            counts[n] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--path', default='/available/index')
+    parser.add_argument('--max-requests', type=int, default=100)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='wer-keepalive-')
+    index = Multiindex.shared(path)
+    index.add_document(INDEXNAME, 'http://example.com', 'Example',
+                       'apple banana cherry')
+    server, _, writeBuffer, scheduler, _ = build_server(
+        'localhost', 0, path, INDEXNAME, max_requests=args.max_requests)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        results = {}
+        for name, reuse in [('new connection', False), ('keep-alive', True)]:
+            results[name] = run_clients(port, args.path, args.clients,
+                                        args.duration, reuse)
+            print(f'{name:>14}: {results[name]:.0f} requests/s')
+        print(f'speedup: '
+              f'{results["keep-alive"] / results["new connection"]:.2f}x')
+    finally:
+        server.shutdown()
+        server.server_close()
+        if scheduler is not None:
+            scheduler.close()
+        writeBuffer.close()
+        index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
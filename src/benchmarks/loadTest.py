@@ -0,0 +1,166 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Load test of the WER server.
+
+  Starts the server on an ephemeral port and measures the latency of the
+  searches issued by several concurrent clients, first on an idle server
+  and then during a sustained ingest burst. With the threaded server the
+  search p99 should stay roughly flat between both phases, while with
+  --single-threaded every search waits behind the stores.
+
+  > python benchmarks/loadTest.py [--single-threaded]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, WERRequestHandler, build_server  # noqa: E402
+
+INDEXNAME = 'LoadTest'
+WORDS = ['apple', 'banana', 'cherry', 'delta', 'echo', 'foxtrot', 'golf',
+         'hotel', 'india', 'juliet', 'kilo', 'lima', 'mike', 'november']
+
+
+def request(url: str, method: str = 'GET', data=None):
+    """
+      Sends an authenticated request and returns the response body.
+
+      :param url: complete url of the request.
+      :param method: HTTP method.
+      :param data: object to send as a json body.
+    """
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(url, data=body, method=method, headers={
+        'Authorization': CREDENTIALS,
+        'Content-Type': 'application/json'
+    })
+    with urllib.request.urlopen(req) as response:
+        return response.read()
+
+
+def document(i: int):
+    """Returns a synthetic page numbered i."""
+    text = ' '.join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(200))
+    return {'url': f'http://example.com/{i}', 'title': f'Page {i}',
+            'text': text}
+
+
+def percentile(values: list, p: float):
+    """Returns the p percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def search_clients(base: str, clients: int, duration: float):
+    """
+      Runs clients threads searching for duration seconds.
+
+      Returns the list of latencies in seconds.
+      :rtype: list
+    """
+    latencies = []
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def client(n):
+        i = n
+        while time.monotonic() < stop:
+            word = WORDS[i % len(WORDS)]
+            start = time.perf_counter()
+            request(f'{base}/search/q={word}')
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def ingest_burst(base: str, stop: threading.Event, batch: int):
+    """Stores pages, one by one and in batches, until stop is set."""
+    i = 1000
+    while not stop.is_set():
+        request(f'{base}/store', 'POST', document(i))
+        request(f'{base}/store/batch', 'POST',
+                [document(i + 1 + j) for j in range(batch)])
+        i += batch + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--single-threaded', action='store_true')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--docs', type=int, default=500)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='wer-load-')
+    index = Multiindex.shared(path)
+    index.add_documents(INDEXNAME, [
+        {'url': d['url'], 'title': d['title'], 'content': d['text']}
+        for d in map(document, range(args.docs))])
+
+    server, _, writeBuffer, scheduler, _ = build_server(
+        'localhost', 0, path, INDEXNAME,
+        threaded=not args.single_threaded)
+    base = f'http://localhost:{server.server_address[1]}'
+    WERRequestHandler.log_message = lambda *a: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # The server prints every search, so its output is discarded.
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            idle = search_clients(base, args.clients, args.duration)
+
+            stop = threading.Event()
+            writers = [threading.Thread(target=ingest_burst,
+                                        args=(base, stop, args.batch))
+                       for _ in range(args.writers)]
+            for w in writers:
+                w.start()
+            busy = search_clients(base, args.clients, args.duration)
+            stop.set()
+            for w in writers:
+                w.join()
+
+        finally:
+            server.shutdown()
+            server.server_close()
+            if scheduler is not None:
+                scheduler.close()
+            writeBuffer.close()
+            index.remove_index()
+
+    for name, latencies in [('idle', idle), ('ingest', busy)]:
+        print(f'{name:>7}: {len(latencies)} searches, '
+              f'p50 {percentile(latencies, 0.5) * 1000:.1f} ms, '
+              f'p99 {percentile(latencies, 0.99) * 1000:.1f} ms')
+    print(f'p99 ratio ingest/idle: '
+          f'{percentile(busy, 0.99) / percentile(idle, 0.99):.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the searches served by several worker processes.
+
+  Stores a synthetic corpus, starts the server on an ephemeral port with an
+  increasing amount of worker processes (1 is the threaded server of a
+  single process) and measures the searches per second answered to several
+  client processes, without cache, so every search is actually run.
+
+  > python benchmarks/preforkBench.py [--docs 5000] [--processes 1 2 4]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+INDEXNAME = 'PreforkBench'
+HEADERS = {'Authorization': CREDENTIALS}
+
+
+def client(port: int, queries: list, seconds: float):
+    """Searches the queries in a loop. Returns the amount of searches."""
+    conn = http.client.HTTPConnection('localhost', port)
+    count = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        query = queries[count % len(queries)]
+        conn.request('GET', f'/api/search/q={query}&index={INDEXNAME}',
+                     headers=HEADERS)
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200
+        count += 1
+    conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    vocabulary = [f'w{i}' for i in range(2000)]
+    queries = ['%20OR%20'.join(rand.sample(vocabulary, 3))
+               for _ in range(200)]
+
+    path = tempfile.mkdtemp(prefix='wer-prefork-')
+    index = Multiindex.shared(path)
+    for i in range(0, args.docs, 1000):
+        index.add_documents(INDEXNAME, [{
+            'url': f'http://example.com/{j}', 'title': f'Page {j}',
+            'content': ' '.join(rand.choices(vocabulary, k=args.words))
+        } for j in range(i, min(i + 1000, args.docs))])
+
+    context = multiprocessing.get_context('spawn')
+    try:
+        for processes in args.processes:
+            server, _, writeBuffer, scheduler, _ = build_server(
+                'localhost', 0, path, INDEXNAME, cache_mb=0,
+                processes=processes)
+            port = server.server_address[1]
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                # Warms up every worker before measuring.
+                with context.Pool(args.clients) as pool:
+                    pool.starmap(client, [(port, queries, 1.0)] *
+                                 args.clients)
+                    counts = pool.starmap(
+                        client, [(port, queries, args.seconds)] *
+                        args.clients)
+                print(f'{processes} process(es): '
+                      f'{sum(counts) / args.seconds:.0f} searches/s')
+            finally:
+                server.shutdown()
+                server.server_close()
+                if scheduler is not None:
+                    scheduler.close()
+                writeBuffer.close()
+    finally:
+        index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the indexes kept in memory.
+
+  Indexes the same synthetic pages, in small batches as the write buffer
+  commits them, into an index stored on disk and into one kept in memory,
+  and measures the latency of the commits, of the searches (never cached)
+  and of a snapshot of the index kept in memory.
+
+  > python benchmarks/ramBench.py [--docs 5000] [--batch 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from queryCache import QueryCache  # noqa: E402
+
+INDEXNAME = 'RamBench'
+
+
+def percentile(values: list, p: float):
+    """Returns the p percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--searches', type=int, default=500)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    vocabulary = [f'w{i}' for i in range(5000)]
+    documents = [{
+        'url': f'http://example.com/{i}', 'title': f'Page {i}',
+        'content': ' '.join(rand.choices(vocabulary, k=args.words))
+    } for i in range(args.docs)]
+    words = [rand.choice(vocabulary) for _ in range(args.searches)]
+
+    for mode in ('file', 'ram'):
+        index = Multiindex(
+            tempfile.mkdtemp(prefix='wer-ram-'), cache=QueryCache(0),
+            ram_indexes=[INDEXNAME] if mode == 'ram' else (),
+            snapshot_interval=None)
+        try:
+            commits = []
+            for i in range(0, args.docs, args.batch):
+                start = time.perf_counter()
+                index.add_documents(INDEXNAME, documents[i:i + args.batch])
+                commits.append(time.perf_counter() - start)
+
+            searches = []
+            for word in words:
+                start = time.perf_counter()
+                index.search_page(INDEXNAME, word, snippets=True)
+                searches.append(time.perf_counter() - start)
+
+            print(f'{mode:>4}: commit of {args.batch} pages '
+                  f'p50 {percentile(commits, 0.5) * 1000:.1f} ms '
+                  f'p99 {percentile(commits, 0.99) * 1000:.1f} ms, '
+                  f'search p50 {percentile(searches, 0.5) * 1000:.2f} ms '
+                  f'p99 {percentile(searches, 0.99) * 1000:.2f} ms')
+            if mode == 'ram':
+                start = time.perf_counter()
+                size = index.snapshot()
+                print(f'      snapshot of {size // 1024} KB in '
+                      f'{(time.perf_counter() - start) * 1000:.1f} ms')
+        finally:
+            index.remove_index()
+            index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the searches over sharded indexes.
+
+  Stores the same synthetic corpus in indexes split into an increasing
+  amount of shards, and measures the latency of the searches, whose shards
+  are queried in parallel by worker processes (or threads).
+
+  > python benchmarks/shardBench.py [--docs 20000] [--shards 1 2 4]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from queryCache import QueryCache  # noqa: E402
+
+INDEXNAME = 'ShardBench'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=300,
+                        help="amount of words of each page.")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--fanout', choices=['thread', 'process'],
+                        default='process')
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    vocabulary = [f'w{i}' for i in range(2000)]
+    documents = [{
+        'url': f'http://example.com/{i}',
+        'title': f'Page {i}',
+        'content': ' '.join(rand.choices(vocabulary, k=args.words))
+    } for i in range(args.docs)]
+    queries = [' OR '.join(rand.sample(vocabulary, 3))
+               for _ in range(args.queries)]
+
+    for shards in args.shards:
+        # Without cache, so every query is actually run.
+        index = Multiindex(tempfile.mkdtemp(prefix='wer-shards-'),
+                           cache=QueryCache(max_bytes=0), shards=shards,
+                           fanout=args.fanout)
+        try:
+            for i in range(0, len(documents), 1000):
+                index.add_documents(INDEXNAME, documents[i:i + 1000])
+
+            # Warms up the workers and their searchers.
+            index.search_page(INDEXNAME, queries[0])
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search_page(INDEXNAME, query)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print(f'{shards} shards: '
+                  f'p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+                  f'mean {sum(latencies) / len(latencies) * 1000:.1f} ms')
+        finally:
+            index.close()
+            index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
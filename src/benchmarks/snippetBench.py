@@ -0,0 +1,81 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the generation of snippets.
+
+  Indexes synthetic pages and measures the time spent highlighting the
+  results of a search in both ways supported by the index: analyzing the
+  stored content again to find the matching terms, or taking the fragments
+  around the character offsets kept in the postings of the content.
+
+  > python benchmarks/snippetBench.py [--docs 2000] [--words 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex, set_highlighter, snippet  # noqa: E402
+from whoosh.qparser import QueryParser  # noqa: E402
+
+INDEXNAME = 'SnippetBench'
+
+
+def highlight(index: Multiindex, word: str, pagesize: int, pinpoint: bool):
+    """
+      Searches for word and highlights the first page of results.
+
+      Returns the seconds spent generating the snippets.
+      :rtype: float
+    """
+    with index.searcher(INDEXNAME) as searcher:
+        query = QueryParser("content", searcher.schema).parse(word)
+        results = searcher.search(query, limit=pagesize, terms=True)
+        set_highlighter(results, searcher.schema, pinpoint=pinpoint)
+
+        start = time.perf_counter()
+        for hit in results:
+            snippet(hit)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=2000,
+                        help="amount of words of each page.")
+    parser.add_argument('--pagesize', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    vocabulary = [f'w{i}' for i in range(5000)]
+
+    index = Multiindex(tempfile.mkdtemp(prefix='wer-snippet-'))
+    try:
+        index.add_documents(INDEXNAME, [{
+            'url': f'http://example.com/{i}',
+            'title': f'Page {i}',
+            'content': ' '.join(rand.choices(vocabulary, k=args.words))
+        } for i in range(args.docs)])
+
+        words = rand.sample(vocabulary, args.repeat)
+        for name, pinpoint in [('reanalysis', False), ('offsets', True)]:
+            elapsed = sum(highlight(index, w, args.pagesize, pinpoint)
+                          for w in words)
+            print(f'{name:>10}: {elapsed / args.repeat * 1000:.2f} ms '
+                  f'per page of {args.pagesize} snippets')
+    finally:
+        index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
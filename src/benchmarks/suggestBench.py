@@ -0,0 +1,91 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the completions of /suggest.
+
+  Indexes a synthetic history with a large vocabulary and measures the
+  latency of Multiindex.suggest for prefixes of several lengths, as typed
+  in the omnibox, compared with a prefix* search of the same prefixes.
+
+  > python benchmarks/suggestBench.py [--docs 2000] [--vocabulary 50000]
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from queryCache import QueryCache  # noqa: E402
+
+INDEXNAME = 'SuggestBench'
+
+
+def percentile(values: list, p: float):
+    """Returns the p percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(function, prefixes: list):
+    """Returns the latencies in milliseconds of function on each prefix."""
+    latencies = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        function(prefix)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    vocabulary = [''.join(rand.choices(string.ascii_lowercase,
+                                       k=rand.randint(3, 10)))
+                  for _ in range(args.vocabulary)]
+    index = Multiindex(tempfile.mkdtemp(prefix='wer-suggest-'),
+                       cache=QueryCache(max_bytes=0))
+    try:
+        for i in range(0, args.docs, 500):
+            index.add_documents(INDEXNAME, [
+                {'url': f'http://{j}', 'title': f'Page {j}',
+                 'content': ' '.join(rand.choices(vocabulary,
+                                                  k=args.words))}
+                for j in range(i, min(i + 500, args.docs))])
+
+        start = time.perf_counter()
+        index.suggest(INDEXNAME, 'a')
+        print(f'dictionary built in {time.perf_counter() - start:.2f} s')
+
+        for length in range(1, 5):
+            prefixes = [rand.choice(vocabulary)[:length]
+                        for _ in range(args.queries)]
+            suggest = measure(lambda p: index.suggest(INDEXNAME, p, 8),
+                              prefixes)
+            search = measure(lambda p: index.search_page(
+                INDEXNAME, p + '*', pagesize=8), prefixes[:20])
+            print(f'prefix of {length}: suggest p50 '
+                  f'{percentile(suggest, 0.5):.3f} ms, p99 '
+                  f'{percentile(suggest, 0.99):.3f} ms; prefix search p50 '
+                  f'{percentile(search, 0.5):.1f} ms')
+    finally:
+        index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
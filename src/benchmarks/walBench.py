@@ -0,0 +1,126 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the write-ahead log of the WER server.
+
+  Starts the server on an ephemeral port and measures the latency of /store
+  for several concurrent clients without the log (the page is only queued),
+  with the log synced to disk before each answer and with the log only
+  written to the operating system. It also measures the time until a stored
+  page is found, with a search that waits for its sequence number.
+
+  > python benchmarks/walBench.py [--clients 4] [--requests 200]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+INDEXNAME = 'WalBench'
+HEADERS = {'Authorization': CREDENTIALS, 'Content-Type': 'application/json'}
+
+
+def percentile(values: list, p: float):
+    """Returns the p percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def store_clients(port: int, clients: int, requests: int, visible: bool):
+    """
+      Runs clients threads storing requests pages each.
+
+      :param visible: if True, after each store the client searches the
+      page waiting for its sequence number, and the latency is the one of
+      both requests.
+
+      Returns the list of latencies in seconds.
+      :rtype: list
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client(n):
+        conn = http.client.HTTPConnection('localhost', port)
+        for i in range(requests):
+            word = f'w{n}x{i}'
+            body = json.dumps({'url': f'http://{n}/{i}', 'title': word,
+                               'text': f'{word} ' * 50})
+            start = time.perf_counter()
+            conn.request('POST', '/store', body, HEADERS)
+            response = json.loads(conn.getresponse().read())
+            if visible:
+                seq = response.get('seq', 0)
+                conn.request('GET', f'/api/search/q={word}&seq={seq}',
+                             headers=HEADERS)
+                found = json.loads(conn.getresponse().read())['total']
+                assert found == 1, f'{word} not found'
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--buffer-delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    modes = [('no log', None, False), ('log + fsync', 'wal', True),
+             ('log, no fsync', 'wal', False)]
+    for name, wal_dir, fsync in modes:
+        path = tempfile.mkdtemp(prefix='wer-wal-')
+        index = Multiindex.shared(path)
+        server, _, writeBuffer, scheduler, wal = build_server(
+            'localhost', 0, path, INDEXNAME, buffer_delay=args.buffer_delay,
+            wal_dir=wal_dir and os.path.join(path, wal_dir),
+            wal_fsync=fsync)
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            stores = store_clients(port, args.clients, args.requests, False)
+            line = (f'{name:>14}: store p50 '
+                    f'{percentile(stores, 0.5) * 1000:.2f} ms, p99 '
+                    f'{percentile(stores, 0.99) * 1000:.2f} ms')
+            if wal is not None:
+                visible = store_clients(port, args.clients,
+                                        args.requests // 4, True)
+                line += (f', visible p50 '
+                         f'{percentile(visible, 0.5) * 1000:.2f} ms')
+            print(line)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if scheduler is not None:
+                scheduler.close()
+            writeBuffer.close()
+            if wal is not None:
+                wal.close()
+            index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
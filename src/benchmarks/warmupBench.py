@@ -0,0 +1,144 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Benchmark of the startup of the WER server.
+
+  Stores a synthetic corpus and then, for each mode, evicts its files from
+  the page cache of the OS (where posix_fadvise is available), starts the
+  server in a new process and measures, from the start of that process:
+
+    - ready: until /available answers 200, i.e., the warm-up finished.
+    - first: the latency of the first search.
+    - fast: until a search (never cached) is answered in less than
+      --fast-ms milliseconds, the time-to-first-fast-query.
+
+  The modes are "cold" (no warm-up), "warm" (the structures are loaded and
+  the warm-up queries searched, without reading the files) and "preload"
+  (the files are also read into the page cache).
+
+  > python benchmarks/warmupBench.py [--docs 20000] [--fast-ms 20]
+                                     [--searches 200]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+INDEXNAME = 'WarmupBench'
+HEADERS = {'Authorization': CREDENTIALS}
+MODES = {
+    'cold': dict(warmup=False),
+    'warm': dict(warmup=True, preload=False),
+    'preload': dict(warmup=True, preload=True)
+}
+
+
+def evict(path: str):
+    """Drops the files of the directory path from the page cache."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for file in os.listdir(path):
+        fd = os.open(os.path.join(path, file), os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def serve(path: str, options: dict, queries: list, started, ports):
+    """Runs the server of a mode until it is terminated."""
+    started.value = time.time()
+    server, _, _, _, _ = build_server('localhost', 0, path, INDEXNAME,
+                                      cache_mb=0, merge_policy='commit',
+                                      warmup_queries=queries, **options)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def request(conn, path: str):
+    """Sends a GET request. Returns its status and latency."""
+    start = time.perf_counter()
+    conn.request('GET', path, headers=HEADERS)
+    response = conn.getresponse()
+    response.read()
+    return response.status, time.perf_counter() - start
+
+
+def measure(path: str, options: dict, warmup_queries: list, queries: list,
+            fast: float):
+    """Starts the server of a mode. Returns ready, first and fast seconds."""
+    context = multiprocessing.get_context('spawn')
+    started = context.Value('d', 0.0)
+    ports = context.Queue()
+    process = context.Process(target=serve, args=(
+        path, options, warmup_queries, started, ports))
+    process.start()
+    try:
+        conn = http.client.HTTPConnection('localhost', ports.get(timeout=60))
+        while request(conn, '/available')[0] != 200:
+            time.sleep(0.01)
+        ready = time.time() - started.value
+
+        first = None
+        for query in queries:
+            status, seconds = request(
+                conn, f'/api/search/q={query}&index={INDEXNAME}')
+            assert status == 200
+            first = seconds if first is None else first
+            if seconds < fast:
+                return ready, first, time.time() - started.value
+        return ready, first, None
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--fast-ms', type=float, default=20)
+    parser.add_argument('--searches', type=int, default=200)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    vocabulary = [f'w{i}' for i in range(5000)]
+    # Every search is a different word, so none is answered by a cache.
+    queries = rand.sample(vocabulary, args.searches + 5)
+
+    path = tempfile.mkdtemp(prefix='wer-warmup-')
+    index = Multiindex.shared(path)
+    for i in range(0, args.docs, 1000):
+        index.add_documents(INDEXNAME, [{
+            'url': f'http://example.com/{j}', 'title': f'Page {j}',
+            'content': ' '.join(rand.choices(vocabulary, k=args.words))
+        } for j in range(i, min(i + 1000, args.docs))])
+    index.close()
+
+    try:
+        for mode, options in MODES.items():
+            evict(index._path)
+            ready, first, fast = measure(index._path, options, queries[:5],
+                                         queries[5:], args.fast_ms / 1000)
+            fast = f'{fast:.2f} s' if fast is not None else 'never'
+            print(f'{mode}: ready after {ready:.2f} s, first search '
+                  f'{first * 1000:.1f} ms, first fast search after {fast}')
+    finally:
+        index.remove_index()
+
+
+if __name__ == '__main__':
+    main()
@@ -112,11 +112,15 @@ class CacheHandler {
 
 /** Global variables */
 const STATUS_AVAILABLE = 'AVAILABLE';           // Available status
+const STATUS_WARMING = 'WARMING';               // Available, still warming up.
 const API_scheme = 'http';                      // Server scheme.
 const API_host = 'localhost:8888';              // Server host and port. 
 const API_url = `${API_scheme}://${API_host}`;  // Server complete URL.
 const API_newIndex = 'newindex';                // Endpoint for creating a new index.
 const API_search = 'search';                    // Endpoint for searching words.
+const API_suggest = 'suggest';                  // Endpoint for completing words.
+const API_exists = 'exists';                    // Endpoint for checking stored pages.
+const MAX_SUGGESTIONS = 5;                      // Completions shown by the omnibox.
 
 // Endpoint for checking server availability.
 const API_serverAvailable = 'available';
@@ -127,6 +131,7 @@ const API_indexAvailable = `${API_serverAvailable}/index`;
 
 const cacheHandler = new CacheHandler();        // Structure to handle the cache.
 const MAXSIZE = 10;                             // Max amount of elements allowed in the cache.
+const MIN_COMPRESS_SIZE = 1024;                 // Smaller bodies are sent uncompressed.
 let cache;                                      // Cache.
 
 /** Harcoded credentials for the pair test:test -> dGVzdDp0ZXN0 */
@@ -142,6 +147,24 @@ const CREDENTIALS = `Basic ${btoa(`${user}:${pass}`)}`;
  */
 const encode_utf8 = (text) => encodeURIComponent(text);
 
+/**
+ * Compresses a request body with gzip, if it is large enough and the
+ * browser supports CompressionStream.
+ * 
+ * @param {string} body - Body to send.
+ * @returns {Promise}     Object with the body and the headers to add.
+ */
+async function compressBody(body) {
+  if (body.length < MIN_COMPRESS_SIZE || typeof CompressionStream === 'undefined')
+    return { body: body, headers: {} };
+
+  const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+  return {
+    body: await new Response(stream).arrayBuffer(),
+    headers: { 'Content-Encoding': 'gzip' }
+  };
+}
+
 
 /**
  * Sends a POST request to the server asking if 'text'
@@ -160,6 +183,39 @@ const inputEntered = (text) => {
     });
 };
 
+/**
+ * Escapes the characters of a text that the omnibox reads as markup.
+ * 
+ * @param {string} text - Text to escape.
+ * @returns {string}      Escaped text.
+ */
+const escapeXML = (text) => text.replace(/&/g, '&amp;')
+  .replace(/</g, '&lt;').replace(/>/g, '&gt;')
+  .replace(/"/g, '&quot;').replace(/'/g, '&apos;');
+
+/**
+ * Asks the server for the completions of the text being typed in the
+ * omnibox, and shows them as suggestions.
+ * 
+ * @param {string} text     - Text typed after the keyword.
+ * @param {Function} suggest - Callback that shows the suggestions.
+ */
+const inputChanged = (text, suggest) => {
+  const e_text = encodeURIComponent(text);
+  fetch(`${API_url}/${API_suggest}/q=${e_text}&limit=${MAX_SUGGESTIONS}`, {
+    credentials: 'include',
+    headers: { 'Authorization': CREDENTIALS }
+  })
+    .then(response => response.json())
+    .then(json => suggest(json.suggestions.map(s => ({
+      content: s.text,
+      description: `${escapeXML(s.text)} <dim>(${s.docs} pages)</dim>`
+    }))))
+    .catch(err => {
+      console.log("Unable to get suggestions.", err);
+    });
+};
+
 /**
  * Generates a new structure that represents an empty cache.
  * It is an Object with some functionalities inherited of a double 
@@ -257,7 +313,7 @@ async function initializeCache() {
     });
     let ret = await response.json();
     console.log(ret.message);
-    if (ret.status == STATUS_AVAILABLE) return;
+    if (ret.status == STATUS_AVAILABLE || ret.status == STATUS_WARMING) return;
   }
 
   /** 
@@ -298,6 +354,33 @@ chrome.runtime.onInstalled.addListener(() => {
   );
 });
 
+/**
+ * Asks the server whether it already holds the page, so its text is not
+ * sent again. The server records the visit of a page it holds.
+ * 
+ * @param {Object} data - Object with the hash and the url of the page.
+ * @returns {Promise}     True if the server holds the page.
+ */
+async function existsRequest(data) {
+  try {
+    const response = await fetch(`${API_url}/${API_exists}`, {
+      method: "POST",
+      credentials: 'include',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': CREDENTIALS
+      },
+      body: JSON.stringify({ hashes: [data.hash], urls: [data.url] }),
+    });
+    const json = await response.json();
+    return json.exists[0] === true;
+  } catch (err) {
+    // The page is sent anyway.
+    console.log("Unable to check whether the page is stored.", err);
+    return false;
+  }
+}
+
 /** Tries to store the text received into request.text */
 async function storeRequest(data) {
 
@@ -314,20 +397,29 @@ async function storeRequest(data) {
   if (cacheHandler.has_and_update(cache, data.hash))
     return { message: "Text already cached." };
 
-  /** Sends the text to the server. */
+  /** Sends the text to the server, unless it already holds it. */
+  if (await existsRequest(data)) {
+    cacheHandler.add(cache, data.hash);
+    await backupCacheToStorage(cache);
+    return { message: "Text already stored." };
+  }
+
   const data2send = {
     text: data.text,
     url: data.url,
-    title: data.title
+    title: data.title,
+    hash: data.hash     // Lets the server discard duplicates without searching.
   };
   try {
+    const request = await compressBody(JSON.stringify(data2send));
     await fetch(`${API_url}/store`, {
       method: "POST",
-      body: JSON.stringify(data2send),
+      body: request.body,
       credentials: 'include',
       headers: {
         'Content-Type': 'application/json',
-        'Authorization': CREDENTIALS
+        'Authorization': CREDENTIALS,
+        ...request.headers
       },
     });
   } catch (err) {
@@ -390,3 +482,9 @@ chrome.runtime.onMessage.addListener(
  * It listens to the 'WER' keyword (defined in the manifest).
  */
 chrome.omnibox.onInputEntered.addListener(inputEntered);
+
+/** 
+ * Omnibox - onInputChanged - handler.
+ * Suggests completions of the last word while it is typed.
+ */
+chrome.omnibox.onInputChanged.addListener(inputChanged);
@@ -0,0 +1,191 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import re
+
+from whoosh.analysis import CharsetFilter, LanguageAnalyzer, \
+    StandardAnalyzer
+from whoosh.fields import ID, TEXT
+from whoosh.lang import has_stemmer, has_stopwords, languages, \
+    stopwords_for_language
+from whoosh.qparser import FuzzyTermPlugin, MultifieldParser, QueryParser
+from whoosh.support.charset import accent_map
+
+"""
+  Analyzers of the content of the pages. Each index is created with one of
+  them, which is kept in its schema, so documents and queries are always
+  analyzed the same way:
+
+    - "standard": lowercase words without English stopwords, as whoosh
+      does by default.
+    - "folding": like standard, folding the accents, e.g., 'canción' and
+      'cancion' are the same term.
+    - a language code, e.g., "en" or "es": stopwords and stemming of that
+      language, and folding of the accents, so 'running' matches 'runs'.
+    - "auto": the language of each page is detected from its stopwords,
+      and its content is analyzed with the analyzer of that language, or
+      with folding if it is not detected.
+"""
+
+# Languages that have both stemming and stopwords in whoosh.
+LANGUAGES = tuple(lang for lang in languages
+                  if has_stemmer(lang) and has_stopwords(lang))
+
+# Languages detected by the "auto" analyzer.
+AUTO_LANGUAGES = ("en", "es", "fr", "de", "it", "pt")
+
+ANALYZERS = ("standard", "folding", "auto") + LANGUAGES
+
+# Amount of characters of a page used to detect its language, and minimum
+# amount of stopwords that must be found.
+DETECT_CHARS = 2000
+DETECT_MIN_STOPWORDS = 3
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = {lang: frozenset(stopwords_for_language(lang))
+              for lang in AUTO_LANGUAGES}
+
+
+def analyzer(name: str):
+    """
+      Returns the whoosh analyzer named name, see ANALYZERS.
+
+      :param name: "standard", "folding" or a language code.
+    """
+    if name == "standard":
+        return StandardAnalyzer()
+    if name == "folding":
+        return StandardAnalyzer() | CharsetFilter(accent_map)
+    if name in LANGUAGES:
+        return LanguageAnalyzer(name) | CharsetFilter(accent_map)
+    raise ValueError(f"Unknown analyzer {name}.")
+
+
+def content_fields(name: str):
+    """
+      Returns the fields that hold the content of the pages of an index
+      created with the analyzer named name. Besides content, "auto" indexes
+      have a field content_{lang} for each language, and the language of
+      each page in the field lang.
+
+      :param name: name of the analyzer, see ANALYZERS.
+
+      :rtype: dict
+    """
+    if name == "auto":
+        fields = {"content": TEXT(analyzer=analyzer("folding"), chars=True),
+                  "lang": ID(stored=True)}
+        for lang in AUTO_LANGUAGES:
+            fields[f"content_{lang}"] = TEXT(analyzer=analyzer(lang),
+                                             chars=True)
+        return fields
+    return {"content": TEXT(analyzer=analyzer(name), chars=True)}
+
+
+def detect_language(text: str, candidates=AUTO_LANGUAGES):
+    """
+      Detects the language of a text as the one whose stopwords appear
+      more times in its beginning.
+
+      :param text: text of a page.
+      :param candidates: languages to choose from.
+
+      Returns the language code, or None if too few stopwords were found.
+      :rtype: str
+    """
+    words = _WORD.findall(text[:DETECT_CHARS].lower())
+    best, count = None, DETECT_MIN_STOPWORDS - 1
+    for lang in candidates:
+        stopwords = _STOPWORDS.get(lang) or \
+            frozenset(stopwords_for_language(lang))
+        found = sum(1 for word in words if word in stopwords)
+        if found > count:
+            best, count = lang, found
+    return best
+
+
+def content_document(schema, text: str):
+    """
+      Returns the fields of a document holding its text, according to the
+      analyzer of the index.
+
+      :param schema: schema of the index.
+      :param text: text of the page.
+
+      :rtype: dict
+    """
+    if "lang" not in schema:
+        return {"content": text}
+
+    candidates = [name[len("content_"):] for name in schema.names()
+                  if name.startswith("content_")]
+    lang = detect_language(text, candidates)
+    if lang is None:
+        return {"content": text}
+    return {f"content_{lang}": text, "lang": lang}
+
+
+def content_terms(schema, fields: dict):
+    """
+      Returns the terms indexed for the content of a document.
+
+      :param schema: schema of the index.
+      :param fields: fields of the document holding its text, as returned
+      by content_document.
+
+      :rtype: set
+    """
+    return {term for fieldname, value in fields.items()
+            if fieldname.startswith("content")
+            for term in schema[fieldname].process_text(value, mode="index")}
+
+
+def term_prefix(schema, prefix: str):
+    """
+      Returns the beginning of a word as the beginning of the terms of the
+      index: lowercased and, if the index folds the accents, folded. It is
+      not stemmed, since the stem of a beginning is not the beginning of
+      the stems.
+
+      :param schema: schema of the index.
+      :param prefix: beginning of a word.
+
+      :rtype: str
+    """
+    prefix = prefix.lower()
+    items = getattr(schema["content"].analyzer, "items", ())
+    if any(isinstance(item, CharsetFilter) for item in items):
+        prefix = prefix.translate(accent_map)
+    return prefix
+
+
+def content_fieldname(hit):
+    """
+      Returns the name of the field holding the content of a hit.
+
+      :rtype: str
+    """
+    lang = hit.get("lang")
+    return f"content_{lang}" if lang else "content"
+
+
+def query_parser(schema):
+    """
+      Returns the parser of the queries of an index, which searches every
+      field holding content, each one with its own analyzer. Besides the
+      default syntax of whoosh, e.g., "exact phrases" and prefix* queries,
+      it accepts fuzzy terms such as word~ or word~2, which match the terms
+      at that edit distance.
+
+      :param schema: schema of the index.
+    """
+    fields = [name for name in schema.names()
+              if name == "content" or name.startswith("content_")]
+    if len(fields) == 1:
+        parser = QueryParser("content", schema)
+    else:
+        parser = MultifieldParser(fields, schema)
+    parser.add_plugin(FuzzyTermPlugin())
+    return parser
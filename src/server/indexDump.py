@@ -0,0 +1,152 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+"""
+  Exports the documents of an index to a JSONL dump, one JSON document per
+  line, and imports them back. Dumps whose name ends with .gz are gzip
+  compressed, and '-' stands for the standard output or input.
+
+  > python server/indexDump.py export Anonimous history.jsonl.gz
+  > python server/indexDump.py import Anonimous history.jsonl.gz --procs 4
+
+  Importing a dump into a new index with --analyzer rebuilds the index with
+  another analyzer.
+
+  The import should run while the server is stopped, since both need the
+  writer lock of the index.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import logging
+import sys
+import time
+
+try:
+    from .indexHandler import Multiindex
+except ImportError:
+    from indexHandler import Multiindex
+
+logger = logging.getLogger(__name__)
+
+
+def open_dump(path: str, mode: str):
+    """
+      Opens a dump for reading ("r") or writing ("w") as text.
+
+      :param path: path to the dump, compressed if it ends with .gz, or '-'
+      for the standard input or output.
+      :param mode: "r" or "w".
+
+      :rtype: io.TextIOBase
+    """
+    if path == "-":
+        stream = sys.stdin.buffer if mode == "r" else sys.stdout.buffer
+        if mode == "r" and stream.peek(2)[:2] == b"\x1f\x8b":
+            stream = gzip.GzipFile(fileobj=stream, mode="rb")
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_dump(documents, path: str):
+    """
+      Writes the documents to a dump, one at a time.
+
+      :param documents: iterable of dictionaries.
+      :param path: see open_dump.
+
+      Returns the amount of documents written.
+      :rtype: int
+    """
+    count = 0
+    with open_dump(path, "w") as f:
+        for doc in documents:
+            f.write(json.dumps(doc, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_dump(path: str):
+    """
+      Reads the documents of a dump, one at a time.
+
+      :param path: see open_dump.
+
+      Yields a dictionary for each non-empty line.
+      :rtype: generator
+    """
+    with open_dump(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_index(index: Multiindex, indexname: str, path: str):
+    """
+      Exports the documents of the index named indexname to a dump.
+
+      Returns the amount of exported documents.
+      :rtype: int
+    """
+    return write_dump(index.export_documents(indexname), path)
+
+
+def import_index(index: Multiindex, indexname: str, path: str, **kwargs):
+    """
+      Imports the documents of a dump into the index named indexname.
+
+      :param kwargs: arguments of Multiindex.import_documents, e.g., procs.
+
+      Returns the amount of documents read and of skipped documents.
+      :rtype: tuple
+    """
+    return index.import_documents(indexname, read_dump(path), **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('index', help="name of the index.")
+    parser.add_argument('dump', help="path to the dump, or '-'.")
+    parser.add_argument('--path', default='indexdir',
+                        help="multiindex directory, as used by wer.py.")
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--procs', type=int, default=1,
+                        help="processes indexing each batch.")
+    parser.add_argument('--batch', type=int, default=10000,
+                        help="documents of each commit.")
+    parser.add_argument('--limitmb', type=int, default=128,
+                        help="megabytes of postings of each writer before "
+                        "spilling them to disk, shared among its processes.")
+    parser.add_argument('--analyzer', default='standard',
+                        help="analyzer of the index, if it is created.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO',
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    index = Multiindex(args.path, shards=args.shards,
+                       analyzer=args.analyzer)
+    start = time.perf_counter()
+    try:
+        if args.command == 'export':
+            count = export_index(index, args.index, args.dump)
+            logger.info("Exported %d documents in %.1f s", count,
+                        time.perf_counter() - start)
+        else:
+            read, skipped = import_index(
+                index, args.index, args.dump, batch=args.batch,
+                procs=args.procs, limitmb=args.limitmb)
+            logger.info("Read %d documents (%d without content skipped) "
+                        "in %.1f s", read, skipped,
+                        time.perf_counter() - start)
+    finally:
+        index.close()
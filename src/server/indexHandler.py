@@ -3,85 +3,1443 @@ __version__ = "1.0.0"
 __email__ = "mbianchetti@dc.uba.ar"
 __status__ = "Testing"
 
+import hashlib
+import heapq
+import logging
+import math
 import os
 import shutil
+import multiprocessing
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlparse
 
-from whoosh.index import create_in
+from whoosh.index import TOC, clean_files, create_in
+from whoosh.reading import SegmentReader
+from whoosh.query import AndNot, NumericRange, Or, Term
+from whoosh.writing import OPTIMIZE
 from whoosh.fields import *
-from whoosh.qparser import QueryParser
-from whoosh.filedb.filestore import FileStorage
+from whoosh.highlight import ContextFragmenter, HtmlFormatter, \
+    PinpointFragmenter
+from whoosh.filedb.filestore import FileStorage, RamStorage
+
+try:
+    from .analysis import ANALYZERS, content_document, content_fieldname, \
+        content_fields, content_terms, query_parser, term_prefix
+    from .metrics import METRICS
+    from .queryCache import QueryCache
+    from .termDictionary import TermDictionary
+except ImportError:
+    from analysis import ANALYZERS, content_document, content_fieldname, \
+        content_fields, content_terms, query_parser, term_prefix
+    from metrics import METRICS
+    from queryCache import QueryCache
+    from termDictionary import TermDictionary
+
+logger = logging.getLogger(__name__)
+
+COMMIT_SECONDS = METRICS.histogram(
+    "wer_commit_seconds", "Seconds spent by the writer committing documents.")
+MERGE_SECONDS = METRICS.histogram(
+    "wer_merge_seconds", "Seconds spent merging the segments of a shard.",
+    ("policy",))
+SNAPSHOT_SECONDS = METRICS.histogram(
+    "wer_snapshot_seconds",
+    "Seconds spent saving the indexes kept in memory to disk.")
+WRITER_SPILLS = METRICS.counter(
+    "wer_writer_spills_total",
+    "Runs of postings written to disk by the writers of this process after "
+    "exceeding their memory limit.")
 
 
 BASEPATH = os.path.dirname(__file__)
 
+# Maximum amount of idle searchers kept open for each index.
+SEARCHER_POOL_SIZE = 8
+
+# Size in bytes of the digests kept by DigestSet.
+DIGEST_SIZE = hashlib.md5().digest_size
+
+# Amount of fragments of each snippet, and their size in characters.
+SNIPPET_FRAGMENTS = 3
+SNIPPET_CHARS = 200
+SNIPPET_SURROUND = 40
+
+# Amount of segments of similar size merged together by TIERED_MERGE.
+MERGE_FACTOR = 10
+
+# Default megabytes of postings each writer keeps in memory before writing
+# them to disk, as Whoosh does.
+WRITER_LIMITMB = 128
+
+# Rankings of the searches: "bm25" scores the documents by their content,
+# while "recency" also favours the pages visited recently and often, see
+# blended_score.
+RANKINGS = ("bm25", "recency")
+
+# Seconds after which the recency boost of a page halves, and weights of
+# the recency and frequency boosts.
+RECENCY_HALF_LIFE = 7 * 24 * 3600
+RECENCY_WEIGHT = 1.0
+FREQUENCY_WEIGHT = 0.5
+
+# Amount of best BM25 results re-ranked by the recency ranking.
+RERANK_CANDIDATES = 200
+
+# Seconds between the snapshots of the indexes kept in memory.
+SNAPSHOT_INTERVAL = 60.0
+
+# Minimum seconds between the rebuilds of a term dictionary of an index
+# written by another process.
+TERMS_REFRESH = 30.0
+
+# Process-wide multiindices, see Multiindex.shared.
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def content_hash(url: str, content: str):
+    """
+      Returns the MD5 of the url and the content of a page, joined by a
+      space and encoded in UTF-8, as the extension computes it to fill its
+      cache.
+
+      :param url: page url.
+      :param content: text of the page.
+
+      :rtype: str
+    """
+    return hashlib.md5(f"{url} {content}".encode("utf-8")).hexdigest()
+
+
+def blended_score(score: float, last_visited: float, visits: int,
+                  now: float, half_life: float = RECENCY_HALF_LIFE):
+    """
+      Returns the score of a page for the recency ranking: its BM25 score,
+      boosted by up to RECENCY_WEIGHT times for a page visited right now,
+      which halves every half_life seconds, and by FREQUENCY_WEIGHT times
+      the logarithm of its amount of visits.
+
+      :param score: BM25 score of the page.
+      :param last_visited: time of the last visit, in seconds since the
+      epoch. None if unknown.
+      :param visits: amount of visits.
+      :param now: current time, in seconds since the epoch.
+      :param half_life: seconds after which the recency boost halves.
+
+      :rtype: float
+    """
+    recency = 0.0
+    if last_visited is not None:
+        recency = 0.5 ** (max(0.0, now - last_visited) / half_life)
+    return score * (1 + RECENCY_WEIGHT * recency) * \
+        (1 + FREQUENCY_WEIGHT * math.log(max(1, visits)))
+
+
+def is_digest(digest):
+    """
+      Checks whether digest is an hexadecimal MD5.
+
+      :param digest: value to check.
+
+      :rtype: bool
+    """
+    if not isinstance(digest, str) or len(digest) != 2 * DIGEST_SIZE:
+        return False
+    try:
+        bytes.fromhex(digest)
+    except ValueError:
+        return False
+    return True
+
+
+def compress(text: str):
+    """
+      Compresses a text to be kept in a STORED field.
+
+      :param text: text to compress.
+
+      :rtype: bytes
+    """
+    return zlib.compress(text.encode("utf-8"))
+
+
+def decompress(data: bytes):
+    """
+      Returns the text compressed by compress.
+
+      :param data: compressed text.
+
+      :rtype: str
+    """
+    return zlib.decompress(data).decode("utf-8")
+
+
+def set_highlighter(results, schema, pinpoint: bool = None):
+    """
+      Configures how the snippets of the results are highlighted.
+
+      If the content field keeps the character offsets of its terms the
+      fragments are taken around them, otherwise the stored content has
+      to be analyzed again to find the matching terms.
+
+      :param results: whoosh results of a search done with terms=True.
+      :param schema: schema of the searched index.
+      :param pinpoint: forces using (or not) the character offsets.
+    """
+    if pinpoint is None:
+        pinpoint = schema["content"].supports("characters")
+
+    if pinpoint:
+        results.fragmenter = PinpointFragmenter(
+            maxchars=SNIPPET_CHARS, surround=SNIPPET_SURROUND,
+            autotrim=True)
+    else:
+        results.fragmenter = ContextFragmenter(
+            maxchars=SNIPPET_CHARS, surround=SNIPPET_SURROUND)
+    results.formatter = HtmlFormatter(tagname="b")
+
+
+def snippet(hit):
+    """
+      Returns the highlighted fragments of the content of a hit. Documents
+      indexed before the content was stored have no snippet.
+
+      :param hit: whoosh hit of a search configured with set_highlighter.
+
+      :rtype: str
+    """
+    data = hit.get("stored_content")
+    if data is None:
+        return ""
+    return hit.highlights(content_fieldname(hit), text=decompress(data),
+                          top=SNIPPET_FRAGMENTS)
+
+
+def read_file(path: str, chunk_size: int = 1024 * 1024):
+    """
+      Reads a whole file, so its pages are left in the page cache of the OS.
+
+      :param path: path to the file.
+      :param chunk_size: bytes read at a time.
+
+      Returns the size of the file.
+      :rtype: int
+    """
+    buffer = bytearray(chunk_size)
+    size = 0
+    with open(path, "rb", buffering=0) as file:
+        read = file.readinto(buffer)
+        while read:
+            size += read
+            read = file.readinto(buffer)
+    return size
+
+
+def copy_file(source, target, name: str):
+    """
+      Copies a file between whoosh storages. It is written with a temporary
+      name and then renamed, so a partial copy is never taken for the file.
+
+      :param source: storage holding the file.
+      :param target: storage receiving the file.
+      :param name: name of the file.
+
+      Returns the size of the file.
+      :rtype: int
+    """
+    with source.open_file(name) as f:
+        data = f.read()
+    tmp = f"{name}.tmp"
+    with target.create_file(tmp) as f:
+        f.write(data)
+    target.rename_file(tmp, name, safe=False)
+    return len(data)
+
+
+def tiered_segments(segments):
+    """
+      Groups the segments in tiers of similar size, i.e., whose amount of
+      documents has the same order of magnitude in base MERGE_FACTOR, and
+      selects the tiers holding at least MERGE_FACTOR segments. Segments
+      with more deleted than live documents are always selected, so their
+      space is reclaimed.
+
+      :param segments: current segments of an index.
+
+      Returns the segments that must be merged, if any.
+      :rtype: list
+    """
+    tiers = {}
+    to_merge = []
+    for seg in segments:
+        if seg.deleted_count() * 2 > seg.doc_count_all():
+            to_merge.append(seg)
+            continue
+        tier = 0
+        count = seg.doc_count_all()
+        while count >= MERGE_FACTOR:
+            count //= MERGE_FACTOR
+            tier += 1
+        tiers.setdefault(tier, []).append(seg)
+
+    for tier in tiers.values():
+        if len(tier) >= MERGE_FACTOR:
+            to_merge.extend(tier)
+    return to_merge
+
+
+def TIERED_MERGE(writer, segments):
+    """
+      Whoosh merge policy that merges the segments selected by
+      tiered_segments.
+
+      :param writer: writer that receives the merged segments.
+      :param segments: current segments of the index.
+
+      Returns the segments that were not merged.
+      :rtype: list
+    """
+    return merge_segments(writer, segments, tiered_segments(segments))
+
+
+def EXPUNGE_MERGE(writer, segments):
+    """
+      Whoosh merge policy that rewrites every segment holding deleted
+      documents, so their space is reclaimed, and keeps the others.
+
+      :param writer: writer that receives the merged segments.
+      :param segments: current segments of the index.
+
+      Returns the segments that were not merged.
+      :rtype: list
+    """
+    return merge_segments(writer, segments,
+                          [seg for seg in segments if seg.has_deletions()])
+
+
+def merge_segments(writer, segments, to_merge):
+    """
+      Adds the live documents of the segments to_merge to the writer.
+
+      Returns the segments that were not merged.
+      :rtype: list
+    """
+    for seg in to_merge:
+        reader = SegmentReader(writer.storage, writer.schema, seg)
+        writer.add_reader(reader)
+        reader.close()
+    return [seg for seg in segments if seg not in to_merge]
+
+
+# Merge policies accepted by Multiindex.merge.
+MERGE_POLICIES = {"tiered": TIERED_MERGE, "optimize": OPTIMIZE,
+                  "expunge": EXPUNGE_MERGE}
+
+
+def hit_result(hit, snippets: bool = False):
+    """
+      Returns the dictionary {title: title, url: url, score: score} that
+      represents a hit of a search, including its snippet if requested.
+
+      :param hit: whoosh hit.
+      :param snippets: if True, the result includes the snippet of the hit.
+      The results must have been configured with set_highlighter.
+
+      :rtype: dict
+    """
+    res = {
+        "url": hit["url"],
+        "title": hit["title"],
+        "score": hit.score
+    }
+    if snippets:
+        res["snippet"] = snippet(hit)
+    return res
+
+
+def search_top(path: str, indexname: str, word: str, limit: int,
+               snippets: bool = False, ranking: str = "bm25"):
+    """
+      Runs Multiindex.search_top over the multiindex located at path. It is
+      used by the worker processes, which keep their own multiindex and
+      refresh it whenever the server commits.
+
+      :rtype: tuple
+    """
+    index = Multiindex.shared(path, external_writers=True)
+    return index.search_top(indexname, word, limit, snippets, ranking)
+
+
+class DigestSet():
+    """
+      Set of the content hashes stored in an index, used to detect
+      duplicated documents without searching the index.
+
+      The digests are appended to a file placed next to the index, so they
+      are loaded at once instead of being rebuilt from the index each time
+      the server starts. In memory, only the first KEY_SIZE bytes of each
+      digest are kept, as integers in a sorted array searched by bisection,
+      which takes 8 bytes per document instead of the hundred bytes of a
+      set of digests. The digests added since the array was last built are
+      kept in a small set, merged into the array once it grows. Two pages
+      sharing the first 8 bytes of their MD5 are not told apart, which is
+      negligible for the amount of pages of a history.
+
+      The digests of deleted documents are discarded by rewriting the file,
+      which the readers of other processes then load again.
+    """
+
+    # Bytes of each digest kept in memory.
+    KEY_SIZE = 8
+
+    def __init__(self, path: str, digests=()):
+        """
+          :param path: file where the digests are persisted.
+          :param digests: hexadecimal digests used to rebuild the file
+          when it does not exist.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._keys = array("Q")
+        self._recent = set()
+        self._offset = 0
+        self._inode = None
+
+        if os.path.isfile(path):
+            self.refresh()
+        else:
+            self.add(digests)
+
+    @classmethod
+    def _key(cls, digest: bytes):
+        return int.from_bytes(digest[:cls.KEY_SIZE], "big")
+
+    def _has(self, key: int):
+        if key in self._recent:
+            return True
+        keys = self._keys
+        i = bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    def __contains__(self, digest: str):
+        try:
+            return self._has(self._key(bytes.fromhex(digest)))
+        except ValueError:
+            return False
+
+    def __len__(self):
+        return len(self._keys) + len(self._recent)
+
+    def refresh(self):
+        """Loads the digests appended to the file, e.g., by other process."""
+        with self._lock:
+            with open(self._path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._inode:
+                    # The file was rewritten: it is loaded again.
+                    self._keys = array("Q")
+                    self._recent = set()
+                    self._offset = 0
+                    self._inode = inode
+                f.seek(self._offset)
+                data = f.read()
+            data = data[:len(data) - len(data) % DIGEST_SIZE]
+            self._offset += len(data)
+            self._insert(self._key(data[i:i + DIGEST_SIZE])
+                         for i in range(0, len(data), DIGEST_SIZE))
+
+    def _insert(self, keys):
+        """
+          Adds keys to the set, merging the recent ones into the sorted
+          array once they are an eighth of it. Must be called holding
+          self._lock.
+        """
+        self._recent.update(key for key in keys if not self._has(key))
+        if len(self._recent) > max(1024, len(self._keys) // 8):
+            self._keys = array("Q", heapq.merge(self._keys,
+                                                sorted(self._recent)))
+            self._recent = set()
+
+    def add(self, digests):
+        """
+          Adds the digests to the set and appends them to the file.
+
+          :param digests: iterable of hexadecimal digests.
+        """
+        with self._lock:
+            new = {}
+            for digest in map(bytes.fromhex, digests):
+                key = self._key(digest)
+                if not self._has(key):
+                    new[key] = digest
+            self._insert(new)
+            with open(self._path, "ab") as f:
+                f.write(b"".join(new.values()))
+                if self._inode is None:
+                    self._inode = os.fstat(f.fileno()).st_ino
+            self._offset += DIGEST_SIZE * len(new)
+
+    def discard(self, digests):
+        """
+          Removes the digests from the set and rewrites the file without
+          them.
+
+          :param digests: iterable of hexadecimal digests.
+        """
+        discarded = set(map(bytes.fromhex, digests))
+        with self._lock:
+            with open(self._path, "rb") as f:
+                data = f.read()
+            kept = [data[i:i + DIGEST_SIZE]
+                    for i in range(0, len(data) - len(data) % DIGEST_SIZE,
+                                   DIGEST_SIZE)
+                    if data[i:i + DIGEST_SIZE] not in discarded]
+            tmp = f"{self._path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(b"".join(kept))
+            os.replace(tmp, self._path)
+            self._keys = array("Q", sorted(set(map(self._key, kept))))
+            self._recent = set()
+            self._offset = DIGEST_SIZE * len(kept)
+            self._inode = os.stat(self._path).st_ino
+
+
+class VisitTable():
+    """
+      Last visit, amount of visits and hash of the current content of each
+      url of an index, so a revisit of an unchanged page is recorded without
+      writing to the index, and a changed page replaces the former one.
+
+      The visits are kept in memory and appended to a file placed next to
+      the index as fixed-size records, the last one of each url winning, so
+      recording a visit costs a single small write. The file is compacted
+      when it is loaded by its writer, and the readers of other processes
+      load again a compacted file.
+    """
+
+    # url digest, content digest, time of the last visit, amount of visits.
+    RECORD = struct.Struct("<16s16sdI")
+
+    def __init__(self, path: str, compact: bool = True):
+        """
+          :param path: file where the visits are persisted.
+          :param compact: if False, the file is never rewritten, e.g., when
+          another process writes it.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        # {url digest: (content digest, last visited, visits)}
+        self._visits = {}
+        self._offset = 0
+        self._inode = None
+        self.refresh()
+
+        records = self._offset // self.RECORD.size
+        if compact and records > 2 * len(self._visits) + 1000:
+            with self._lock:
+                self._compact()
+
+    @staticmethod
+    def _key(url: str):
+        return hashlib.md5(url.encode("utf-8")).digest()
+
+    def __len__(self):
+        return len(self._visits)
+
+    @property
+    def version(self):
+        """Amount of bytes of the file loaded, which grows with each visit."""
+        return self._offset
+
+    def refresh(self):
+        """Loads the records appended to the file, e.g., by other process."""
+        if not os.path.isfile(self._path):
+            return
+        with self._lock:
+            with open(self._path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._inode:
+                    # The file was compacted: it is loaded again.
+                    self._visits = {}
+                    self._offset = 0
+                    self._inode = inode
+                f.seek(self._offset)
+                data = f.read()
+            size = len(data) - len(data) % self.RECORD.size
+            for key, digest, last, visits in \
+                    self.RECORD.iter_unpack(data[:size]):
+                self._visits[key] = (digest, last, visits)
+            self._offset += size
+
+    def _compact(self):
+        """
+          Rewrites the file with a single record for each url. Must be
+          called holding self._lock.
+        """
+        self._save(self._path)
+        self._offset = os.path.getsize(self._path)
+        self._inode = os.stat(self._path).st_ino
+
+    def forget(self, urls):
+        """
+          Removes the visits of the urls, e.g., of deleted documents, and
+          compacts the file without them.
+
+          :param urls: iterable of urls.
+        """
+        with self._lock:
+            for url in urls:
+                self._visits.pop(self._key(url), None)
+            self._compact()
+
+    def save(self, path: str):
+        """
+          Writes a single record for each url to another file, e.g., a
+          snapshot, replacing it atomically.
+
+          :param path: path of the file.
+        """
+        with self._lock:
+            self._save(path)
+
+    def _save(self, path: str):
+        """See save. Must be called holding self._lock."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(self.RECORD.pack(key, *value)
+                             for key, value in self._visits.items()))
+        os.replace(tmp, path)
+
+    def get(self, url: str):
+        """
+          Returns the tuple (content hash, last visited, visits) of the url,
+          or None if it was never visited.
+
+          :rtype: tuple
+        """
+        value = self._visits.get(self._key(url))
+        if value is None:
+            return None
+        digest, last, visits = value
+        return digest.hex(), last, visits
+
+    def visit(self, url: str, digest: str, when: float = None,
+              visits: int = None):
+        """
+          Records a visit to the url, whose content has the given hash.
+
+          :param url: page url.
+          :param digest: hexadecimal content hash of the page.
+          :param when: time of the visit. By default, now.
+          :param visits: amount of visits. By default, one more.
+
+          Returns the amount of visits.
+          :rtype: int
+        """
+        key = self._key(url)
+        with self._lock:
+            if visits is None:
+                _, _, visits = self._visits.get(key, (None, None, 0))
+                visits += 1
+            value = (bytes.fromhex(digest),
+                     time.time() if when is None else when, visits)
+            self._visits[key] = value
+            with open(self._path, "ab") as f:
+                f.write(self.RECORD.pack(key, *value))
+                if self._inode is None:
+                    self._inode = os.fstat(f.fileno()).st_ino
+            self._offset += self.RECORD.size
+        return visits
+
+
+class Multiindex():
+    """
+      Handles the index. Allows multiple indices in the same storage.
+      Supports creating indexes, adding documents, and searching for words.
+
+      The indices have only one schema allowed composed by an url, a title,
+      a content and the hash of the url and the content, where the content
+      is analyzed by the analyzer the index was created with (see
+      analysis). The content is stored compressed in the field
+      stored_content, and its postings keep the character offsets of each
+      term, so the snippets of the results are highlighted without
+      analyzing the content again. The hashes are also kept in memory, see
+      DigestSet, so duplicated documents are discarded without searching
+      the index.
+
+      The visits of each url are kept by a VisitTable: a revisit of an
+      unchanged page only updates its last visit and amount of visits,
+      while a page whose content changed replaces its former document,
+      which is found by the unique field url_id. The documents also store
+      the last visit and amount of visits they were indexed with.
+
+      Each index is opened once and kept open, together with a pool of
+      searchers that are reused among searches and refreshed only after
+      this multiindex commits a writer on that index.
+
+      Each index may be split into several shards, i.e., whoosh indexes
+      named f'{indexname}-{i}', assigning each document to a shard by its
+      hash. A search over several shards or indexes queries all of them in
+      parallel, using threads or processes, and merges their best results
+      by score.
+
+      The indexes named in ram_indexes are kept in memory, in a whoosh
+      RamStorage per shard, so their commits and searches never touch the
+      filesystem. Every snapshot_interval seconds a thread saves them as
+      regular indexes in the directory of the multiindex, writing only the
+      segments created since the previous snapshot, and they are loaded
+      from there when the multiindex is created. The pages committed after
+      the last snapshot are lost if the process dies.
+    """
+
+    @classmethod
+    def shared(cls, relative_path: str, **kwargs):
+        """
+          Returns the process-wide multiindex located at relative_path,
+          creating it the first time it is requested.
+
+          :param relative_path: a path to a directory.
+          :param kwargs: arguments used to create the multiindex the first
+          time it is requested.
+
+          :rtype: Multiindex
+        """
+        path = os.path.join(BASEPATH, relative_path)
+        with _REGISTRY_LOCK:
+            if path not in _REGISTRY:
+                _REGISTRY[path] = cls(relative_path, **kwargs)
+            return _REGISTRY[path]
+
+    def __init__(self, relative_path: str, cache: QueryCache = None,
+                 shards: int = 1, fanout: str = "thread", workers: int = None,
+                 external_writers: bool = False, merge_on_commit: bool = True,
+                 analyzer: str = "standard", limitmb: int = WRITER_LIMITMB,
+                 procs: int = 1, procs_min_docs: int = 1000,
+                 ram_indexes=(), snapshot_interval: float = SNAPSHOT_INTERVAL):
+        """
+          :param relative_path: a path to a directory. If the directory does
+          not exist, it is created.
+          :param cache: cache of the search results. If it is not given,
+          a cache with the default bounds is used.
+          :param shards: amount of shards of each index. Changing it does
+          not move the documents already stored among the shards.
+          :param fanout: either "thread" or "process", how the searches over
+          several shards are run in parallel.
+          :param workers: maximum amount of threads or processes used by the
+          searches over several shards. By default, the amount of CPUs.
+          :param external_writers: if True, the searchers are refreshed
+          whenever another process commits on the index, instead of only
+          after the commits of this multiindex.
+          :param merge_on_commit: if True, each commit merges the small
+          segments of the index as Whoosh does by default. Otherwise the
+          segments are only merged by merge, e.g., by a MergeScheduler.
+          :param analyzer: analyzer of the indexes created without naming
+          one, see analysis.ANALYZERS.
+          :param limitmb: megabytes of postings a commit keeps in memory.
+          Beyond them, the postings are sorted and written to temporary
+          files in the index directory, and merged from disk on commit.
+          It bounds the memory of the writer whatever the size of the
+          documents, at the cost of a slower commit.
+          :param procs: amount of processes indexing the batches of at
+          least procs_min_docs documents of a shard. Each process produces
+          its own segment and the limitmb budget is shared among them.
+          :param procs_min_docs: amount of documents of a batch from which
+          the processes are used, since starting them costs more than
+          indexing a small batch.
+          :param ram_indexes: names of the indexes kept in memory. They are
+          always written and searched by this process, so they do not
+          support external_writers, and they are indexed by a single
+          process.
+          :param snapshot_interval: seconds between the snapshots of the
+          indexes kept in memory. If None, they are only saved by snapshot
+          and close.
+        """
+        self._path = os.path.join(BASEPATH, relative_path)
+
+        if not os.path.isdir(self._path):
+            os.mkdir(self._path)
+
+        self._storage = FileStorage(self._path)
+        self._schema = Schema(
+            url=TEXT(stored=True),
+            title=TEXT(stored=True),
+            content=TEXT(chars=True),
+            hash=ID(stored=True, unique=True),
+            stored_content=STORED,
+            url_id=ID(unique=True),
+            last_visited=NUMERIC(float, stored=True),
+            visit_count=NUMERIC(stored=True)
+        )
+
+        self._lock = threading.Lock()
+        # {indexname: whoosh index}
+        self._indexes = {}
+        # {indexname: [(generation, searcher), ...]}
+        self._searchers = {}
+        # {indexname: amount of commits done by this multiindex}
+        self._generations = {}
+        # {indexname: DigestSet}
+        self._digests = {}
+        # {indexname: VisitTable}
+        self._visits = {}
+        # {indexname: pages stored without url_id}, see _legacy_pages.
+        self._legacy = {}
+        # Amount of visits recorded, which changes the recency ranking.
+        self._visits_version = 0
+        # {indexname: (schema, TermDictionary)}, built by the first
+        # suggestion. The lock is held while they are built and updated.
+        self._terms = {}
+        # {indexname: (generation, time.monotonic())} of each dictionary.
+        self._terms_built = {}
+        self._terms_lock = threading.Lock()
+
+        self.cache = cache if cache is not None else QueryCache()
+
+        if fanout not in ("thread", "process"):
+            raise ValueError(f"Unknown fanout {fanout}.")
+        self._shards = shards
+        self._fanout = fanout
+        self._workers = workers or os.cpu_count()
+        self._external_writers = external_writers
+        self._merge_on_commit = merge_on_commit
+        if analyzer not in ANALYZERS:
+            raise ValueError(f"Unknown analyzer {analyzer}.")
+        self._analyzer = analyzer
+        if limitmb < 1 or procs < 1:
+            raise ValueError("limitmb and procs must be positive.")
+        self._limitmb = limitmb
+        self._procs = procs
+        self._procs_min_docs = procs_min_docs
+        self._executor = None
+
+        if ram_indexes and external_writers:
+            raise ValueError(
+                "The indexes kept in memory are not shared among processes.")
+        self._ram_indexes = frozenset(ram_indexes)
+        # {shard: RamStorage} of the indexes kept in memory.
+        self._ram = {}
+        self._ram_lock = threading.Lock()
+        self.snapshots = 0
+        self.snapshot_seconds = 0.0
+        self.last_snapshot_seconds = None
+        self.snapshot_bytes = 0
+        for indexname in self._ram_indexes:
+            for shard in self.shards(indexname):
+                self._storage_of(shard)
+
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread = None
+        if self._ram_indexes and snapshot_interval is not None:
+            self._snapshot_thread = threading.Thread(
+                target=self._snapshot_loop, args=(snapshot_interval,),
+                name="Snapshot", daemon=True)
+            self._snapshot_thread.start()
+
+    def shards(self, indexname: str):
+        """
+          Returns the names of the whoosh indexes that hold the documents of
+          the index named indexname. If the multiindex is not sharded, it is
+          just the indexname.
+
+          :param indexname: name of the index.
+
+          :rtype: list
+        """
+        if self._shards == 1:
+            return [indexname]
+        return [f"{indexname}-{i}" for i in range(self._shards)]
+
+    def _shard_of(self, indexname: str, url: str, digest: str):
+        """
+          Returns the name of the shard of the index named indexname that
+          holds the page with the given url and hash. The pages are routed
+          by their url, so every version of a page lands on the same shard,
+          except for the pages already stored by the hash of their content,
+          as previous versions did, which keep their shard.
+
+          :param indexname: name of the index.
+          :param url: page url.
+          :param digest: hexadecimal MD5 of the url and the content.
+
+          :rtype: str
+        """
+        shards = self.shards(indexname)
+        if len(shards) == 1:
+            return shards[0]
+        for shard in shards:
+            if self._storage_of(shard).index_exists(shard) and (
+                    digest in self._digest_set(shard) or
+                    self._visit_table(shard).get(url) is not None or
+                    url in self._legacy_pages(shard)):
+                return shard
+        key = hashlib.md5(url.encode("utf-8")).digest()
+        return shards[int.from_bytes(key[:4], "big") % len(shards)]
+
+    def close(self):
+        """
+          Stops the workers of the searches and closes every index. The
+          indexes kept in memory are saved to disk first.
+        """
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+        if self._ram:
+            self.snapshot()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._forget()
+
+    def _is_ram(self, name: str):
+        """
+          Checks whether the whoosh index named name, an index or one of its
+          shards, is kept in memory.
+
+          :rtype: bool
+        """
+        if self._shards > 1:
+            name = name.rsplit("-", 1)[0]
+        return name in self._ram_indexes
+
+    def _storage_of(self, name: str):
+        """
+          Returns the whoosh storage of the index or shard named name: its
+          RamStorage if it is kept in memory, loaded from its last snapshot
+          the first time it is requested, otherwise the storage of the
+          directory of the multiindex.
+
+          :param name: name of the index or, if it is sharded, of one of its
+          shards.
+        """
+        if not self._is_ram(name):
+            return self._storage
+        with self._ram_lock:
+            storage = self._ram.get(name)
+            if storage is None:
+                storage = self._ram[name] = self._load_snapshot(name)
+            return storage
+
+    def _load_snapshot(self, name: str):
+        """
+          Loads the last snapshot of the shard named name into a new
+          RamStorage. The digests and visits persisted next to it may be
+          ahead of the snapshot, so the digests are read again from the
+          index and the visits are replaced by the ones of the snapshot.
+
+          :param name: name of the index or of one of its shards.
+
+          :rtype: RamStorage
+        """
+        storage = RamStorage()
+        exists = self._storage.index_exists(name)
+        if exists:
+            toc = TOC.read(self._storage, name)
+            files = set(seg.segment_id() for seg in toc.segments)
+            for file in self._storage.list():
+                if file.split(".", 1)[0] in files:
+                    copy_file(self._storage, storage, file)
+            copy_file(self._storage, storage,
+                      TOC._filename(name, toc.generation))
+
+        visits = self._visits_path(name)
+        snapshot = f"{visits}.snapshot"
+        if os.path.isfile(snapshot):
+            shutil.copyfile(snapshot, visits)
+        elif not exists and os.path.isfile(visits):
+            os.remove(visits)
+        if os.path.isfile(self._digests_path(name)):
+            os.remove(self._digests_path(name))
+        return storage
+
+    def snapshot(self, indexname: str = None):
+        """
+          Saves the indexes kept in memory to the directory of the
+          multiindex, together with their visits. Only the segments created
+          since the previous snapshot are written, and the former ones are
+          deleted once the new snapshot is complete.
+
+          :param indexname: name of the index to save. By default, every
+          index kept in memory.
+
+          Returns the amount of bytes written.
+          :rtype: int
+        """
+        with self._ram_lock:
+            shards = [shard for shard in self._ram if indexname is None or
+                      shard in self.shards(indexname)]
+        if not shards:
+            return 0
+
+        start = time.perf_counter()
+        size = 0
+        for shard in shards:
+            try:
+                size += self._snapshot(shard)
+            except Exception:
+                logger.exception("Could not save a snapshot of %s", shard)
+        seconds = time.perf_counter() - start
+        SNAPSHOT_SECONDS.observe(seconds)
+        self.snapshots += 1
+        self.snapshot_seconds += seconds
+        self.last_snapshot_seconds = seconds
+        self.snapshot_bytes += size
+        return size
+
+    def _snapshot(self, shard: str):
+        """See snapshot. Saves a single shard."""
+        storage = self._ram.get(shard)
+        if storage is None or not storage.index_exists(shard):
+            return 0
+        # Since the visits are recorded after each commit, the ones saved
+        # first never refer to pages missing from the index saved next.
+        self._visit_table(shard).save(f"{self._visits_path(shard)}.snapshot")
+
+        # The files of a generation are never modified, so they may be
+        # copied while the writer commits, but it may delete them: the copy
+        # starts again from the new generation.
+        while True:
+            toc = TOC.read(storage, shard)
+            tocname = TOC._filename(shard, toc.generation)
+            if self._storage.file_exists(tocname):
+                return 0
+            files = set(seg.segment_id() for seg in toc.segments)
+            try:
+                size = sum(copy_file(storage, self._storage, file)
+                           for file in storage.list()
+                           if file.split(".", 1)[0] in files and
+                           not self._storage.file_exists(file))
+                size += copy_file(storage, self._storage, tocname)
+            except NameError:
+                continue
+            break
+        clean_files(self._storage, shard, toc.generation, toc.segments)
+        return size
+
+    def snapshot_stats(self):
+        """
+          Returns a dictionary
+          {indexes: indexes, count: count, seconds: seconds,
+           last_seconds: last_seconds, bytes: bytes}
+          with the names of the indexes kept in memory and the counters of
+          their snapshots.
+          :rtype: dict
+        """
+        return {
+            "indexes": sorted(self._ram_indexes),
+            "count": self.snapshots,
+            "seconds": self.snapshot_seconds,
+            "last_seconds": self.last_snapshot_seconds,
+            "bytes": self.snapshot_bytes
+        }
+
+    def _snapshot_loop(self, interval: float):
+        """Saves the indexes kept in memory every interval seconds."""
+        while not self._snapshot_stop.wait(interval):
+            self.snapshot()
+
+    def available(self, indexname=None):
+        """
+          Checks for the multiindex availability. If an indexname is
+          given, then it also check for the particular index
+          availability
+
+          :param indexname: name of the index from which you want
+          to check availability.
+
+          :rtype: bool
+        """
+        ret = self._path is not None and \
+            self._storage is not None and \
+            self._schema is not None
+
+        if indexname is not None:
+            return ret and all(
+                name in self._indexes or
+                self._storage_of(name).index_exists(name)
+                for name in self.shards(indexname))
+
+        return ret
+
+    def createIx(self, indexname: str, ovewrite: bool = False,
+                 analyzer: str = None):
+        """
+          Creates an index in the storage path.
+
+          :param indexname: name of the index to create or replace.
+          :param ovewrite: indicates if the index must be overwritten.
+          :param analyzer: analyzer of the content of the index, see
+          analysis.ANALYZERS. By default, the one of the multiindex.
+
+          Returns True if the index was created, otherwise False.
+          :rtype: bool
+        """
+        if not ovewrite and self.available(indexname):
+            return False
+
+        schema = self._schema_for(analyzer or self._analyzer)
+        self._terms.pop(indexname, None)
+        for name in self.shards(indexname):
+            if not ovewrite and self._storage_of(name).index_exists(name):
+                continue
+
+            self._forget(name)
+            try:
+                if not os.path.isdir(self._path):
+                    os.mkdir(self._path)
+                # The snapshot of an index kept in memory is replaced too.
+                create_in(self._path, schema, indexname=name)
+                if self._is_ram(name):
+                    self._storage_of(name).create_index(
+                        schema, indexname=name)
+                for path in (self._digests_path(name),
+                             self._visits_path(name),
+                             f"{self._visits_path(name)}.snapshot"):
+                    if os.path.isfile(path):
+                        os.remove(path)
+            except Exception:
+                logger.exception("Could not create the index %s", name)
+                return False
+        return True
+
+    def _schema_for(self, analyzer: str):
+        """
+          Returns the schema of the indexes created with the analyzer named
+          analyzer.
+
+          :rtype: whoosh.fields.Schema
+        """
+        if analyzer not in ANALYZERS:
+            raise ValueError(f"Unknown analyzer {analyzer}.")
+        schema = self._schema.copy()
+        schema.remove("content")
+        for name, field in content_fields(analyzer).items():
+            schema.add(name, field)
+        return schema
+
+    def _open(self, indexname: str):
+        """
+          Returns the open index named indexname, opening it only the
+          first time it is requested.
+
+          :param indexname: name of the index.
+        """
+        with self._lock:
+            index = self._indexes.get(indexname)
+            if index is None:
+                index = self._storage_of(indexname).open_index(indexname)
+                self._upgrade(index)
+                self._indexes[indexname] = index
+            return index
+
+    def _upgrade(self, index):
+        """
+          Adds to the index the fields of the schema it lacks, so indexes
+          created by previous versions accept the new documents. With
+          external writers it is left to the process writing the index.
+
+          :param index: an open index.
+        """
+        if self._external_writers:
+            return
+        missing = [name for name in self._schema.names()
+                   if name not in index.schema]
+        if not missing:
+            return
+
+        writer = index.writer()
+        for name in missing:
+            writer.add_field(name, self._schema[name])
+        writer.commit()
+
+    def _digests_path(self, indexname: str):
+        """Returns the path of the file holding the digests of indexname."""
+        return os.path.join(self._path, f"_{indexname}.hashes")
+
+    def _digest_set(self, indexname: str):
+        """
+          Returns the digests of the documents stored in the index named
+          indexname, loading them the first time they are requested. If
+          they were never persisted, they are read from the index.
+
+          :param indexname: name of the index.
+
+          :rtype: DigestSet
+        """
+        with self._lock:
+            digests = self._digests.get(indexname)
+        if digests is not None:
+            return digests
+
+        path = self._digests_path(indexname)
+        stored = []
+        if not os.path.isfile(path):
+            with self.searcher(indexname) as searcher:
+                stored = list(searcher.reader().field_terms("hash"))
+
+        with self._lock:
+            if indexname not in self._digests:
+                self._digests[indexname] = DigestSet(path, stored)
+            return self._digests[indexname]
+
+    def _visits_path(self, indexname: str):
+        """Returns the path of the file holding the visits of indexname."""
+        return os.path.join(self._path, f"_{indexname}.visits")
+
+    def _visit_table(self, indexname: str):
+        """
+          Returns the visits of the urls of the index named indexname,
+          loading them the first time they are requested.
+
+          :param indexname: name of the index or of one of its shards.
+
+          :rtype: VisitTable
+        """
+        with self._lock:
+            visits = self._visits.get(indexname)
+            if visits is None:
+                visits = VisitTable(self._visits_path(indexname),
+                                    compact=not self._external_writers)
+                self._visits[indexname] = visits
+        return visits
+
+    def _legacy_pages(self, indexname: str):
+        """
+          Returns the pages of the index named indexname stored by previous
+          versions, without url_id, so a new version of one of them can
+          replace it. They are read from the index the first time they are
+          requested, unless every document may have its url_id.
+
+          :param indexname: name of the index or of one of its shards.
+
+          Returns a dictionary {url: (hash, last_visited, visit_count)}.
+          :rtype: dict
+        """
+        with self._lock:
+            pages = self._legacy.get(indexname)
+        if pages is not None:
+            return pages
+
+        pages = {}
+        with self.searcher(indexname) as searcher:
+            reader = searcher.reader()
+            url_ids = set(reader.field_terms("url_id")) \
+                if "url_id" in reader.schema else set()
+            # Each live document with its url_id adds at most one term, the
+            # deleted ones being those replaced or expired.
+            if len(url_ids) < reader.doc_count():
+                for _, fields in reader.iter_docs():
+                    if fields["url"] not in url_ids and fields.get("hash"):
+                        pages[fields["url"]] = (
+                            fields["hash"], fields.get("last_visited"),
+                            fields.get("visit_count") or 0)
+
+        with self._lock:
+            return self._legacy.setdefault(indexname, pages)
+
+    def visit(self, indexname: str, url: str, digest: str,
+              when: float = None):
+        """
+          Records a visit to a page if the index named indexname already
+          holds its current content, without writing to the index.
 
-class Multiindex():
-    """
-      Handles the index. Allows multiple indices in the same storage.
-      Supports creating indexes, adding documents, and searching for words.
+          :param indexname: name of the index.
+          :param url: page url.
+          :param digest: hexadecimal MD5 of the url and the content.
+          :param when: time of the visit. By default, now.
 
-      The indices have only one schema allowed composed by an url, a title
-      and a content. The content is not stored.
-    """
+          Returns True if the visit was recorded, or False if the page must
+          be added, since it is new or its content changed.
+          :rtype: bool
+        """
+        if not self.available(indexname) or not is_digest(digest):
+            return False
+        digest = digest.lower()
+        shard = self._shard_of(indexname, url, digest)
+        visits = self._visit_table(shard)
+        current = visits.get(url)
+        if current is not None and current[0] != digest:
+            return False
+        if current is None and digest not in self._digest_set(shard):
+            return False
+        visits.visit(url, digest, when)
+        self._visits_version += 1
+        return True
 
-    def __init__(self, relative_path: str):
+    def visit_many(self, indexname: str, urls: list, digests: list,
+                   when: float = None):
         """
-          :param relative_path: a path to a directory. If the directory does
-          not exist, it is created.
+          Records the visits to several pages, see visit.
+
+          :param indexname: name of the index.
+          :param urls: list of page urls.
+          :param digests: list of the hexadecimal MD5 of the url and the
+          content of each page.
+          :param when: time of the visits. By default, now.
+
+          Returns a bool for each page, as visit.
+          :rtype: list
         """
-        self._path = os.path.join(BASEPATH, relative_path)
+        return [self.visit(indexname, url, digest, when)
+                for url, digest in zip(urls, digests)]
 
-        if not os.path.isdir(self._path):
-            os.mkdir(self._path)
+    def visits_version(self):
+        """
+          Returns the amount of visits recorded by this multiindex, which
+          changes the order of the recency ranking without changing the
+          generation of the indexes. With external writers, the visits are
+          loaded first and it is the size of the visits loaded.
 
-        self._storage = FileStorage(self._path)
-        self._schema = Schema(
-            url=TEXT(stored=True),
-            title=TEXT(stored=True),
-            content=TEXT
-        )
+          :rtype: int
+        """
+        if not self._external_writers:
+            return self._visits_version
+        with self._lock:
+            tables = list(self._visits.values())
+        for visits in tables:
+            visits.refresh()
+        return sum(visits.version for visits in tables)
 
-    def available(self, indexname=None):
+    def contains(self, indexname: str, digest: str):
         """
-          Checks for the multiindex availability. If an indexname is
-          given, then it also check for the particular index
-          availability
+          Checks whether the index named indexname holds a document with the
+          given content hash, without searching the index.
 
-          :param indexname: name of the index from which you want
-          to check availability.
+          :param indexname: name of the index.
+          :param digest: hexadecimal MD5 of the url and the content.
 
           :rtype: bool
         """
-        ret = self._path is not None and \
-            self._storage is not None and \
-            self._schema is not None
+        return self.contains_many(indexname, [digest])[0]
 
-        if indexname is not None:
-            return ret and self._storage.index_exists(indexname)
+    def contains_many(self, indexname: str, digests: list):
+        """
+          Checks which content hashes the index named indexname holds, from
+          the digests kept in memory, without searching the index. With
+          external writers, the digests they added are loaded first.
 
-        return ret
+          :param indexname: name of the index.
+          :param digests: list of hexadecimal MD5 of the url and the content.
 
-    def createIx(self, indexname: str, ovewrite: bool = False):
+          Returns a list with a bool for each digest.
+          :rtype: list
         """
-          Creates an index in the storage path.
+        if not self.available(indexname):
+            return [False] * len(digests)
+        sets = [self._digest_set(shard) for shard in self.shards(indexname)]
+        if self._external_writers:
+            for digest_set in sets:
+                digest_set.refresh()
+        return [is_digest(digest) and
+                any(digest in digest_set for digest_set in sets)
+                for digest in digests]
 
-          :param indexname: name of the index to create or replace.
-          :param ovewrite: indicates if the index must be overwritten.
+    def _forget(self, indexname: str = None):
+        """
+          Closes the index named indexname and its searchers, so they are
+          reopened the next time they are needed. If no indexname is given,
+          it forgets every index.
 
-          Returns True if the index was created, otherwise False.
-          :rtype: bool
+          :param indexname: name of the index.
         """
-        if not ovewrite and self._storage.index_exists(indexname):
-            return False
+        with self._lock:
+            names = list(self._indexes) if indexname is None else [indexname]
+            for name in names:
+                for _, searcher in self._searchers.pop(name, []):
+                    searcher.close()
+                self._generations.pop(name, None)
+                self._digests.pop(name, None)
+                self._visits.pop(name, None)
+                self._legacy.pop(name, None)
+                index = self._indexes.pop(name, None)
+                if index is not None:
+                    index.close()
+            if indexname is None:
+                self._terms.clear()
+        # The generations of a recreated index start again, so the cached
+        # searches over several indexes could be mistaken for current ones.
+        self.cache.invalidate()
+
+    def _committed(self, indexname: str):
+        """
+          Records that a writer was committed on the index named indexname,
+          so the pooled searchers are refreshed before being reused.
+
+          :param indexname: name of the index.
+        """
+        with self._lock:
+            self._generations[indexname] = \
+                self._generations.get(indexname, 0) + 1
+
+    def generation(self, indexname):
+        """
+          Returns the generation of the index named indexname seen by its
+          searchers, which Whoosh increases on each commit. If the index is
+          sharded or several indexes are given, it is the sum of the
+          generations of all of them, which increases as well whenever any
+          of them changes. It returns -1 if no index exists.
+
+          :param indexname: name of the index, or list of names.
+
+          :rtype: int
+        """
+        names = [indexname] if isinstance(indexname, str) else indexname
+        generation = -1
+        for name in names:
+            if not self.available(name):
+                continue
+            for shard in self.shards(name):
+                with self.searcher(shard) as searcher:
+                    generation += searcher.reader().generation() + 1
+        return generation
+
+    @contextmanager
+    def searcher(self, indexname: str):
+        """
+          Lends a searcher over the index named indexname. The searcher is
+          taken from the pool of the index, and it is refreshed only if a
+          writer was committed since it was last used.
+
+          :param indexname: name of the index or, if it is sharded, of one
+          of its shards.
+        """
+        index = self._open(indexname)
+        with self._lock:
+            generation = self._generations.get(indexname, 0)
+            pool = self._searchers.get(indexname)
+            if pool:
+                searcher_generation, searcher = pool.pop()
+            else:
+                searcher_generation, searcher = generation, None
+
+        if searcher is None:
+            searcher = index.searcher()
+        elif searcher_generation != generation or self._external_writers:
+            searcher = searcher.refresh()
 
         try:
-            create_in(self._path, self._schema, indexname=indexname)
-        except Exception as e:
-            print(e)
-            return False
-        return True
+            yield searcher
+        finally:
+            with self._lock:
+                pool = self._searchers.setdefault(indexname, [])
+                if self._indexes.get(indexname) is index and \
+                        len(pool) < SEARCHER_POOL_SIZE:
+                    pool.append((generation, searcher))
+                    searcher = None
+            if searcher is not None:
+                searcher.close()
 
-    def add_document(self, indexname: str, url: str, title: str, content: str):
+    def add_document(self, indexname: str, url: str, title: str, content: str,
+                     hash: str = None):
         """
           Adds a document to the index named indexname located at the storage
           path.
@@ -90,51 +1448,316 @@ class Multiindex():
           :param url: page url.
           :param title: page title.
           :param content: text to search from.
+          :param hash: MD5 of the url and the content. If it is not given,
+          it is computed with content_hash.
 
           Returns True if the document already exists or if
           it was added to the index, otherwise False.
           :rtype: bool
         """
-        exists = self._storage.index_exists(indexname)
+        return self.add_documents(indexname, [{
+            "url": url,
+            "title": title,
+            "content": content,
+            "hash": hash
+        }])
+
+    def add_documents(self, indexname: str, documents: list):
+        """
+          Adds several documents to the index named indexname located at the
+          storage path. Every new document is written by the same writer and
+          committed at once, so the whole batch ends up in a single segment.
 
-        if not exists:
+          :param indexname: name of the index.
+          :param documents: list of dictionaries, each one containing an url,
+          a title, a content and, optionally, their hash.
+
+          A document already exists if the index holds a document with the
+          same hash, so a page whose content changed is stored again.
+
+          Returns True if every document already exists or if
+          they were added to the index, otherwise False.
+          :rtype: bool
+        """
+        if not self.available(indexname):
             created = self.createIx(indexname)
             if not created:
                 return False
 
-        else:
-            # Checks for the existence of the url in the index
-            try:
-                index = self._storage.open_index(indexname)
-                with index.searcher() as searcher:
-                    query = QueryParser("url", index.schema).parse(url)
-                    results = searcher.search(query, limit=1)
-                    if len(results) > 0:
-                        return True
-            except Exception as e:
-                print(e)
-                return False
+        return all([self._add_to_shard(indexname, shard, batch)
+                    for shard, batch
+                    in self._split(indexname, documents).items()])
 
-            finally:
-                index.close()
+    def _split(self, indexname: str, documents: list):
+        """
+          Discards the documents repeated within the batch, and splits the
+          rest among the shards of the index named indexname.
+
+          Returns a dictionary with the list of tuples (hash, document) of
+          each shard.
+          :rtype: dict
+        """
+        seen = set()
+        batches = {}
+        for doc in documents:
+            digest = doc.get("hash")
+            if is_digest(digest):
+                digest = digest.lower()
+            else:
+                digest = content_hash(doc["url"], doc["content"])
+            if digest in seen:
+                continue
+            seen.add(digest)
+            shard = self._shard_of(indexname, doc["url"], digest)
+            batches.setdefault(shard, []).append((digest, doc))
+        return batches
+
+    def _writer_args(self, amount: int, procs: int = None,
+                     limitmb: int = None):
+        """
+          Returns the arguments of the whoosh writer of a batch.
+
+          :param amount: amount of documents of the batch.
+          :param procs: amount of processes. By default, the one of the
+          multiindex.
+          :param limitmb: megabytes of postings kept in memory by the
+          writer, shared among its processes. By default, the one of the
+          multiindex.
+
+          :rtype: dict
+        """
+        procs = self._procs if procs is None else procs
+        limitmb = self._limitmb if limitmb is None else limitmb
+        if procs > 1 and amount >= self._procs_min_docs:
+            return {"procs": procs, "multisegment": True,
+                    "limitmb": max(1, limitmb // procs)}
+        return {"limitmb": limitmb}
+
+    def _add_to_shard(self, indexname: str, shard: str, documents: list,
+                      procs: int = None, limitmb: int = None):
+        """
+          Adds the documents to a shard of the index named indexname with a
+          single commit, and adds their terms to the term dictionary of the
+          index, if it was built.
+
+          A document whose hash is already stored is discarded, since it is
+          a resubmission, e.g., a retry or a replay of the write-ahead log,
+          and not a visit: these are recorded when the request arrives (see
+          visit). A page whose content changed since its last visit
+          replaces its former document, which keeps counting its visits, as
+          does a page stored without url_id by previous versions (see
+          _legacy_pages). A document may carry its last_visited time and its
+          visit_count, e.g., when it is imported, which are recorded even if
+          it is discarded. As the terms of the replaced documents can not be
+          removed from the term dictionary, it is built again after such a
+          commit.
 
+          :param indexname: name of the index.
+          :param shard: name of the shard, see shards.
+          :param documents: list of tuples (hash, document).
+          :param procs: amount of processes of the writer, see _writer_args.
+          :param limitmb: memory limit of the writer, see _writer_args.
+
+          Returns True if the documents were added, otherwise False.
+          :rtype: bool
+        """
+        writer = None
+        if self._is_ram(shard):
+            # The processes of a writer do not share the memory storage.
+            procs = 1
         try:
-            index = self._storage.open_index(indexname)
-            writer = index.writer()
-            writer.add_document(url=url, title=title, content=content)
-            writer.commit()
+            index = self._open(shard)
+            digests = self._digest_set(shard)
+            visits = self._visit_table(shard)
+            legacy = self._legacy_pages(shard)
 
-        except Exception as e:
-            if writer:
+            # The last version of each page within the batch wins.
+            pages = {doc["url"]: (digest, doc) for digest, doc in documents}
+            revisits = []
+            new_documents = []
+            for url, (digest, doc) in pages.items():
+                current = visits.get(url) or legacy.get(url)
+                if current is None and digest in digests or \
+                        current is not None and current[0] == digest:
+                    revisits.append((digest, doc))
+                else:
+                    new_documents.append((digest, doc, current))
+
+            imported = [(digest, doc) for digest, doc in revisits
+                        if doc.get("last_visited") is not None or
+                        doc.get("visit_count") is not None]
+            if imported:
+                for digest, doc in imported:
+                    visits.visit(doc["url"], digest, doc.get("last_visited"),
+                                 doc.get("visit_count"))
+                self._visits_version += 1
+            if not new_documents:
+                return True
+
+            now = time.time()
+            writer = index.writer(**self._writer_args(
+                len(new_documents), procs, limitmb))
+            schema = writer.schema
+            terms = []
+            recorded = []
+            replaced = any(current is not None
+                           for _, _, current in new_documents)
+            for digest, doc, current in new_documents:
+                last_visited = doc.get("last_visited") or now
+                visit_count = doc.get("visit_count") or \
+                    (current[2] + 1 if current is not None else 1)
+                fields = content_document(schema, doc["content"])
+                # Only a page visited before may have a former document.
+                add = writer.add_document if current is None \
+                    else writer.update_document
+                if doc["url"] in legacy:
+                    writer.delete_by_term("hash", legacy[doc["url"]][0])
+                add(
+                    url=doc["url"],
+                    url_id=doc["url"],
+                    title=doc["title"],
+                    hash=digest,
+                    stored_content=compress(doc["content"]),
+                    last_visited=last_visited,
+                    visit_count=visit_count,
+                    **fields
+                )
+                recorded.append((doc["url"], digest, last_visited,
+                                 visit_count))
+                if indexname in self._terms and not replaced:
+                    terms.append(content_terms(schema, fields))
+            WRITER_SPILLS.inc(len(writer.pool.runs))
+
+            with self._terms_lock:
+                start = time.perf_counter()
+                writer.commit(merge=self._merge_on_commit)
+                COMMIT_SECONDS.observe(time.perf_counter() - start)
+                self._committed(shard)
+                digests.add(digest for digest, _, _ in new_documents)
+                for visit in recorded:
+                    visits.visit(*visit)
+                    legacy.pop(visit[0], None)
+                self._visits_version += 1
+
+                # A dictionary is built holding the lock, so it does not
+                # include the documents of this commit, even if it was built
+                # after they were analyzed.
+                if replaced:
+                    self._terms.pop(indexname, None)
+                    self._terms_built.pop(indexname, None)
+                elif indexname in self._terms:
+                    schema, dictionary = self._terms[indexname]
+                    if len(terms) < len(new_documents):
+                        terms = [content_terms(schema, content_document(
+                            schema, doc["content"]))
+                            for _, doc, _ in new_documents]
+                    for document_terms in terms:
+                        dictionary.add(document_terms)
+
+        except Exception:
+            if writer is not None:
                 writer.cancel()
-            print(e)
+            logger.exception("Could not add documents to %s", shard)
             return False
 
-        finally:
-            index.close()
-
         return True
 
+    def export_documents(self, indexname: str):
+        """
+          Iterates over the documents stored in every shard of the index
+          named indexname, reading them one at a time, so the whole index
+          is never loaded in memory.
+
+          :param indexname: name of the index.
+
+          Yields a dictionary
+          {url: url, title: title, content: content, hash: hash,
+          last_visited: last_visited, visit_count: visit_count}
+          for each document, as accepted by add_documents. The content is
+          None for the documents stored before the content was kept in the
+          index, and the visits are None if they were never recorded.
+          :rtype: generator
+        """
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+            visits = self._visit_table(shard)
+            with self.searcher(shard) as searcher:
+                for _, fields in searcher.reader().iter_docs():
+                    stored = fields.get("stored_content")
+                    last_visited = fields.get("last_visited")
+                    visit_count = fields.get("visit_count")
+                    visit = visits.get(fields["url"])
+                    if visit is not None and visit[0] == fields.get("hash"):
+                        _, last_visited, visit_count = visit
+                    yield {
+                        "url": fields["url"],
+                        "title": fields["title"],
+                        "content": decompress(stored) if stored else None,
+                        "hash": fields.get("hash"),
+                        "last_visited": last_visited,
+                        "visit_count": visit_count
+                    }
+
+    def import_documents(self, indexname: str, documents,
+                         batch: int = 10000, procs: int = None,
+                         limitmb: int = None):
+        """
+          Adds the documents of an iterable, e.g., a generator reading a
+          dump, to the index named indexname. The documents are read and
+          committed in batches, so the memory used depends on the batch
+          and not on the amount of documents. With procs > 1 each batch is
+          indexed by several processes, whose segments are not merged on
+          commit (see _writer_args).
+
+          :param indexname: name of the index.
+          :param documents: iterable of dictionaries as accepted by
+          add_documents. Documents without content are skipped.
+          :param batch: amount of documents of each commit.
+          :param procs: amount of processes indexing each batch. By
+          default, the one of the multiindex.
+          :param limitmb: megabytes of postings kept in memory by the writer
+          of each batch, shared among its processes. By default, the one of
+          the multiindex.
+
+          Returns the amount of documents read and of skipped documents.
+          :rtype: tuple
+        """
+        read = skipped = 0
+        pending = []
+        for doc in documents:
+            read += 1
+            if not doc.get("content"):
+                skipped += 1
+                continue
+            pending.append(doc)
+            if len(pending) >= batch:
+                if not self._import_batch(indexname, pending, procs,
+                                          limitmb):
+                    raise RuntimeError(f"Could not import into {indexname}.")
+                pending = []
+        if pending and not self._import_batch(indexname, pending, procs,
+                                              limitmb):
+            raise RuntimeError(f"Could not import into {indexname}.")
+        return read, skipped
+
+    def _import_batch(self, indexname: str, documents: list, procs: int,
+                      limitmb: int):
+        """
+          Adds a batch of documents like add_documents does, with the given
+          amount of processes and memory limit.
+
+          Returns True if the documents were added, otherwise False.
+          :rtype: bool
+        """
+        if not self.available(indexname) and not self.createIx(indexname):
+            return False
+
+        return all([self._add_to_shard(indexname, shard, batch, procs,
+                                       limitmb)
+                    for shard, batch
+                    in self._split(indexname, documents).items()])
+
     def search_word(self, indexname: str, word: str):
         """
           Searches for the word whithin the documents stored in the index
@@ -149,27 +1772,652 @@ class Multiindex():
           Otherwise it returns an empty list.
           :rtype: list
         """
-        exists = self._storage.index_exists(indexname)
+        if not self.available(indexname):
+            return []
+
+        try:
+            hits = []
+            for shard in self.shards(indexname):
+                with self.searcher(shard) as searcher:
+                    query = query_parser(searcher.schema).parse(word)
+                    results = searcher.search(query, limit=None)
+                    hits.extend((res.score, {
+                        "url": res["url"],
+                        "title": res["title"]
+                    }) for res in results)
+            hits.sort(key=lambda hit: -hit[0])
+            return [res for _, res in hits]
 
-        if not exists:
+        except Exception:
+            logger.exception("Could not search %s", indexname)
             return []
 
+    def search_page(self, indexname, word: str, page: int = 1,
+                    pagesize: int = 20, snippets: bool = False,
+                    ranking: str = "bm25"):
+        """
+          Searches for the word whithin the documents stored in the index
+          named indexname, retrieving only one page of results, so the
+          memory used does not depend on the amount of matching documents.
+
+          If the index is sharded, or if several indexes are given, all the
+          shards are searched in parallel and their results are merged by
+          score. Since each shard scores its documents with its own
+          statistics, the merged order is an approximation.
+
+          :param indexname: name of the index, or list of names.
+          :param word: sentence to search.
+          :param page: number of the page to retrieve, starting at 1.
+          :param pagesize: maximum amount of results per page.
+          :param snippets: if True, each result also includes the fragments
+          of its content that match the word, highlighted with <b> tags.
+          :param ranking: one of RANKINGS. "bm25" orders the results by
+          their BM25 score, while "recency" re-orders the best
+          RERANK_CANDIDATES of them by blended_score, favouring the pages
+          visited recently and often.
+
+          Returns a dictionary
+          {total: total, page: page, pagesize: pagesize, results: results}
+          where results is the list of diccionaries
+          {title: title, url: url, score: score[, snippet: snippet]}
+          of the page and total is the amount of documents containing the
+          word. If the page is beyond the last one, results is empty.
+
+          The results are cached until the index changes, so the returned
+          dictionary must not be modified.
+          :rtype: dict
+        """
+        names = [indexname] if isinstance(indexname, str) else indexname
+        ret = {"total": 0, "page": page, "pagesize": pagesize, "results": []}
+
+        shards = [shard for name in names if self.available(name)
+                  for shard in self.shards(name)]
+        if not shards:
+            return ret
+
         try:
-            index = self._storage.open_index(indexname)
-            with index.searcher() as searcher:
-                query = QueryParser("content", index.schema).parse(word)
-                results = searcher.search(query, limit=None)
-                return [{
-                    "url": res["url"],
-                    "title": res["title"]
-                } for res in results]
-
-        except Exception as e:
-            print(e)
+            cachename = ",".join(names)
+            generation = self.generation(names)
+            key = ("search_page", " ".join(word.split()), page, pagesize,
+                   snippets, ranking)
+            if ranking == "recency":
+                # The visits change the order without changing the index.
+                key += (self.visits_version(),)
+            cached = self.cache.get(cachename, generation, key)
+            if cached is not None:
+                return cached
+
+            if len(shards) == 1:
+                ret = self._search_shard_page(
+                    shards[0], word, page, pagesize, snippets, ranking)
+            else:
+                ret = self._search_shards_page(
+                    shards, word, page, pagesize, snippets, ranking)
+
+            # Rough size of the result in memory.
+            size = 200 + sum(100 + sum(len(v) for v in res.values()
+                                       if isinstance(v, str))
+                             for res in ret["results"])
+            self.cache.put(cachename, generation, key, ret, size)
+            return ret
+
+        except Exception:
+            logger.exception("Could not search %s", ",".join(names))
+            return ret
+
+    def _search_shard_page(self, indexname: str, word: str, page: int,
+                           pagesize: int, snippets: bool,
+                           ranking: str = "bm25"):
+        """
+          Searches for a page of results within a single whoosh index. See
+          search_page.
+
+          :rtype: dict
+        """
+        ret = {"total": 0, "page": page, "pagesize": pagesize, "results": []}
+        if ranking == "recency":
+            offset = (page - 1) * pagesize
+            ret["total"], hits = self.search_top(
+                indexname, word, page * pagesize, snippets, ranking)
+            ret["results"] = hits[offset:]
+            return ret
+
+        with self.searcher(indexname) as searcher:
+            query = query_parser(searcher.schema).parse(word)
+            results = searcher.search_page(
+                query, page, pagelen=pagesize, terms=snippets)
+            ret["total"] = results.total
+
+            if page <= results.pagecount:
+                if snippets:
+                    set_highlighter(results.results, searcher.schema)
+                ret["results"] = [hit_result(hit, snippets)
+                                  for hit in results]
+        return ret
+
+    def _search_shards_page(self, shards: list, word: str, page: int,
+                            pagesize: int, snippets: bool,
+                            ranking: str = "bm25"):
+        """
+          Searches for a page of results within several whoosh indexes in
+          parallel, and merges their results by score. See search_page.
+
+          :rtype: dict
+        """
+        limit = page * pagesize
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._new_executor()
+
+        if self._fanout == "process":
+            futures = []
+            for shard in shards:
+                if not self._is_ram(shard):
+                    futures.append(self._executor.submit(
+                        search_top, self._path, shard, word, limit, snippets,
+                        ranking))
+                    continue
+                # The shards kept in memory are only in this process.
+                future = Future()
+                future.set_result(self.search_top(
+                    shard, word, limit, snippets, ranking))
+                futures.append(future)
+        else:
+            futures = [self._executor.submit(
+                self.search_top, shard, word, limit, snippets, ranking)
+                for shard in shards]
+
+        total = 0
+        hits = []
+        for i, future in enumerate(futures):
+            shard_total, shard_hits = future.result()
+            total += shard_total
+            hits.extend((-res["score"], i, rank, res)
+                        for rank, res in enumerate(shard_hits))
+        hits.sort(key=lambda hit: hit[:3])
+
+        offset = (page - 1) * pagesize
+        return {
+            "total": total,
+            "page": page,
+            "pagesize": pagesize,
+            "results": [res for *_, res in hits[offset:offset + pagesize]]
+        }
+
+    def _new_executor(self):
+        """Creates the pool of workers of the searches over several shards."""
+        if self._fanout == "process":
+            return ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=self._workers,
+                                  thread_name_prefix="Multiindex")
+
+    def search_top(self, indexname: str, word: str, limit: int,
+                   snippets: bool = False, ranking: str = "bm25"):
+        """
+          Searches for the word within a single whoosh index, retrieving
+          only its best results.
+
+          :param indexname: name of the index or of one of its shards.
+          :param word: sentence to search.
+          :param limit: maximum amount of results.
+          :param snippets: if True, each result also includes its snippet.
+          :param ranking: one of RANKINGS, see search_page.
+
+          Returns the tuple (total, results) where total is the amount of
+          documents containing the word and results the list of
+          diccionaries {title: title, url: url, score: score[, snippet]}.
+          :rtype: tuple
+        """
+        if not self._storage_of(indexname).index_exists(indexname):
+            return 0, []
+
+        with self.searcher(indexname) as searcher:
+            query = query_parser(searcher.schema).parse(word)
+            if ranking == "recency":
+                results = searcher.search(
+                    query, limit=max(limit, RERANK_CANDIDATES), terms=snippets)
+            else:
+                results = searcher.search(query, limit=limit, terms=snippets)
+            if snippets:
+                set_highlighter(results, searcher.schema)
+            if ranking != "recency":
+                return len(results), [hit_result(hit, snippets)
+                                      for hit in results]
+
+            hits = self._rerank(indexname, results)[:limit]
+            return len(results), [dict(hit_result(hit, snippets), score=score)
+                                  for score, hit in hits]
+
+    def _rerank(self, indexname: str, results):
+        """
+          Orders the hits of a search by blended_score, with the visits
+          recorded for the index named indexname or, if a page has none,
+          the ones stored in its document.
+
+          :param indexname: name of the index or of one of its shards.
+          :param results: whoosh results.
+
+          Returns the list of tuples (score, hit), best first.
+          :rtype: list
+        """
+        visits = self._visit_table(indexname)
+        if self._external_writers:
+            visits.refresh()
+        now = time.time()
+        hits = []
+        for hit in results:
+            visit = visits.get(hit["url"])
+            if visit is not None:
+                _, last_visited, visit_count = visit
+            else:
+                last_visited = hit.get("last_visited")
+                visit_count = hit.get("visit_count") or 1
+            hits.append((blended_score(hit.score, last_visited, visit_count,
+                                       now), hit))
+        hits.sort(key=lambda hit: -hit[0])
+        return hits
+
+    def suggest(self, indexname: str, text: str, limit: int = 10):
+        """
+          Completes the last word of a text being typed with the most
+          frequent terms of the index named indexname that start with it.
+          The terms are kept in memory by a TermDictionary, which is built
+          by the first suggestion and updated on each commit, so later
+          suggestions do not open a searcher. With external writers, whose
+          commits are not seen, it is rebuilt at most every TERMS_REFRESH
+          seconds once the index changes.
+
+          Since the terms are the ones of the index, with a stemming
+          analyzer the completions are stems.
+
+          :param indexname: name of the index.
+          :param text: text being typed. If it ends with a space there is
+          nothing to complete.
+          :param limit: maximum amount of completions.
+
+          Returns a list of dictionaries
+          {text: text with its last word completed, term: completion,
+          docs: amount of documents containing it}.
+          :rtype: list
+        """
+        words = text.split()
+        if not words or text[-1].isspace():
+            return []
+        entry = self._terms.get(indexname)
+        if entry is None or self._external_writers:
+            entry = self._term_dictionary(indexname)
+        if entry is None:
             return []
 
-        finally:
-            index.close()
+        schema, dictionary = entry
+        head = text[:len(text) - len(words[-1])]
+        return [{"text": head + term, "term": term, "docs": docs}
+                for term, docs in dictionary.complete(
+                    term_prefix(schema, words[-1]), limit)]
+
+    def _term_dictionary(self, indexname: str):
+        """
+          Builds the term dictionary of the index named indexname from the
+          terms of all its shards.
+
+          Returns the tuple (schema, TermDictionary), or None if the index
+          does not exist.
+          :rtype: tuple
+        """
+        if not self.available(indexname):
+            return None
+        built = self._terms_built.get(indexname)
+        generation = None
+        if self._external_writers:
+            if indexname in self._terms and \
+                    time.monotonic() - built[1] < TERMS_REFRESH:
+                return self._terms[indexname]
+            generation = self.generation(indexname)
+
+        with self._terms_lock:
+            built = self._terms_built.get(indexname)
+            if indexname not in self._terms or built[0] != generation:
+                with ExitStack() as stack:
+                    searchers = [stack.enter_context(self.searcher(shard))
+                                 for shard in self.shards(indexname)]
+                    schema = searchers[0].schema
+                    fieldnames = [name for name in schema.names()
+                                  if name.startswith("content_") or
+                                  name == "content"]
+                    dictionary = TermDictionary.from_readers(
+                        [s.reader() for s in searchers], fieldnames)
+                self._terms[indexname] = (schema, dictionary)
+            self._terms_built[indexname] = (generation, time.monotonic())
+            return self._terms[indexname]
+
+    def indexnames(self):
+        """
+          Returns the names of the indexes stored in the multiindex.
+
+          :rtype: list
+        """
+        pattern = re.compile(r"^_(.+)_[0-9]+\.toc$")
+        names = set()
+        with self._ram_lock:
+            files = [file for storage in self._ram.values()
+                     for file in storage.list()]
+        for file in self._storage.list() + files:
+            match = pattern.match(file)
+            if match is None:
+                continue
+            name = match.group(1)
+            if self._shards > 1:
+                name = name.rsplit("-", 1)[0]
+            names.add(name)
+        return sorted(names)
+
+    def segments(self, indexname: str):
+        """
+          Describes the segments of the index named indexname.
+
+          :param indexname: name of the index.
+
+          Returns a list with a dictionary
+          {shard: shard, segments: segments, docs: docs, deleted: deleted,
+           bytes: bytes}
+          for each shard of the index, where bytes is the size of its files.
+          :rtype: list
+        """
+        ret = []
+        for shard in self.shards(indexname):
+            storage = self._storage_of(shard)
+            if not storage.index_exists(shard):
+                continue
+            segments = self._open(shard)._segments()
+            names = set(seg.segment_id() for seg in segments)
+            size = sum(storage.file_length(file)
+                       for file in storage.list()
+                       if file.split(".", 1)[0] in names)
+            ret.append({
+                "shard": shard,
+                "segments": len(segments),
+                "docs": sum(seg.doc_count() for seg in segments),
+                "deleted": sum(seg.deleted_count() for seg in segments),
+                "bytes": size
+            })
+        return ret
+
+    def warm(self, indexname: str, preload: bool = True,
+             terms: bool = False):
+        """
+          Prepares the index named indexname for its first searches: opens
+          its shards, leaves a searcher in their pools and loads the digests
+          and visits kept in memory. If preload, the files of its segments
+          are read first, so the searches find them in the page cache of
+          the OS instead of the disk, unless the index is kept in memory.
+
+          The term dictionary is only built if terms is True, since once it
+          is built every commit analyzes its documents again to update it,
+          which is wasted if the index gets no suggestions.
+
+          :param indexname: name of the index.
+          :param preload: if True, the files of the segments are read.
+          :param terms: if True, the term dictionary is built.
+
+          Returns the amount of bytes read.
+          :rtype: int
+        """
+        size = 0
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+            index = self._open(shard)
+            if preload and not self._is_ram(shard):
+                names = set(seg.segment_id() for seg in index._segments())
+                for file in self._storage.list():
+                    if file.split(".", 1)[0] in names:
+                        size += read_file(os.path.join(self._path, file))
+            with self.searcher(shard) as searcher:
+                searcher.reader().doc_count()
+            self._digest_set(shard)
+            self._visit_table(shard)
+        if terms:
+            self._term_dictionary(indexname)
+        return size
+
+    def expired_query(self, indexname: str, max_age: float,
+                      now: float = None):
+        """
+          Returns the query of the documents of the index named indexname
+          not visited for max_age seconds: those whose stored last_visited
+          is older, unless their VisitTable recorded a later visit to the
+          same content. The documents stored before the visits were
+          recorded have no visit time, so they never match.
+
+          :param indexname: name of the index.
+          :param max_age: seconds after its last visit a page is kept.
+          :param now: time to compute the age of the pages. By default, now.
+
+          :rtype: whoosh.query.Query
+        """
+        cutoff = (time.time() if now is None else now) - max_age
+        query = NumericRange("last_visited", None, cutoff, endexcl=True)
+        # Only the stored fields of the old documents are read.
+        revisited = []
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+            visits = self._visit_table(shard)
+            with self.searcher(shard) as searcher:
+                for docnum in searcher.docs_for_query(query):
+                    fields = searcher.stored_fields(docnum)
+                    visit = visits.get(fields["url"])
+                    if visit is not None and \
+                            visit[0] == fields.get("hash") and \
+                            visit[1] >= cutoff:
+                        revisited.append(Term("hash", visit[0]))
+        if revisited:
+            query = AndNot(query, Or(revisited))
+        return query
+
+    def expire(self, indexname: str, max_age: float, now: float = None):
+        """
+          Deletes the documents of the index named indexname not visited
+          for max_age seconds, see expired_query and delete_by_query.
+
+          :param indexname: name of the index.
+          :param max_age: seconds after its last visit a page is kept.
+          :param now: time to compute the age of the pages. By default, now.
+
+          Returns the amount of deleted documents.
+          :rtype: int
+        """
+        return self.delete_by_query(
+            indexname, self.expired_query(indexname, max_age, now))
+
+    def expired(self, indexname: str, max_docs: int = None,
+                max_per_domain: int = None):
+        """
+          Selects the documents of the index named indexname that exceed
+          the caps of the retention rules, by the time of their last visit:
+          the one recorded by its VisitTable or, if none, the one stored in
+          the document. The documents stored before the visits were
+          recorded have no visit time, so they are the first ones to exceed
+          the caps.
+
+          :param indexname: name of the index.
+          :param max_docs: amount of pages visited last that are kept.
+          :param max_per_domain: amount of pages visited last of each
+          domain that are kept.
+
+          Returns the list of the hashes of the selected documents.
+          :rtype: list
+        """
+        if max_docs is None and max_per_domain is None:
+            return []
+        # [(last visit or None, hash, domain)]
+        pages = []
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+            visits = self._visit_table(shard)
+            with self.searcher(shard) as searcher:
+                for _, fields in searcher.reader().iter_docs():
+                    last = fields.get("last_visited")
+                    visit = visits.get(fields["url"])
+                    if visit is not None and visit[0] == fields.get("hash"):
+                        last = visit[1]
+                    domain = urlparse(fields["url"]).hostname or ""
+                    pages.append((last, fields.get("hash"), domain))
+
+        # The pages visited last first.
+        pages.sort(key=lambda page: (page[0] is not None, page[0] or 0),
+                   reverse=True)
+        expired = []
+        kept = 0
+        domains = {}
+        for _, digest, domain in pages:
+            domains[domain] = domains.get(domain, 0) + 1
+            if max_per_domain is not None and \
+                    domains[domain] > max_per_domain or \
+                    max_docs is not None and kept >= max_docs:
+                expired.append(digest)
+            else:
+                kept += 1
+        return expired
+
+    def delete_documents(self, indexname: str, digests: list):
+        """
+          Deletes the documents of the index named indexname with the given
+          content hashes. See delete_by_query.
+
+          :param indexname: name of the index.
+          :param digests: list of hexadecimal MD5 of the url and the content.
+
+          Returns the amount of deleted documents.
+          :rtype: int
+        """
+        if not digests:
+            return 0
+        return self.delete_by_query(
+            indexname, Or([Term("hash", digest) for digest in digests]))
+
+    def delete_by_query(self, indexname: str, query):
+        """
+          Deletes the documents of the index named indexname that match the
+          query, with a single commit per shard that also rewrites the
+          segments holding deleted documents, so their space is reclaimed.
+          The hashes and visits of the deleted documents are forgotten, so
+          they are stored again if they are visited, and the term
+          dictionary of the index is built again.
+
+          :param indexname: name of the index.
+          :param query: whoosh query or, if it is a string, a query in the
+          syntax of the searches.
+
+          Returns the amount of deleted documents.
+          :rtype: int
+        """
+        deleted = 0
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+            writer = self._open(shard).writer()
+            searcher = writer.searcher()
+            try:
+                shard_query = query_parser(searcher.schema).parse(query) \
+                    if isinstance(query, str) else query
+                documents = [searcher.stored_fields(docnum) for docnum
+                             in searcher.docs_for_query(shard_query)]
+                if not documents:
+                    writer.cancel()
+                    continue
+                writer.delete_by_query(shard_query, searcher=searcher)
+                with self._terms_lock:
+                    writer.commit(mergetype=EXPUNGE_MERGE)
+                    self._committed(shard)
+                    self._terms.pop(indexname, None)
+                    self._terms_built.pop(indexname, None)
+            except Exception:
+                writer.cancel()
+                raise
+            finally:
+                searcher.close()
+
+            self._digest_set(shard).discard(
+                doc["hash"] for doc in documents if doc.get("hash"))
+            self._visit_table(shard).forget(doc["url"] for doc in documents)
+            legacy = self._legacy_pages(shard)
+            for doc in documents:
+                legacy.pop(doc["url"], None)
+            self._visits_version += 1
+            self._clean(shard)
+            deleted += len(documents)
+        return deleted
+
+    def merge(self, indexname: str, policy: str = "tiered"):
+        """
+          Merges the segments of every shard of the index named indexname
+          following the given policy, and deletes the files that are no
+          longer used.
+
+          :param indexname: name of the index.
+          :param policy: "tiered" (see TIERED_MERGE), "optimize", which
+          merges all the segments into one, or "expunge", which rewrites the
+          segments holding deleted documents (see EXPUNGE_MERGE).
+
+          Returns the seconds spent merging, or None if no shard needed it.
+          :rtype: float
+        """
+        mergetype = MERGE_POLICIES[policy]
+        start = time.perf_counter()
+        merged = False
+        for shard in self.shards(indexname):
+            if not self._storage_of(shard).index_exists(shard):
+                continue
+
+            # Committing without merging anything would still create a new
+            # generation, which invalidates the cached searches.
+            segments = self._open(shard)._segments()
+            if policy == "tiered" and not tiered_segments(segments):
+                continue
+            if policy == "optimize" and len(segments) < 2 and \
+                    not any(seg.has_deletions() for seg in segments):
+                continue
+            if policy == "expunge" and \
+                    not any(seg.has_deletions() for seg in segments):
+                continue
+
+            writer = self._open(shard).writer()
+            shard_start = time.perf_counter()
+            try:
+                writer.commit(mergetype=mergetype)
+            except Exception:
+                writer.cancel()
+                raise
+            MERGE_SECONDS.observe(time.perf_counter() - shard_start,
+                                  policy=policy)
+            self._committed(shard)
+            self._clean(shard)
+            merged = True
+        return time.perf_counter() - start if merged else None
+
+    def clean(self, indexname: str):
+        """
+          Deletes the files of the index named indexname that do not belong
+          to its current generation. Whoosh tries to delete them on each
+          commit, but the files still open at that moment may remain.
+
+          :param indexname: name of the index.
+        """
+        for shard in self.shards(indexname):
+            self._clean(shard)
+
+    def _clean(self, name: str):
+        """See clean. name is the name of a single shard."""
+        storage = self._storage_of(name)
+        if not storage.index_exists(name):
+            return
+        toc = TOC.read(storage, name)
+        clean_files(storage, name, toc.generation, toc.segments)
 
     def remove_index(self, indexname=None):
         """
@@ -181,20 +2429,28 @@ class Multiindex():
         """
         dir = self._path
         if indexname is not None:
-            exists = self._storage.index_exists(indexname)
+            self._terms.pop(indexname, None)
+            for name in self.shards(indexname):
+                self._forget(name)
+                with self._ram_lock:
+                    in_ram = self._ram.pop(name, None) is not None
+                exists = in_ram or self._storage.index_exists(name)
 
-            if exists:
-                for file in os.listdir(dir):
-                    if file.startswith(indexname) or \
-                            file.startswith(f'_{indexname}'):
+                if exists:
+                    for file in os.listdir(dir):
+                        if file.startswith(name) or \
+                                file.startswith(f'_{name}'):
 
-                        path = os.path.join(dir, file)
-                        try:
-                            shutil.rmtree(path)
-                        except OSError:
-                            os.remove(path)
+                            path = os.path.join(dir, file)
+                            try:
+                                shutil.rmtree(path)
+                            except OSError:
+                                os.remove(path)
 
         elif os.path.isdir(dir):
+            self._forget()
+            with self._ram_lock:
+                self._ram.clear()
             for file in os.listdir(dir):
                 path = os.path.join(dir, file)
                 try:
@@ -0,0 +1,151 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MergeScheduler():
+    """
+      Background maintenance of the segments of a Multiindex.
+
+      Every interval seconds it checks the segments of each index and, if
+      needed, queues a merge in the write buffer, so merges never contend
+      with the commits of the documents for the writer lock. Two policies
+      are supported:
+
+        - "tiered": the segments of similar size of a shard are merged
+          together once it holds more than max_segments segments.
+        - "idle": every shard with more than one segment is optimized into
+          a single segment once no document has been written for idle
+          seconds.
+
+      After each check the files left behind by previous generations are
+      deleted.
+    """
+
+    def __init__(self, index, write_buffer, policy: str = "tiered",
+                 interval: float = 30.0, max_segments: int = 10,
+                 idle: float = 60.0):
+        """
+          :param index: the Multiindex whose segments are merged.
+          :param write_buffer: the WriteBuffer that runs the merges.
+          :param policy: "tiered" or "idle".
+          :param interval: seconds between checks.
+          :param max_segments: amount of segments of a shard above which it
+          is merged by the tiered policy.
+          :param idle: seconds without writes after which the idle policy
+          optimizes the indexes.
+        """
+        if policy not in ("tiered", "idle"):
+            raise ValueError(f"Unknown merge policy {policy}.")
+
+        self._index = index
+        self._write_buffer = write_buffer
+        self._policy = policy
+        self._interval = interval
+        self._max_segments = max_segments
+        self._idle = idle
+
+        self._lock = threading.Lock()
+        self.merges = 0
+        self.merge_seconds = 0.0
+        self.last_merge_seconds = None
+        # {indexname: result of Multiindex.segments}
+        self._segments = {}
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="MergeScheduler", daemon=True)
+        self._thread.start()
+
+    def check(self):
+        """
+          Merges the indexes that need it according to the policy and
+          deletes their obsolete files. The merges are run by the write
+          buffer, and this method waits for them. Only the merges that
+          changed the segments are counted: the tiered policy leaves a shard
+          as it is until one of its tiers is full, however many segments it
+          has.
+
+          Returns the names of the merged indexes.
+          :rtype: list
+        """
+        merged = []
+        for indexname in self._index.indexnames():
+            segments = self._index.segments(indexname)
+            seconds = None
+            if self._must_merge(segments):
+                policy = "tiered" if self._policy == "tiered" \
+                    else "optimize"
+                seconds = self._write_buffer.submit(
+                    self._index.merge, indexname, policy).result()
+            if seconds is not None:
+                with self._lock:
+                    self.merges += 1
+                    self.merge_seconds += seconds
+                    self.last_merge_seconds = seconds
+                merged.append(indexname)
+                segments = self._index.segments(indexname)
+            else:
+                self._write_buffer.submit(
+                    self._index.clean, indexname).result()
+
+            with self._lock:
+                self._segments[indexname] = segments
+        return merged
+
+    def _must_merge(self, segments: list):
+        """
+          Returns True if any shard has to be merged according to the
+          policy.
+
+          :param segments: result of Multiindex.segments for an index.
+
+          :rtype: bool
+        """
+        if self._policy == "tiered":
+            return any(shard["segments"] > self._max_segments
+                       for shard in segments)
+
+        last_write = self._write_buffer.last_write
+        if last_write is not None and \
+                time.monotonic() - last_write < self._idle:
+            return False
+        return any(shard["segments"] > 1 for shard in segments)
+
+    def stats(self):
+        """
+          Returns the segments of each index, as described by
+          Multiindex.segments in the last check, and the merge counters.
+
+          :rtype: dict
+        """
+        with self._lock:
+            return {
+                "segments": dict(self._segments),
+                "merges": {
+                    "policy": self._policy,
+                    "count": self.merges,
+                    "seconds": self.merge_seconds,
+                    "last_seconds": self.last_merge_seconds
+                }
+            }
+
+    def close(self):
+        """Stops the background thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        """Checks the indexes every interval seconds."""
+        while not self._stop.wait(self._interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Could not merge the segments")
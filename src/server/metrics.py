@@ -0,0 +1,194 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import bisect
+import threading
+
+# Upper bounds in seconds of the buckets of the latency histograms.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=()):
+    """
+      Formats the labels of a sample in the Prometheus text format.
+
+      :param names: names of the labels.
+      :param values: values of the labels, in the same order.
+      :param extra: additional (name, value) pairs.
+
+      :rtype: str
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+               .replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value
+                          in zip(pairs, escaped)) + "}"
+
+
+class Counter():
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        """
+          :param name: name of the metric.
+          :param help: description of the metric.
+          :param labelnames: names of the labels of each sample.
+        """
+        self.name = name
+        self.help = help
+        self._labelnames = tuple(labelnames)
+        # {label values: value}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+          Increases the counter of the given labels.
+
+          :param amount: amount to add.
+          :param labels: value of each label.
+        """
+        key = tuple(str(labels[name]) for name in self._labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Returns the counter of the given labels."""
+        key = tuple(str(labels[name]) for name in self._labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        """
+          Returns the lines of the samples in the Prometheus text format.
+
+          :rtype: list
+        """
+        with self._lock:
+            return [f"{self.name}{_labels(self._labelnames, key)} {value}"
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram():
+    """Cumulative histogram with labels, as defined by Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (),
+                 buckets: tuple = BUCKETS):
+        """
+          :param name: name of the metric.
+          :param help: description of the metric.
+          :param labelnames: names of the labels of each sample.
+          :param buckets: sorted upper bounds of the buckets.
+        """
+        self.name = name
+        self.help = help
+        self._labelnames = tuple(labelnames)
+        self._buckets = tuple(buckets)
+        # {label values: [counts per bucket + 1, sum]}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+          Records an observation.
+
+          :param value: observed value, e.g., seconds.
+          :param labels: value of each label.
+        """
+        key = tuple(str(labels[name]) for name in self._labelnames)
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = \
+                    [[0] * (len(self._buckets) + 1), 0.0]
+            counts[0][i] += 1
+            counts[1] += value
+
+    def count(self, **labels):
+        """Returns the amount of observations of the given labels."""
+        key = tuple(str(labels[name]) for name in self._labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            return 0 if counts is None else sum(counts[0])
+
+    def samples(self):
+        """
+          Returns the lines of the samples in the Prometheus text format.
+
+          :rtype: list
+        """
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                bounds = [str(b) for b in self._buckets] + ["+Inf"]
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    labels = _labels(self._labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _labels(self._labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Metrics():
+    """Registry of the metrics exposed by the server."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()):
+        """
+          Returns the counter named name, creating it the first time.
+
+          :rtype: Counter
+        """
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (),
+                  buckets: tuple = BUCKETS):
+        """
+          Returns the histogram named name, creating it the first time.
+
+          :rtype: Histogram
+        """
+        return self._register(Histogram, name, help, labelnames,
+                              buckets=buckets)
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        """See counter and histogram."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def render(self):
+        """
+          Returns every metric in the Prometheus text format.
+
+          :rtype: str
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry, exposed by /metrics.
+METRICS = Metrics()
@@ -0,0 +1,48 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import re
+
+# End of a sentence, where the lines are split.
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def normalize_text(text: str, max_chars: int = None):
+    """
+      Reduces the text of a page before it is indexed: the whitespace of
+      each paragraph (line) is collapsed, empty and repeated paragraphs,
+      such as the menus and footers repeated along the innerText of a
+      page, are removed, and the result is truncated at a word boundary.
+      The lines are also split into sentences, so the repeated sentences
+      are removed from the texts sent as a single line.
+
+      :param text: text of the page.
+      :param max_chars: maximum amount of characters kept. If None, the
+      text is not truncated.
+
+      Returns the normalized text.
+      :rtype: str
+    """
+    paragraphs = []
+    seen = set()
+    size = 0
+    sentences = (sentence for line in text.splitlines()
+                 for sentence in SENTENCE_END.split(line))
+    for sentence in sentences:
+        paragraph = " ".join(sentence.split())
+        if not paragraph or paragraph in seen:
+            continue
+        seen.add(paragraph)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 1
+        if max_chars is not None and size > max_chars:
+            break
+
+    ret = "\n".join(paragraphs)
+    if max_chars is not None and len(ret) > max_chars:
+        cut = max(ret.rfind(" ", 0, max_chars + 1),
+                  ret.rfind("\n", 0, max_chars + 1))
+        ret = ret[:cut if cut > 0 else max_chars].rstrip()
+    return ret
@@ -0,0 +1,432 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from http.server import ThreadingHTTPServer
+from multiprocessing.connection import Client, Listener
+
+try:
+    from .indexHandler import Multiindex
+    from .profiler import SlowRequestProfiler
+    from .queryCache import QueryCache
+    from .warmup import Warmup
+except ImportError:
+    from indexHandler import Multiindex
+    from profiler import SlowRequestProfiler
+    from queryCache import QueryCache
+    from warmup import Warmup
+
+logger = logging.getLogger(__name__)
+
+# Functions of the multiindex that the workers may run in the writer, see
+# RemoteWriteBuffer.submit.
+SUBMITTABLE = ("createIx",)
+
+# Seconds a worker keeps trying to reach the writer, which starts after it.
+CONNECT_TIMEOUT = 30.0
+
+# Seconds a worker is given to finish its requests when it is stopped.
+STOP_TIMEOUT = 5.0
+
+
+class WriterService():
+    """
+      Serves the writes of the worker processes of a PreforkServer, so a
+      single process, the one that owns the write buffer, writes the index.
+
+      Each worker connection is served by its own thread, which receives
+      tuples (method, args) and answers ("ok", result) or ("error",
+      message). The methods store pages in the write buffer or the
+      write-ahead log, record visits, create indexes and report their
+      stats, and those of the merges and the retention rules.
+    """
+
+    def __init__(self, index, write_buffer, wal=None, merge_scheduler=None,
+                 retention=None):
+        """
+          :param index: the Multiindex written by write_buffer.
+          :param write_buffer: the WriteBuffer that performs every write.
+          :param wal: the WriteAheadLog of the stored pages, if any.
+          :param merge_scheduler: the MergeScheduler of the index, if any.
+          :param retention: the Retention of the index, if any.
+        """
+        self._index = index
+        self._write_buffer = write_buffer
+        self._wal = wal
+        self._merge_scheduler = merge_scheduler
+        self._retention = retention
+        self.authkey = os.urandom(32)
+        self._listener = Listener(family="AF_UNIX", authkey=self.authkey)
+        self.address = self._listener.address
+        self._closed = False
+        self._connections = []
+        self._lock = threading.Lock()
+        self._methods = {
+            "add_many": self._add_many,
+            "submit": self._submit,
+            "buffer_stats": self._buffer_stats,
+            "visit": index.visit,
+            "visit_many": index.visit_many,
+        }
+        if wal is not None:
+            self._methods.update(append=wal.append, wait=wal.wait,
+                                 wal_stats=wal.stats)
+        if merge_scheduler is not None:
+            self._methods["merge_stats"] = merge_scheduler.stats
+        if retention is not None:
+            self._methods["retention_stats"] = retention.stats
+        self._thread = threading.Thread(target=self._accept,
+                                        name="WriterService", daemon=True)
+        self._thread.start()
+
+    def endpoint(self):
+        """
+          Returns what a WriterClient needs: the tuple (address, authkey,
+          whether there is a write-ahead log, whether there is a merge
+          scheduler, whether there are retention rules).
+
+          :rtype: tuple
+        """
+        return (self.address, self.authkey, self._wal is not None,
+                self._merge_scheduler is not None,
+                self._retention is not None)
+
+    def _add_many(self, indexname: str, documents: list):
+        """Queues the documents without answering their futures."""
+        self._write_buffer.add_many(indexname, documents)
+
+    def _submit(self, name: str, *args):
+        """Runs a function of SUBMITTABLE in the write buffer thread."""
+        if name not in SUBMITTABLE:
+            raise ValueError(f"{name} can not be submitted.")
+        return self._write_buffer.submit(
+            getattr(self._index, name), *args).result()
+
+    def _buffer_stats(self):
+        """Returns the documents and bytes pending in the write buffer."""
+        return len(self._write_buffer), self._write_buffer.pending_bytes()
+
+    def _accept(self):
+        """Accepts the connections of the workers."""
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if not self._closed:
+                    logger.exception("Could not accept a worker")
+                continue
+            with self._lock:
+                self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,),
+                             name="WriterService", daemon=True).start()
+
+    def _serve(self, conn):
+        """Runs the calls received from a connection until it is closed."""
+        try:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    result = ("ok", self._methods[method](*args))
+                except Exception as e:
+                    logger.exception("Could not run %s for a worker", method)
+                    result = ("error", f"{type(e).__name__}: {e}")
+                conn.send(result)
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close(self):
+        """Stops accepting workers and closes their connections."""
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            conn.close()
+
+
+class WriterClient():
+    """
+      Calls the methods of a WriterService. The connections are pooled: a
+      call takes an idle connection, or opens a new one, and returns it to
+      the pool once it is answered.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        """
+          :param address: address of the WriterService.
+          :param authkey: key shared with the WriterService.
+        """
+        self._address = address
+        self._authkey = authkey
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connect(self):
+        """Opens a connection, waiting for the writer to start."""
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                return Client(self._address, authkey=self._authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def call(self, method: str, *args):
+        """
+          Runs a method in the writer and returns its result.
+
+          Raises RuntimeError if the method failed in the writer.
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            conn.send((method, args))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+        if status != "ok":
+            raise RuntimeError(f"The writer could not run {method}: {result}")
+        return result
+
+    def visit(self, indexname: str, url: str, digest: str):
+        """See Multiindex.visit."""
+        return self.call("visit", indexname, url, digest)
+
+    def visit_many(self, indexname: str, urls: list, digests: list):
+        """See Multiindex.visit_many."""
+        return self.call("visit_many", indexname, urls, digests)
+
+
+class RemoteWriteBuffer():
+    """Stand-in of the WriteBuffer of the writer within a worker."""
+
+    def __init__(self, client: WriterClient):
+        self._client = client
+
+    def __len__(self):
+        return self._client.call("buffer_stats")[0]
+
+    def pending_bytes(self):
+        return self._client.call("buffer_stats")[1]
+
+    def add_many(self, indexname: str, documents: list):
+        """
+          Queues the documents in the write buffer of the writer. Unlike
+          WriteBuffer.add_many, it does not return their futures.
+        """
+        self._client.call("add_many", indexname, documents)
+        return []
+
+    def submit(self, function, *args):
+        """
+          Runs a method of the multiindex, one of SUBMITTABLE, in the write
+          buffer of the writer.
+
+          Returns a future already done with its result.
+          :rtype: Future
+        """
+        future = Future()
+        future.set_result(self._client.call("submit", function.__name__,
+                                            *args))
+        return future
+
+
+class RemoteWriteAheadLog():
+    """Stand-in of the WriteAheadLog of the writer within a worker."""
+
+    def __init__(self, client: WriterClient):
+        self._client = client
+
+    def append(self, indexname: str, documents: list):
+        return self._client.call("append", indexname, documents)
+
+    def wait(self, seq: int, timeout: float = None):
+        return self._client.call("wait", seq, timeout)
+
+    def stats(self):
+        return self._client.call("wal_stats")
+
+
+class RemoteMergeScheduler():
+    """Stand-in of the MergeScheduler of the writer within a worker."""
+
+    def __init__(self, client: WriterClient):
+        self._client = client
+
+    def stats(self):
+        return self._client.call("merge_stats")
+
+
+class RemoteRetention():
+    """Stand-in of the Retention of the writer within a worker."""
+
+    def __init__(self, client: WriterClient):
+        self._client = client
+
+    def stats(self):
+        return self._client.call("retention_stats")
+
+
+def serve_worker(sock: socket.socket, handler_class, ix_path: str,
+                 default_idx: str, writer: tuple, index_options: dict,
+                 handler_options: dict, profile: tuple = None):
+    """
+      Serves the requests of a worker process of a PreforkServer until it
+      receives SIGTERM.
+
+      :param sock: listening socket shared by the workers.
+      :param handler_class: class of the request handler, WERRequestHandler.
+      :param ix_path: path to the multiindex directory.
+      :param default_idx: name of the index used by the requests.
+      :param writer: the endpoint of the WriterService, see
+      WriterService.endpoint.
+      :param index_options: keyword arguments of the Multiindex, besides
+      cache_mb and cache_ttl, the bounds of its cache, and warmup, the
+      arguments of the Warmup of the worker or None.
+      :param handler_options: keyword arguments of handler_class.
+      :param profile: arguments of the SlowRequestProfiler, if the requests
+      are profiled.
+    """
+    index_options = dict(index_options)
+    cache = QueryCache(
+        max_bytes=int(index_options.pop("cache_mb") * 1024 * 1024),
+        ttl=index_options.pop("cache_ttl"))
+    warmup = index_options.pop("warmup", None)
+    # The searchers follow the commits of the writer.
+    index = Multiindex.shared(ix_path, cache=cache, external_writers=True,
+                              **index_options)
+
+    address, authkey, wal, merge_scheduler, retention = writer
+    client = WriterClient(address, authkey)
+    handler_options = dict(
+        handler_options, write_buffer=RemoteWriteBuffer(client),
+        wal=RemoteWriteAheadLog(client) if wal else None,
+        merge_scheduler=RemoteMergeScheduler(client)
+        if merge_scheduler else None,
+        retention=RemoteRetention(client) if retention else None,
+        visit=client.visit, visit_many=client.visit_many,
+        profiler=SlowRequestProfiler(*profile) if profile else None,
+        warmup=Warmup(index, **warmup) if warmup is not None else None)
+    handler = partial(handler_class, ix_path, default_idx, **handler_options)
+
+    server = ThreadingHTTPServer(sock.getsockname(), handler,
+                                 bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        server.serve_forever()
+    finally:
+        Multiindex.shared(ix_path).close()
+
+
+class PreforkServer():
+    """
+      Serves the requests with several worker processes, so the searches
+      use every CPU instead of being bound by the GIL of a single process.
+
+      The listening socket is opened by this process, the writer, and
+      shared by the workers, which accept its connections. Each worker
+      searches the indexes with its own read-only searchers, refreshed
+      whenever the writer commits, and sends every write to the writer
+      through a local socket, see WriterService, so there is still a single
+      writer. The workers that die are started again.
+
+      It has the interface of HTTPServer used by wer: serve_forever,
+      shutdown, server_close and server_address.
+    """
+
+    def __init__(self, address: tuple, processes: int, handler_class,
+                 ix_path: str, default_idx: str, writer: WriterService,
+                 index_options: dict, handler_options: dict,
+                 profile: tuple = None):
+        """
+          :param address: tuple (host, port) to listen to.
+          :param processes: amount of worker processes.
+          :param handler_class: class of the request handler.
+          :param ix_path: path to the multiindex directory.
+          :param default_idx: name of the index used by the requests.
+          :param writer: the WriterService of this process.
+          :param index_options: keyword arguments of the multiindices of
+          the workers, see serve_worker.
+          :param handler_options: keyword arguments of handler_class.
+          :param profile: arguments of the SlowRequestProfiler of each
+          worker, if the requests are profiled.
+        """
+        self.socket = socket.create_server(
+            address, backlog=ThreadingHTTPServer.request_queue_size)
+        self.server_address = self.socket.getsockname()
+        self._processes = processes
+        self._writer = writer
+        self._args = (self.socket, handler_class, ix_path, default_idx,
+                      writer.endpoint(), index_options, handler_options,
+                      profile)
+        # The workers must not inherit the threads of the writer.
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._stop = threading.Event()
+
+    def _start_worker(self):
+        """Starts a worker process."""
+        worker = self._context.Process(target=serve_worker, args=self._args,
+                                       name="WER worker")
+        worker.start()
+        return worker
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        """Starts the workers and restarts them until shutdown is called."""
+        self._stop.clear()
+        self._workers = [self._start_worker()
+                         for _ in range(self._processes)]
+        while not self._stop.wait(poll_interval):
+            for i, worker in enumerate(self._workers):
+                if not worker.is_alive():
+                    logger.warning("Worker %s exited with code %s, starting "
+                                   "a new one", worker.pid, worker.exitcode)
+                    self._workers[i] = self._start_worker()
+
+    def shutdown(self):
+        """Stops restarting the workers, and makes serve_forever return."""
+        self._stop.set()
+
+    def server_close(self):
+        """Stops the workers, the writer service and the socket."""
+        self._stop.set()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in self._workers:
+            worker.join(STOP_TIMEOUT)
+            if worker.is_alive():
+                worker.kill()
+        self._workers = []
+        self._writer.close()
+        self.socket.close()
@@ -0,0 +1,81 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SlowRequestProfiler():
+    """
+      Profiles a sample of the requests with cProfile and keeps the profiles
+      of the ones slower than a threshold.
+
+      Since the interpreter runs a single profiler at a time, a request is
+      not profiled while another one is, so the profiled requests are
+      sampled among those arriving when the profiler is free.
+    """
+
+    def __init__(self, directory: str, threshold: float = 1.0,
+                 sample: float = 1.0):
+        """
+          :param directory: directory in which the profiles are saved, as
+          files readable by pstats.
+          :param threshold: seconds above which a request is considered
+          slow and its profile saved.
+          :param sample: fraction of the requests profiled.
+        """
+        self._directory = directory
+        self._threshold = threshold
+        self._sample = sample
+        self._lock = threading.Lock()
+        self.saved = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+          Profiles the code run within the context, if the request is
+          sampled, and saves the profile if it took more than threshold
+          seconds.
+
+          :param name: name of the request, used in the file name.
+        """
+        if random.random() >= self._sample or \
+                not self._lock.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - start
+                if elapsed >= self._threshold:
+                    self._save(profile, name, elapsed)
+        finally:
+            self._lock.release()
+
+    def _save(self, profile, name: str, elapsed: float):
+        """Writes the profile of a slow request to the directory."""
+        filename = "{}-{}-{}-{:.0f}ms.prof".format(
+            time.strftime("%Y%m%d%H%M%S"), self.saved,
+            "".join(c if c.isalnum() else "_" for c in name).strip("_"),
+            elapsed * 1000)
+        path = os.path.join(self._directory, filename)
+        profile.dump_stats(path)
+        self.saved += 1
+        logger.warning("Slow request %s took %.3f s, profile saved to %s",
+                       name, elapsed, path)
@@ -0,0 +1,160 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache():
+    """
+      LRU cache of search results bounded by an amount of bytes.
+
+      Every entry belongs to an index and to the generation of that index
+      it was computed from. Since Whoosh increases the generation on each
+      commit, an entry is never returned once its index has changed, and
+      the entries of older generations are dropped as soon as an entry of
+      a newer one is added.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024,
+                 max_entries: int = 10000, ttl: float = None):
+        """
+          :param max_bytes: maximum amount of bytes held by the entries,
+          as estimated by the callers of put.
+          :param max_entries: maximum amount of entries.
+          :param ttl: seconds after which an entry expires. If None, the
+          entries only expire when their index changes.
+        """
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._ttl = ttl
+
+        # {(indexname, generation, key): (value, size, expiration)}
+        self._entries = OrderedDict()
+        # {indexname: latest generation seen}
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, indexname: str, generation: int, key):
+        """
+          Returns the value cached for the key within the generation of the
+          index named indexname, or None if there is no such value.
+
+          :param indexname: name of the index.
+          :param generation: generation of the index.
+          :param key: hashable identifying the value, e.g., the query.
+        """
+        entry_key = (indexname, generation, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[2] is not None and \
+                    entry[2] < time.monotonic():
+                self._remove(entry_key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, indexname: str, generation: int, key, value,
+            size: int):
+        """
+          Caches the value, evicting the least recently used entries if the
+          cache exceeds its bounds. Values larger than the whole cache are
+          not cached.
+
+          :param indexname: name of the index.
+          :param generation: generation of the index.
+          :param key: hashable identifying the value, e.g., the query.
+          :param value: value to cache. It must not be modified afterwards.
+          :param size: estimated size of the value in bytes.
+        """
+        if size > self._max_bytes:
+            return
+
+        expiration = None
+        if self._ttl is not None:
+            expiration = time.monotonic() + self._ttl
+
+        entry_key = (indexname, generation, key)
+        with self._lock:
+            latest = self._generations.get(indexname)
+            if latest is not None and generation < latest:
+                return
+            if latest is not None and generation > latest:
+                self._invalidate(indexname, generation)
+            self._generations[indexname] = generation
+
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = (value, size, expiration)
+            self._bytes += size
+
+            while self._bytes > self._max_bytes or \
+                    len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, indexname: str = None, generation: int = None):
+        """
+          Drops the entries of the index named indexname older than the
+          given generation. If no generation is given it drops every entry
+          of the index, and if no indexname is given, every entry.
+
+          :param indexname: name of the index.
+          :param generation: oldest generation to keep.
+        """
+        with self._lock:
+            self._invalidate(indexname, generation)
+
+    def _invalidate(self, indexname: str, generation: int):
+        """See invalidate. Must be called holding self._lock."""
+        for entry_key in list(self._entries):
+            name, gen, _ = entry_key
+            if indexname is not None and name != indexname:
+                continue
+            if generation is not None and gen >= generation:
+                continue
+            self._remove(entry_key)
+
+        if generation is None:
+            if indexname is None:
+                self._generations.clear()
+            else:
+                self._generations.pop(indexname, None)
+
+    def stats(self):
+        """
+          Returns the counters of the cache.
+
+          :rtype: dict
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _remove(self, entry_key):
+        """Removes an entry. Must be called holding self._lock."""
+        _, size, _ = self._entries.pop(entry_key)
+        self._bytes -= size
@@ -3,6 +3,8 @@ __version__ = "1.0.0"
 __email__ = "mbianchetti@dc.uba.ar"
 __status__ = "Testing"
 
+from urllib.parse import urlencode
+
 
 class Render():
     """
@@ -10,18 +12,44 @@ class Render():
       For now it returns just a harcoded html for the list.
     """
 
-    def build_list_response(self, res: list = None):
+    def build_list_response(self, res: list = None, **kwargs):
         """
           Creates an html response with the listed results
 
           :param res: list of results of the searching.
           Every element must be a dictionary containing an url and a title.
+          :param kwargs: pagination arguments, see iter_list_response.
 
           Returns the html code.
           :rtype: str
         """
+        return "".join(self.iter_list_response(res, **kwargs))
+
+    def iter_list_response(self, res: list = None, query: str = None,
+                           page: int = None, pagesize: int = None,
+                           total: int = None, index: str = None,
+                           ranking: str = None):
+        """
+          Generates the html response with the listed results chunk by
+          chunk, so it can be written while it is built.
 
-        body = """<!DOCTYPE html>
+          :param res: list of results of the searching.
+          Every element must be a dictionary containing an url and a title.
+          :param query: searched sentence, used to link the other pages.
+          :param page: number of the page of results, starting at 1.
+          :param pagesize: maximum amount of results per page.
+          :param total: amount of results of the search among all the pages.
+          If it is given, the page and the links to the previous and next
+          pages are shown.
+          :param index: comma-separated names of the searched indexes, kept
+          by the links to the other pages.
+          :param ranking: ranking of the results, kept by the links to the
+          other pages.
+
+          Yields pieces of the html code.
+          :rtype: generator
+        """
+        yield """<!DOCTYPE html>
               <html>
                 <head>
                   <title>Results</title>
@@ -30,15 +58,30 @@ class Render():
                 <h1>Results</h1>
             """
         if not res:
-            body += "<p>Sorry, no page was found using that word.</p>"
+            yield "<p>Sorry, no page was found using that word.</p>"
 
         else:
-            body += "<ul>"
+            yield "<ul>"
             for r in res:
-                body += f'<a href=\"{r["url"]}\"><li>{r["title"]}</li></a>'
-            body += "</ul>"
+                yield f'<a href=\"{r["url"]}\"><li>{r["title"]}</li></a>'
+            yield "</ul>"
+
+        if total is not None and res:
+            first = (page - 1) * pagesize + 1
+            last = first + len(res) - 1
+            yield f"<p>Results {first} to {last} of {total}.</p>"
+
+            params = {"q": query, "pagesize": pagesize}
+            if index is not None:
+                params["index"] = index
+            if ranking is not None:
+                params["rank"] = ranking
+            link = f'/search/{urlencode(params)}'
+            if page > 1:
+                yield f'<a href="{link}&page={page - 1}">Previous</a> '
+            if last < total:
+                yield f'<a href="{link}&page={page + 1}">Next</a>'
 
-        body += """</body>
+        yield """</body>
             </html>
           """
-        return body
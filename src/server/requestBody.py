@@ -0,0 +1,139 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import zlib
+
+# Size in bytes of each read of a request body.
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class RequestBodyError(ValueError):
+    """A request body that can not be read, with its HTTP status code."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class _Identity():
+    """Decoder of the bodies that are not compressed."""
+
+    def decompress(self, data: bytes, max_length: int):
+        return data
+
+    def flush(self):
+        return b""
+
+    eof = True
+
+
+class _Zlib():
+    """
+      Decoder of gzip and deflate bodies. Deflate bodies may come with or
+      without the zlib header, which is detected from their first bytes.
+    """
+
+    def __init__(self, encoding: str):
+        self._encoding = encoding
+        self._decoder = None
+
+    def decompress(self, data: bytes, max_length: int):
+        if self._decoder is None:
+            if self._encoding == "deflate" and len(data) >= 2 and (
+                    data[0] & 0x0f != 8 or
+                    (data[0] << 8 | data[1]) % 31 != 0):
+                wbits = -zlib.MAX_WBITS
+            elif self._encoding == "deflate":
+                wbits = zlib.MAX_WBITS
+            else:
+                wbits = 16 + zlib.MAX_WBITS
+            self._decoder = zlib.decompressobj(wbits)
+        return self._decoder.decompress(data, max_length)
+
+    def flush(self):
+        return b"" if self._decoder is None else self._decoder.flush()
+
+    @property
+    def eof(self):
+        return self._decoder is None or self._decoder.eof
+
+
+def encodings():
+    """
+      Returns the content encodings accepted by read_body. Brotli is not
+      accepted since its decoder can not bound the output of each call, so
+      a small body could expand to gigabytes before its size is checked.
+
+      :rtype: list
+    """
+    return ["identity", "gzip", "x-gzip", "deflate"]
+
+
+def _decoder(encoding: str):
+    """Returns the decoder of the given content encoding."""
+    if encoding in ("identity", ""):
+        return _Identity()
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        return _Zlib(encoding)
+    raise RequestBodyError(415, f"Unsupported content encoding {encoding}.")
+
+
+def read_body(rfile, length, encoding: str = None,
+              max_length: int = 8 * 1024 * 1024,
+              max_decoded: int = 32 * 1024 * 1024):
+    """
+      Reads a request body chunk by chunk, decompressing each chunk as soon
+      as it is read, and stops as soon as any size limit is exceeded, so a
+      large or malicious body never gets into memory.
+
+      :param rfile: stream of the request.
+      :param length: value of the Content-Length header.
+      :param encoding: value of the Content-Encoding header.
+      :param max_length: maximum amount of bytes of the body, as received.
+      :param max_decoded: maximum amount of bytes of the decompressed body.
+
+      Raises a RequestBodyError if the length is missing (411) or too large
+      (413), the encoding is unsupported (415) or the body is corrupt (400).
+
+      Returns the decompressed body.
+      :rtype: bytes
+    """
+    try:
+        length = int(length)
+    except (TypeError, ValueError):
+        raise RequestBodyError(411, "Content-Length required.")
+    if length < 0:
+        raise RequestBodyError(400, "Invalid Content-Length.")
+    if length > max_length:
+        raise RequestBodyError(413, "Request body too large.")
+
+    decoder = _decoder((encoding or "identity").strip().lower())
+    body = []
+    size = 0
+    remaining = length
+    try:
+        while remaining > 0:
+            chunk = rfile.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise RequestBodyError(400, "Incomplete request body.")
+            remaining -= len(chunk)
+
+            data = decoder.decompress(chunk, max_decoded - size + 1)
+            size += len(data)
+            if size > max_decoded:
+                raise RequestBodyError(413, "Request body too large.")
+            body.append(data)
+
+        data = decoder.flush()
+        size += len(data)
+        if size > max_decoded:
+            raise RequestBodyError(413, "Request body too large.")
+        body.append(data)
+    except zlib.error as e:
+        raise RequestBodyError(400, f"Corrupt request body: {e}")
+
+    if not decoder.eof:
+        raise RequestBodyError(400, "Truncated request body.")
+    return b"".join(body)
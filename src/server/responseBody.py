@@ -0,0 +1,112 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import hashlib
+import zlib
+
+# Smaller bodies are sent uncompressed, since compressing them saves less
+# than the cost of the encoding.
+MIN_COMPRESS_SIZE = 1024
+
+# Compression level of the responses: fast, and still most of the savings
+# of html and json.
+COMPRESS_LEVEL = 5
+
+# Content encodings of the responses, by order of preference.
+ENCODINGS = ("gzip", "deflate")
+
+
+def accepted_encoding(header: str):
+    """
+      Chooses the content encoding of a response from the Accept-Encoding
+      header of the request, e.g., "gzip, deflate;q=0.5". The encodings with
+      q=0 are refused.
+
+      :param header: value of the Accept-Encoding header, or None.
+
+      Returns one of ENCODINGS, or None if the body must not be compressed.
+      :rtype: str
+    """
+    if not header:
+        return None
+    weights = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressor(encoding: str):
+    """
+      Returns a zlib compressor of the given content encoding, whose output
+      is sent as it is produced.
+
+      :param encoding: one of ENCODINGS.
+    """
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, wbits)
+
+
+def compress(body: bytes, encoding: str):
+    """
+      Compresses a whole body.
+
+      :param body: body of the response.
+      :param encoding: one of ENCODINGS.
+
+      :rtype: bytes
+    """
+    encoder = compressor(encoding)
+    return encoder.compress(body) + encoder.flush()
+
+
+def etag(*parts):
+    """
+      Returns a weak entity tag built from the parts that determine a
+      response, e.g., the generation of the index and the query. It is weak
+      since the body may be sent compressed or not.
+
+      :rtype: str
+    """
+    digest = hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def matches(header: str, tag: str):
+    """
+      Checks an If-None-Match header against an entity tag, with the weak
+      comparison that conditional GET requests use.
+
+      :param header: value of the If-None-Match header, or None.
+      :param tag: entity tag of the current response.
+
+      :rtype: bool
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = tag[2:] if tag.startswith("W/") else tag
+    for item in header.split(","):
+        item = item.strip()
+        if item.startswith("W/"):
+            item = item[2:]
+        if item == opaque:
+            return True
+    return False
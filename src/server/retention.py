@@ -0,0 +1,200 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import logging
+import threading
+import time
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DELETED = METRICS.counter(
+    "wer_retention_deleted_total",
+    "Documents deleted by the retention rules.", ("index",))
+RETENTION_RECLAIMED = METRICS.counter(
+    "wer_retention_reclaimed_bytes_total",
+    "Bytes of the index files reclaimed by the retention rules.", ("index",))
+
+# Seconds of each unit accepted by the max_age of a rule.
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600, "w": 7 * 24 * 3600}
+
+
+def parse_age(text: str):
+    """
+      Parses an amount of seconds, optionally followed by a unit of
+      AGE_UNITS, e.g., "90", "12h" or "30d".
+
+      :rtype: float
+    """
+    text = text.strip().lower()
+    if text and text[-1] in AGE_UNITS:
+        return float(text[:-1]) * AGE_UNITS[text[-1]]
+    return float(text)
+
+
+def parse_rule(spec: str):
+    """
+      Parses a retention rule given as NAME:key=value[,key=value...], where
+      NAME is the name of an index, or * for every index without its own
+      rule, and the keys are max_age (see parse_age), max_docs and
+      max_per_domain, e.g., "team1:max_age=30d,max_per_domain=500".
+
+      Returns the tuple (name, rule) where rule is a dictionary with the
+      keys given: max_age, as accepted by Multiindex.expire, and the caps
+      accepted by Multiindex.expired.
+      :rtype: tuple
+    """
+    name, sep, params = spec.partition(":")
+    if not sep or not name.strip():
+        raise ValueError(f"Retention rule without index name: {spec}")
+    rule = {}
+    for param in params.split(","):
+        key, _, value = param.partition("=")
+        key = key.strip()
+        if key == "max_age":
+            rule[key] = parse_age(value)
+        elif key in ("max_docs", "max_per_domain"):
+            rule[key] = int(value)
+        else:
+            raise ValueError(f"Unknown retention parameter {key}.")
+        if rule[key] < 0:
+            raise ValueError(f"Negative retention parameter {key}.")
+    return name.strip(), rule
+
+
+class Retention():
+    """
+      Background expiry of the documents of a Multiindex, bounding the size
+      of the indexes.
+
+      Every interval seconds the documents of each index that exceed its
+      rule are deleted in bulk by the write buffer: those not visited for
+      max_age seconds by a query on their visit time (see
+      Multiindex.expire), then those exceeding the caps (see
+      Multiindex.expired). Each deletion is a single commit per shard that
+      also rewrites the segments holding them, so their space is reclaimed
+      at once (see Multiindex.delete_by_query).
+    """
+
+    def __init__(self, index, write_buffer, rules: dict,
+                 interval: float = 3600.0):
+        """
+          :param index: the Multiindex whose documents expire.
+          :param write_buffer: the WriteBuffer that deletes the documents.
+          :param rules: {indexname: rule} where rule is a dictionary with
+          max_age, max_docs and max_per_domain, see parse_rule. The rule of
+          "*" applies to the indexes without their own rule.
+          :param interval: seconds between the checks.
+        """
+        self._index = index
+        self._write_buffer = write_buffer
+        self._rules = dict(rules)
+        self._interval = interval
+
+        self._lock = threading.Lock()
+        # {indexname: state of its last check, see stats}
+        self._state = {}
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="Retention", daemon=True)
+        self._thread.start()
+
+    def rule(self, indexname: str):
+        """Returns the rule of the index named indexname, or None."""
+        return self._rules.get(indexname, self._rules.get("*"))
+
+    def check(self):
+        """
+          Deletes the documents that exceed the rule of each index.
+
+          Returns the amount of deleted documents.
+          :rtype: int
+        """
+        deleted = 0
+        for indexname in self._index.indexnames():
+            rule = self.rule(indexname)
+            if rule:
+                deleted += self.apply(indexname, rule)
+        return deleted
+
+    def apply(self, indexname: str, rule: dict):
+        """
+          Deletes the documents of the index named indexname that exceed
+          the rule. The deletion is run by the write buffer, and this
+          method waits for it.
+
+          Returns the amount of deleted documents.
+          :rtype: int
+        """
+        start = time.perf_counter()
+        before = sum(shard["bytes"]
+                     for shard in self._index.segments(indexname))
+        deleted = 0
+        if rule.get("max_age") is not None:
+            deleted += self._write_buffer.submit(
+                self._index.expire, indexname, rule["max_age"]).result()
+        expired = self._index.expired(
+            indexname, **{key: value for key, value in rule.items()
+                          if key != "max_age"})
+        if expired:
+            deleted += self._write_buffer.submit(
+                self._index.delete_documents, indexname, expired).result()
+        segments = self._index.segments(indexname)
+        reclaimed = max(0, before - sum(shard["bytes"]
+                                        for shard in segments))
+        RETENTION_DELETED.inc(deleted, index=indexname)
+        RETENTION_RECLAIMED.inc(reclaimed, index=indexname)
+        if deleted:
+            logger.info("Deleted %s expired documents of %s (%s KB)",
+                        deleted, indexname, reclaimed // 1024)
+
+        with self._lock:
+            state = self._state.setdefault(
+                indexname, {"deleted": 0, "bytes_reclaimed": 0})
+            state.update({
+                "rule": rule,
+                "docs": sum(shard["docs"] for shard in segments),
+                "bytes": sum(shard["bytes"] for shard in segments),
+                "deleted": state["deleted"] + deleted,
+                "last_deleted": deleted,
+                "bytes_reclaimed": state["bytes_reclaimed"] + reclaimed,
+                "last_check": time.time(),
+                "last_seconds": time.perf_counter() - start
+            })
+        return deleted
+
+    def stats(self):
+        """
+          Returns a dictionary
+          {indexname: {rule: rule, docs: docs, bytes: bytes,
+                       deleted: deleted, last_deleted: last_deleted,
+                       bytes_reclaimed: bytes_reclaimed,
+                       last_check: last_check, last_seconds: last_seconds}}
+          with the rule of each index checked, its documents and bytes after
+          the last check, the documents deleted and bytes reclaimed in total
+          and by the last check, and the time and duration of the last
+          check.
+          :rtype: dict
+        """
+        with self._lock:
+            return {name: dict(state) for name, state in self._state.items()}
+
+    def close(self):
+        """Stops the background thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        """Checks the indexes every interval seconds."""
+        while not self._stop.wait(self._interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Could not apply the retention rules")
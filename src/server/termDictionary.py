@@ -0,0 +1,136 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+# Maximum amount of completions returned by complete.
+MAX_COMPLETIONS = 50
+
+# Prefixes matching more terms than this keep their best completions, so
+# short prefixes do not scan a large part of the dictionary on each request.
+SCAN_TERMS = 256
+
+# Character greater than any character of a term.
+_LAST = "\U0010ffff"
+
+
+def _rank(item):
+    """Orders the completions by decreasing frequency, then by term."""
+    return -item[1], item[0]
+
+
+class TermDictionary():
+    """
+      In-memory dictionary of the terms of an index and the amount of
+      documents containing each one, sorted so the terms starting with a
+      prefix are found by binary search.
+
+      The completions of the prefixes matching many terms are kept, and
+      updated as documents are added, so every completion takes a binary
+      search and, at most, a scan of SCAN_TERMS terms.
+    """
+
+    def __init__(self, frequencies: dict = None):
+        """
+          :param frequencies: dictionary {term: amount of documents}.
+        """
+        self._lock = threading.Lock()
+        self._frequencies = dict(frequencies or {})
+        self._terms = sorted(self._frequencies)
+        # {prefix: [(term, frequency), ...]} of the prefixes matching more
+        # than SCAN_TERMS terms.
+        self._top = {}
+
+    @classmethod
+    def from_readers(cls, readers, fieldnames):
+        """
+          Builds the dictionary of the terms of the given fields. The
+          deleted documents, e.g., the former versions of the pages, are
+          not counted, so the terms only they hold are left out.
+
+          :param readers: whoosh readers, e.g., one for each shard.
+          :param fieldnames: names of the fields whose terms are kept.
+
+          :rtype: TermDictionary
+        """
+        frequencies = {}
+        for reader in readers:
+            for segment, _ in reader.leaf_readers():
+                deletions = segment.has_deletions()
+                for fieldname in fieldnames:
+                    if fieldname not in segment.indexed_field_names():
+                        continue
+                    for term, info in segment.iter_field(fieldname):
+                        frequency = info.doc_frequency()
+                        if deletions:
+                            # The postings skip the deleted documents.
+                            frequency = sum(1 for _ in segment.postings(
+                                fieldname, term).all_ids())
+                        if frequency:
+                            term = term.decode("utf-8")
+                            frequencies[term] = \
+                                frequencies.get(term, 0) + frequency
+        return cls(frequencies)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, terms):
+        """
+          Adds the terms of a new document.
+
+          :param terms: set of the terms of the document.
+        """
+        with self._lock:
+            for term in terms:
+                frequency = self._frequencies.get(term, 0) + 1
+                self._frequencies[term] = frequency
+                if frequency == 1:
+                    insort(self._terms, term)
+                for i in range(1, len(term) + 1):
+                    top = self._top.get(term[:i])
+                    if top is not None:
+                        self._update_top(top, term, frequency)
+
+    @staticmethod
+    def _update_top(top: list, term: str, frequency: int):
+        """Updates the frequency of term in the best completions top."""
+        for i, (other, _) in enumerate(top):
+            if other == term:
+                del top[i]
+                break
+        else:
+            if len(top) >= MAX_COMPLETIONS and \
+                    _rank((term, frequency)) >= _rank(top[-1]):
+                return
+        top.append((term, frequency))
+        top.sort(key=_rank)
+        del top[MAX_COMPLETIONS:]
+
+    def complete(self, prefix: str, limit: int = 10):
+        """
+          Returns the most frequent terms starting with prefix.
+
+          :param prefix: beginning of the terms, already lowercased.
+          :param limit: maximum amount of terms, at most MAX_COMPLETIONS.
+
+          Returns a list of tuples (term, amount of documents).
+          :rtype: list
+        """
+        limit = min(limit, MAX_COMPLETIONS)
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                lo = bisect_left(self._terms, prefix)
+                hi = bisect_left(self._terms, prefix + _LAST, lo)
+                size = MAX_COMPLETIONS if hi - lo > SCAN_TERMS else limit
+                top = heapq.nsmallest(
+                    size, ((term, self._frequencies[term])
+                           for term in self._terms[lo:hi]), key=_rank)
+                if hi - lo > SCAN_TERMS:
+                    self._top[prefix] = top
+            return top[:limit]
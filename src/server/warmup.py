@@ -0,0 +1,146 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import logging
+import threading
+import time
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SECONDS = METRICS.histogram(
+    "wer_warmup_seconds",
+    "Seconds spent warming up the indexes at startup, by step: index, "
+    "query and total.", ("step",))
+
+
+class Warmup():
+    """
+      Warms up the indexes of a Multiindex in background when the server
+      starts, so its first searches are as fast as the later ones.
+
+      Each index is opened and its segment files are read into the page
+      cache of the OS, its in-memory structures are loaded (see
+      Multiindex.warm) and then the warm-up queries are searched in it.
+      Until it finishes, the server reports itself as warming, so a load
+      balancer sends the traffic to the nodes already warm.
+
+      The time from the start until the warm-up finishes and the latency of
+      the warm-up queries, the first of which is the first search of the
+      server, are kept in stats and in the wer_warmup_seconds metric.
+    """
+
+    def __init__(self, index, queries=(), preload: bool = True,
+                 ranking: str = "bm25", terms: bool = False):
+        """
+          :param index: the Multiindex to warm up.
+          :param queries: queries searched in each index once it is loaded.
+          :param preload: if True, the files of the segments are read.
+          :param ranking: ranking of the warm-up queries, see
+          indexHandler.RANKINGS.
+          :param terms: if True, the term dictionaries of the suggestions
+          are built too.
+        """
+        self._index = index
+        self._queries = list(queries)
+        self._preload = preload
+        self._terms = terms
+        self._ranking = ranking
+
+        self._lock = threading.Lock()
+        self.indexes = 0
+        self.bytes = 0
+        self.seconds = None
+        # Seconds of each warm-up query, in the order they were run.
+        self.query_seconds = []
+
+        self._start = time.perf_counter()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="Warmup", daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self):
+        """Whether the warm-up finished."""
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None):
+        """
+          Waits until the warm-up finishes.
+
+          :param timeout: maximum amount of seconds to wait. By default,
+          it waits forever.
+
+          Returns True if the warm-up finished.
+          :rtype: bool
+        """
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        """Warms up every index, then marks the warm-up as finished."""
+        try:
+            for indexname in self._index.indexnames():
+                self.warm(indexname)
+        except Exception:
+            logger.exception("Could not warm up the indexes")
+        finally:
+            self.seconds = time.perf_counter() - self._start
+            WARMUP_SECONDS.observe(self.seconds, step="total")
+            self._ready.set()
+            logger.info("Warmed up %s indexes (%s MB read) in %.2f s",
+                        self.indexes, self.bytes // (1024 * 1024),
+                        self.seconds)
+
+    def warm(self, indexname: str):
+        """
+          Warms up the index named indexname, then searches the warm-up
+          queries in it.
+
+          :param indexname: name of the index.
+        """
+        start = time.perf_counter()
+        size = self._index.warm(indexname, preload=self._preload,
+                                terms=self._terms)
+        WARMUP_SECONDS.observe(time.perf_counter() - start, step="index")
+        with self._lock:
+            self.indexes += 1
+            self.bytes += size
+
+        for query in self._queries:
+            start = time.perf_counter()
+            self._index.search_page(indexname, query, snippets=True,
+                                    ranking=self._ranking)
+            seconds = time.perf_counter() - start
+            WARMUP_SECONDS.observe(seconds, step="query")
+            with self._lock:
+                self.query_seconds.append(seconds)
+
+    def stats(self):
+        """
+          Returns a dictionary
+          {status: status, indexes: indexes, bytes: bytes, seconds: seconds,
+           queries: queries, first_query_seconds: first,
+           last_query_seconds: last}
+          where status is "warming" or "ready", seconds is the time from the
+          start until the warm-up finished (None while warming) and first
+          and last are the latencies of the first and last warm-up queries.
+          :rtype: dict
+        """
+        with self._lock:
+            queries = list(self.query_seconds)
+            return {
+                "status": "ready" if self.ready else "warming",
+                "indexes": self.indexes,
+                "bytes": self.bytes,
+                "seconds": self.seconds,
+                "queries": len(queries),
+                "first_query_seconds": queries[0] if queries else None,
+                "last_query_seconds": queries[-1] if queries else None
+            }
@@ -3,15 +3,36 @@ __version__ = "1.0.0"
 __email__ = "mbianchetti@dc.uba.ar"
 __status__ = "Testing"
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, \
+    ThreadingHTTPServer
 from cgi import parse_header, parse_multipart
 from urllib.parse import parse_qs
 from pprint import pformat
 import json
-from functools import partial
+from contextlib import contextmanager
+from functools import partial, wraps
+import argparse
+import logging
+import os
+import time
 
-from indexHandler import Multiindex
+from analysis import ANALYZERS
+from indexHandler import BASEPATH, RANKINGS, Multiindex, content_hash, \
+    is_digest
+from mergeScheduler import MergeScheduler
+from metrics import METRICS
+from normalizer import normalize_text
+from preforkServer import PreforkServer, WriterService
+from profiler import SlowRequestProfiler
+from requestBody import RequestBodyError, read_body
+from responseBody import MIN_COMPRESS_SIZE, accepted_encoding, compress, \
+    compressor, etag, matches
+from queryCache import QueryCache
 from render import Render
+from retention import Retention, parse_rule
+from writeAheadLog import WriteAheadLog
+from warmup import Warmup
+from writeBuffer import WriteBuffer
 
 import base64
 
@@ -38,35 +59,209 @@ B64 = base64.b64encode(f"{USER}:{PASS}".encode("UTF-8"))
 CREDENTIALS = f'Basic {B64.decode(encoding="UTF-8")}'
 
 
+def valid_indexname(name):
+    """
+      Checks whether name can be used as the name of an index, i.e., it is
+      a non-empty alphanumeric string of at most 64 characters.
+
+      :param name: name to check.
+
+      :rtype: bool
+    """
+    return isinstance(name, str) and name.isalnum() and len(name) <= 64
+
+
+# Amount of results shown by /search if no pagesize is requested, and
+# maximum pagesize allowed.
+DEFAULT_PAGESIZE = 20
+MAX_PAGESIZE = 100
+
+# Amount of completions returned by /suggest if no limit is requested, and
+# maximum limit allowed.
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+# Maximum amount of hashes checked by a /exists request.
+MAX_EXISTS = 1000
+
+# Minimum amount of bytes sent by each write of a streamed response.
+STREAM_CHUNK_SIZE = 16 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Paths whose requests are measured separately. Any other path is measured
+# as 'other'.
+ROUTES = ('/available', '/search', '/api/search', '/suggest', '/stats',
+          '/metrics', '/favicon.ico', '/store/batch', '/store', '/exists',
+          '/newindex')
+
+REQUEST_SECONDS = METRICS.histogram(
+    'wer_request_seconds', 'Seconds spent serving each request.',
+    ('route', 'method'))
+PHASE_SECONDS = METRICS.histogram(
+    'wer_request_phase_seconds',
+    'Seconds spent by each request in each phase: auth, parse, dedup, '
+    'log, commit, wait, search, render, compress and write.',
+    ('route', 'phase'))
+REQUESTS = METRICS.counter(
+    'wer_requests_total', 'Requests served by response code.',
+    ('route', 'method', 'code'))
+BODY_BYTES = METRICS.counter(
+    'wer_request_body_bytes_total',
+    'Bytes of the request bodies, as received and once decompressed.',
+    ('encoding', 'stage'))
+TEXT_CHARS = METRICS.counter(
+    'wer_text_chars_total',
+    'Characters of the stored texts, as received and once normalized.',
+    ('stage',))
+
+
+def route(path: str):
+    """
+      Returns the route of ROUTES that serves path, or 'other'.
+
+      :param path: path of a request.
+
+      :rtype: str
+    """
+    for prefix in ROUTES:
+        if path.startswith(prefix):
+            return prefix
+    return 'other'
+
+
+def timed(method):
+    """
+      Decorates a do_* method of WERRequestHandler so the latency of each
+      request and of its phases are recorded in METRICS, and slow requests
+      are profiled if the handler has a profiler.
+    """
+    @wraps(method)
+    def wrapper(self):
+        self._phases = {}
+        self._status = None
+        name = route(self.path)
+        start = time.perf_counter()
+        try:
+            if self._profiler is None:
+                method(self)
+            else:
+                with self._profiler.profile(f'{self.command} {name}'):
+                    method(self)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    route=name, method=self.command)
+            REQUESTS.inc(route=name, method=self.command, code=self._status)
+            for phase, seconds in self._phases.items():
+                PHASE_SECONDS.observe(seconds, route=name, phase=phase)
+    return wrapper
+
+
 class WERRequestHandler(BaseHTTPRequestHandler):
     """This class handles HTTP request for the WER service."""
 
-    def __init__(self, ix_path, default_idx, *args, **kwargs):
+    # The headers and the body are written separately, so with Nagle's
+    # algorithm a reused connection would wait for the delayed ACK of the
+    # client on each response.
+    disable_nagle_algorithm = True
+
+    def __init__(self, ix_path, default_idx, *args, write_buffer=None,
+                 merge_scheduler=None, profiler=None, wal=None,
+                 wal_wait: float = 5.0,
+                 max_body: int = 8 * 1024 * 1024,
+                 max_content: int = 32 * 1024 * 1024,
+                 max_text: int = 200000, normalize: bool = True,
+                 keep_alive: bool = True, idle_timeout: float = 15.0,
+                 max_requests: int = 100, ranking: str = 'bm25', visit=None,
+                 visit_many=None, warmup=None, retention=None, **kwargs):
         self._ix_path = ix_path
-        self._index = Multiindex(self._ix_path)
+        self._index = Multiindex.shared(self._ix_path)
+        # Record the revisits, see Multiindex.visit and visit_many. The
+        # workers of a PreforkServer record them in the writer process.
+        self._visit = visit or self._index.visit
+        self._visit_many = visit_many or self._index.visit_many
         self._default_idx = default_idx
         self._render = Render()
+        self._write_buffer = write_buffer
+        self._merge_scheduler = merge_scheduler
+        self._profiler = profiler
+        self._wal = wal
+        self._wal_wait = wal_wait
+        self._max_body = max_body
+        self._max_content = max_content
+        self._max_text = max_text
+        self._normalize = normalize
+        self._ranking = ranking
+        self._warmup = warmup
+        self._retention = retention
+        # Seconds spent by the current request in each phase.
+        self._phases = {}
+        self._status = None
+
+        # With HTTP/1.1 the connection is kept open between requests until
+        # it is idle for idle_timeout seconds or it served max_requests.
+        self.protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+        self.timeout = idle_timeout
+        self._max_requests = max_requests
+        self._requests = 0
 
         # BaseHTTPRequestHandler calls do_GET **inside** __init__ !!!
         # So we have to call super().__init__ after setting attributes.
         super().__init__(*args, **kwargs)
 
+    def handle_one_request(self):
+        """Serves a request, and counts it within the connection."""
+        super().handle_one_request()
+        self._requests += 1
+
+    def send_response(self, code, message=None):
+        """Sends the response code, and keeps it for the metrics. The last
+          response allowed in the connection closes it."""
+        self._status = code
+        super().send_response(code, message)
+        if self._max_requests and self._requests + 1 >= self._max_requests:
+            self.send_header('Connection', 'close')
+
+    def send_empty(self, code: int):
+        """Returns a response without body.
+
+          :param code: response code.
+        """
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Logs the requests through the logging module."""
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    @contextmanager
+    def _phase(self, name: str):
+        """Measures the time spent in a phase of the current request.
+
+          :param name: name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_phase(name, time.perf_counter() - start)
+
+    def _add_phase(self, name: str, seconds: float):
+        """Adds seconds to the time spent in a phase of the request."""
+        self._phases[name] = self._phases.get(name, 0.0) + seconds
+
     def do_return_error(self, code: int = 500, message: str = None):
         """Returns an error response
 
           :param code: error code.
           :param message: error message.
         """
-        self.send_response(code)
-
         if message:
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(message.encode('utf-8'))
+            self.do_return_body(code, 'text/html', message.encode('utf-8'))
 
         else:
-            self.end_headers()
-        pass
+            self.send_empty(code)
 
     def do_available(self):
         """
@@ -74,13 +269,17 @@ class WERRequestHandler(BaseHTTPRequestHandler):
 
           Returns true if the server is running and,, if '/index' is appended
           to the path, it also checks whether the index exists.
+
+          While the indexes are warmed up after the start, see Warmup, the
+          status is WARMING and the response code 503, so a load balancer
+          does not send searches to the server yet.
         """
         path = self.path
         subpaths = path.split('/')
 
         if len(subpaths) not in [2, 3]:
             self.do_return_error(code=400)
-            pass
+            return
 
         msg = "Index available."
         status = "AVAILABLE"
@@ -93,164 +292,702 @@ class WERRequestHandler(BaseHTTPRequestHandler):
         if not ret:
             msg = "Index not available."
             status = "UNAVAILABLE"
+        elif self._warmup is not None and not self._warmup.ready:
+            body = json.dumps({'message': "Index warming up.",
+                               'status': "WARMING"}).encode('utf-8')
+            self.do_return_body(503, 'text/html', body,
+                                headers={'Retry-After': '1'})
+            return
 
-        body = json.dumps({'message': msg, 'status': status})
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(body.encode('utf-8'))
-        pass
+        body = json.dumps({'message': msg, 'status': status}).encode('utf-8')
+        tag = etag('available', body)
+        if self._not_modified(tag):
+            return
+        self.do_return_body(200, 'text/html', body, tag=tag)
 
     def do_search(self):
-        """Handles the /search request."""
+        """
+          Handles the /search request.
+
+          Besides the query q, it accepts the number of the page of results
+          to show and its size, e.g., /search/q=word&page=2&pagesize=20, and
+          the comma-separated names of the indexes to search, e.g.,
+          &index=team1,team2. By default, it searches the default index.
+          With &rank=recency the results visited recently and often are
+          favoured, see Multiindex.search_page. With &seq=N, it first waits
+          until the document stored with the sequence number N is indexed,
+          see _search_params.
+
+          The response has an ETag derived from the generation of the
+          indexes and the query, so a repeated request with If-None-Match
+          gets a 304 without searching nor rendering.
+        """
+        params = self._search_params()
+        if params is None:
+            return
+        word, page, pagesize, indexnames, ranking = params
+
+        logger.debug("Searching %s", word)
+
+        # The rendered page is cached until the indexes change.
+        cache = self._index.cache
+        cachename = ','.join(indexnames)
+        generation = self._index.generation(indexnames)
+        key = ('html', ' '.join(word.split()), page, pagesize, ranking)
+        if ranking == 'recency':
+            key += (self._index.visits_version(),)
+        tag = etag(cachename, generation, key)
+        if self._not_modified(tag):
+            return
+        body = cache.get(cachename, generation, key)
+        if body is not None:
+            self.do_return_body(200, 'text/html', body, tag=tag)
+            return
+
+        try:
+            with self._phase('search'):
+                res = self._index.search_page(
+                    indexnames, word, page, pagesize, ranking=ranking)
+
+        except Exception:
+            logger.exception("Could not search %s", word)
+            self.do_return_error(code=500)
+            return
+
+        chunks = self._render.iter_list_response(
+            res['results'], query=word, page=page,
+            pagesize=pagesize, total=res['total'], index=cachename,
+            ranking=ranking)
+        body = self.do_return_stream(200, 'text/html', chunks, tag=tag)
+        cache.put(cachename, generation, key, body, len(body))
+
+    def do_api_search(self):
+        """
+          Handles the /api/search request.
+
+          Accepts the same parameters as /search, and returns a json with
+          the total amount of matches and, for each result of the page, its
+          url, title, score and the highlighted fragments of its content
+          that match the query. Like /search, it answers 304 to a request
+          whose If-None-Match has the current ETag.
+        """
+        params = self._search_params()
+        if params is None:
+            return
+        word, page, pagesize, indexnames, ranking = params
+
+        cachename = ','.join(indexnames)
+        key = ('api', word, page, pagesize, ranking)
+        if ranking == 'recency':
+            key += (self._index.visits_version(),)
+        tag = etag(cachename, self._index.generation(indexnames), key)
+        if self._not_modified(tag):
+            return
+
+        try:
+            with self._phase('search'):
+                res = self._index.search_page(
+                    indexnames, word, page, pagesize, snippets=True,
+                    ranking=ranking)
+
+        except Exception:
+            logger.exception("Could not search %s", word)
+            self.do_return_error(code=500)
+            return
+
+        self.do_return_json(200, dict(res, query=word), tag=tag)
+
+    def do_suggest(self):
+        """
+          Handles the /suggest request.
+
+          Completes the last word of the query q with the most frequent
+          terms of the index, e.g., /suggest/q=red%20app&limit=5, which are
+          kept in memory, see Multiindex.suggest. It accepts the name of the
+          index to complete from, e.g., &index=team1.
+
+          Returns a json with the query and, for each completion, the query
+          completed, the term and the amount of documents containing it.
+        """
+        subpaths = self.path.split('/')
+        params = parse_qs(subpaths[-1]) if len(subpaths) == 3 else {}
+        if len(params.get('q', [])) != 1:
+            self.do_return_error(code=400)
+            return
+
+        try:
+            limit = int(params.get('limit', [DEFAULT_SUGGESTIONS])[0])
+        except ValueError:
+            limit = 0
+        indexname = params.get('index', [self._default_idx])[0]
+        if not 1 <= limit <= MAX_SUGGESTIONS or \
+                not valid_indexname(indexname):
+            self.do_return_error(code=400)
+            return
+
+        word = params['q'][0]
+        with self._phase('search'):
+            suggestions = self._index.suggest(indexname, word, limit)
+        self.do_return_json(200, {'query': word,
+                                  'suggestions': suggestions})
+
+    def _search_params(self):
+        """
+          Parses the query, the page, the page size, the indexes and the
+          ranking of a search request. If they are not valid, it returns an
+          error response.
+
+          Returns the tuple (query, page, pagesize, indexnames, ranking) or
+          None if the request is not valid.
+          :rtype: tuple
+        """
         path = self.path
         subpaths = path.split('/')
 
-        if len(subpaths) != 3:
+        if len(subpaths) != 3 and \
+                not (len(subpaths) == 4 and subpaths[1] == 'api'):
             self.do_return_error(code=400)
-            pass
+            return None
 
         word = parse_qs(subpaths[-1])
         if 'q' not in word or word['q'] == []\
                 or len(word['q']) > 1:
             self.do_return_error(code=400)
-            pass
+            return None
 
-        print(" > Searching", word['q'][0])
         try:
-            res = self._index.search_word(self._default_idx, word['q'][0])
-            if res is False:
-                self.do_return_error(code=500)
-                pass
+            page = int(word.get('page', [1])[0])
+            pagesize = int(word.get('pagesize', [DEFAULT_PAGESIZE])[0])
+        except ValueError:
+            page = pagesize = 0
+        if page < 1 or not 1 <= pagesize <= MAX_PAGESIZE:
+            self.do_return_error(code=400)
+            return None
 
-        except Exception as e:
-            print(e)
-            self.do_return_error(code=500)
-            pass
+        indexnames = [name for value in word.get('index', [])
+                      for name in value.split(',')]
+        indexnames = indexnames or [self._default_idx]
+        if not all(map(valid_indexname, indexnames)):
+            self.do_return_error(code=400)
+            return None
 
-        print("Result:", [r for r in res])
-        body = self._render.build_list_response(res)
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        ranking = word.get('rank', [self._ranking])[0]
+        if ranking not in RANKINGS:
+            self.do_return_error(code=400)
+            return None
+
+        # Read-your-writes: the search waits, at most wal_wait seconds,
+        # until the document stored with the sequence number seq is indexed.
+        if 'seq' in word and self._wal is not None:
+            try:
+                seq = int(word['seq'][0])
+            except ValueError:
+                self.do_return_error(code=400)
+                return None
+            with self._phase('wait'):
+                self._wal.wait(seq, self._wal_wait)
+
+        return word['q'][0], page, pagesize, sorted(set(indexnames)), ranking
+
+    def do_return_stream(self, code: int, ctype: str, chunks,
+                         tag: str = None):
+        """Returns a response whose body is written while it is generated.
+
+          If the connection speaks HTTP/1.1 the body is sent with chunked
+          transfer encoding, otherwise the end of the body is given by the
+          end of the connection. If the client accepts it, the body is
+          compressed while it is written.
+
+          :param code: response code.
+          :param ctype: content type of the body.
+          :param chunks: iterable of strings that compose the body.
+          :param tag: entity tag of the body, if any.
+
+          Returns the whole body that was sent, uncompressed.
+          :rtype: bytes
+        """
+        chunked = self.protocol_version >= 'HTTP/1.1' and \
+            self.request_version >= 'HTTP/1.1'
+        encoding = accepted_encoding(self.headers.get('Accept-Encoding'))
+        encoder = compressor(encoding) if encoding else None
+        start = time.perf_counter()
+        writing = 0.0
+
+        self.send_response(code)
+        self.send_header('Content-type', ctype)
+        self._send_cache_headers(encoding, tag)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            # Without a length, the client reads the body until the
+            # connection is closed, even if it asked to keep it alive.
+            self.close_connection = True
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(body.encode('utf-8'))
-        pass
+
+        def write(data):
+            nonlocal writing
+            if encoder is not None:
+                data = encoder.compress(data)
+                if not data:
+                    return
+            write_start = time.perf_counter()
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+            writing += time.perf_counter() - write_start
+
+        # Small pieces are grouped so each write sends a reasonable amount
+        # of bytes.
+        body = []
+        pending = []
+        size = 0
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            pending.append(data)
+            size += len(data)
+            if size >= STREAM_CHUNK_SIZE:
+                body.append(b''.join(pending))
+                write(body[-1])
+                pending = []
+                size = 0
+        if size:
+            body.append(b''.join(pending))
+            write(body[-1])
+        if encoder is not None:
+            data = encoder.flush()
+            encoder = None
+            write(data)
+
+        if chunked:
+            write_start = time.perf_counter()
+            self.wfile.write(b'0\r\n\r\n')
+            writing += time.perf_counter() - write_start
+
+        # The chunks are rendered while they are written.
+        self._add_phase('render', time.perf_counter() - start - writing)
+        self._add_phase('write', writing)
+        return b''.join(body)
+
+    def do_return_body(self, code: int, ctype: str, body: bytes,
+                       headers: dict = None, tag: str = None):
+        """Returns a response whose whole body is already known. If the
+          client accepts it and the body is large enough, it is compressed.
+
+          :param code: response code.
+          :param ctype: content type of the body.
+          :param body: encoded body.
+          :param headers: other headers of the response.
+          :param tag: entity tag of the body, if any.
+        """
+        encoding = None
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encoding = accepted_encoding(self.headers.get('Accept-Encoding'))
+            if encoding is not None:
+                with self._phase('compress'):
+                    body = compress(body, encoding)
+
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-type', ctype)
+        self._send_cache_headers(encoding, tag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        with self._phase('write'):
+            self.wfile.write(body)
+
+    def _send_cache_headers(self, encoding: str, tag: str):
+        """Sends the content encoding and the entity tag of a response.
+
+          :param encoding: content encoding of the body, or None.
+          :param tag: entity tag of the body, or None.
+        """
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if tag is not None:
+            # The clients may keep the response, but must revalidate it.
+            self.send_header('ETag', tag)
+            self.send_header('Cache-Control', 'no-cache')
+        if encoding is not None or tag is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+
+    def _not_modified(self, tag: str):
+        """Answers 304 if the client already has the current response.
+
+          :param tag: entity tag of the current response.
+
+          Returns True if the 304 was sent.
+          :rtype: bool
+        """
+        if not matches(self.headers.get('If-None-Match'), tag):
+            return False
+        self.send_response(304)
+        self.send_header('ETag', tag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        return True
+
+    def do_stats(self):
+        """
+          Handles the /stats request.
+
+          Returns a json with the counters of the cache of search results,
+          the documents and bytes pending in the write buffer, the sequence
+          numbers of the write-ahead log, the progress of the warm-up, the
+          snapshots of the indexes kept in memory, the documents deleted and
+          bytes reclaimed by the retention rules and, if the segments are
+          merged in background, the segments of each index and the merge
+          timings.
+        """
+        stats = {'cache': self._index.cache.stats()}
+        if self._write_buffer is not None:
+            stats['buffer'] = {
+                'docs': len(self._write_buffer),
+                'bytes': self._write_buffer.pending_bytes()
+            }
+        if self._wal is not None:
+            stats['wal'] = self._wal.stats()
+        if self._warmup is not None:
+            stats['warmup'] = self._warmup.stats()
+        snapshots = self._index.snapshot_stats()
+        if snapshots['indexes']:
+            stats['snapshots'] = snapshots
+        if self._retention is not None:
+            stats['retention'] = self._retention.stats()
+        if self._merge_scheduler is not None:
+            stats.update(self._merge_scheduler.stats())
+        self.do_return_json(200, stats)
+
+    def do_metrics(self):
+        """
+          Handles the /metrics request.
+
+          Returns the latency histograms of the requests and of their
+          phases, and the request counters, in the Prometheus text format.
+        """
+        body = METRICS.render().encode('utf-8')
+        self.do_return_body(200, 'text/plain; version=0.0.4', body)
 
     def do_store(self, postvars: dict):
         """Saves the document in the index _index
 
           :param postvars: dictionary with the url title and text of the
-          document to be added.
+          document to be added, and optionally the hash of the url and text
+          and the name of the index in which to store it.
         """
-        res = self._index.add_document(
-            self._default_idx, postvars['url'],
-            postvars['title'],
-            postvars['text']
-        )
+        indexname = postvars.get('index', self._default_idx)
+        document = self._document(postvars)
+        # A revisit of an unchanged page only records the visit.
+        with self._phase('dedup'):
+            stored = self._visit(indexname, document['url'],
+                                 document['hash'])
+        if stored:
+            self.do_return_json(200, {'message': 'Already stored'})
+            return
+
+        if self._wal is not None:
+            # The document is durable once it is logged, and it is
+            # committed later on by the write buffer.
+            with self._phase('log'):
+                seqs = self._wal.append(indexname, [document])
+            self.do_return_json(202, {'message': 'Queued', 'seq': seqs[-1]})
+            return
+
+        if self._write_buffer is not None:
+            # The document is committed later on, together with the
+            # documents received by other requests.
+            self._write_buffer.add_many(indexname, [document])
+            self.do_return_json(202, {'message': 'Queued'})
+            return
+
+        with self._phase('commit'):
+            res = self._index.add_documents(indexname, [document])
         if not res:
             self.do_return_error(code=500)
-            pass
+            return
 
-        data = {'message': 'Saved'}
-        body = json.dumps(data)
+        self.do_return_json(200, {'message': 'Saved'})
 
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Credentials', 'true')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(body.encode('utf-8'))
-        pass
+    def do_exists(self, postvars: dict):
+        """Checks which pages the index already holds, by their hash.
+
+          :param postvars: dictionary with the list of hashes of the url
+          and text of each page, and optionally the list of their urls and
+          the name of the index. If the urls are given, the visit of each
+          page held is recorded, as /store does.
+
+          Returns a json with a bool for each hash.
+        """
+        indexname = postvars.get('index', self._default_idx)
+        hashes = postvars['hashes']
+        with self._phase('dedup'):
+            if 'urls' in postvars:
+                # A single call, which is a single round trip to the writer
+                # from a worker process.
+                exists = self._visit_many(indexname, postvars['urls'], hashes)
+            else:
+                exists = self._index.contains_many(indexname, hashes)
+        self.do_return_json(200, {'exists': exists})
+
+    def do_store_batch(self, postvars):
+        """Saves several documents in the index _index
+
+          :param postvars: list of dictionaries with the url title and text
+          of each document to be added, and optionally their hash and the
+          name of the index in which to store them.
+        """
+        batches = {}
+        for doc in postvars:
+            indexname = doc.get('index', self._default_idx)
+            batches.setdefault(indexname, []).append(self._document(doc))
+
+        if self._wal is not None:
+            seq = None
+            with self._phase('log'):
+                for indexname, documents in batches.items():
+                    seq = self._wal.append(indexname, documents)[-1]
+            self.do_return_json(202, {'message': 'Queued',
+                                      'count': len(postvars), 'seq': seq})
+            return
 
-    def do_AUTHHEAD(self):
+        if self._write_buffer is not None:
+            for indexname, documents in batches.items():
+                self._write_buffer.add_many(indexname, documents)
+            self.do_return_json(
+                202, {'message': 'Queued', 'count': len(postvars)})
+            return
+
+        with self._phase('commit'):
+            res = all([self._index.add_documents(indexname, documents)
+                       for indexname, documents in batches.items()])
+        if not res:
+            self.do_return_error(code=500)
+            return
+
+        self.do_return_json(
+            200, {'message': 'Saved', 'count': len(postvars)})
+
+    def _document(self, postvars: dict):
+        """Builds the document to add to the index from the request,
+          normalizing its text (see normalize_text).
+
+          :param postvars: dictionary with the url title and text of the
+          document, and optionally the hash of the url and text.
+
+          :rtype: dict
+        """
+        # The hash is computed from the text as sent, like the extension
+        # does, so both agree on it.
+        text = postvars['text']
+        digest = postvars.get('hash')
+        if is_digest(digest):
+            digest = digest.lower()
+        else:
+            digest = content_hash(postvars['url'], text)
+
+        if self._normalize:
+            TEXT_CHARS.inc(len(text), stage='received')
+            text = normalize_text(text, self._max_text)
+            TEXT_CHARS.inc(len(text), stage='normalized')
+
+        return {
+            'url': postvars['url'],
+            'title': postvars['title'],
+            'content': text,
+            'hash': digest
+        }
+
+    def do_return_json(self, code: int, data, tag: str = None):
+        """Returns a json response allowing cross-origin requests.
+
+          :param code: response code.
+          :param data: object to serialize as the response body.
+          :param tag: entity tag of the body, if any.
+        """
+        with self._phase('render'):
+            body = json.dumps(data).encode('utf-8')
+
+        self.do_return_body(code, 'application/json', body, headers={
+            'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Allow-Origin': '*'
+        }, tag=tag)
+
+    def do_AUTHHEAD(self, message: str = ''):
+        body = message.encode('utf-8')
         self.send_response(401)
         self.send_header('WWW-Authenticate', 'Basic realm=\"Test\"')
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
+        self.wfile.write(body)
 
+    @timed
     def do_GET(self):
         """Handles GET requests."""
         path = self.path
         if (not isinstance(path, bytes) and not isinstance(path, str)):
             self.do_return_error(code=442)
-            pass
+            return
 
-        auth = self.headers.get('Authorization')
+        with self._phase('auth'):
+            auth = self.headers.get('Authorization')
+            authorized = auth == CREDENTIALS
 
         if auth is None:
-            self.do_AUTHHEAD()
-            self.wfile.write('no auth header received'.encode('utf-8'))
-            pass
+            self.do_AUTHHEAD('no auth header received')
 
-        elif auth == CREDENTIALS:
+        elif authorized:
             if path.startswith('/available'):
                 self.do_available()
 
             elif path.startswith('/search'):
                 self.do_search()
 
+            elif path.startswith('/api/search'):
+                self.do_api_search()
+
+            elif path.startswith('/suggest'):
+                self.do_suggest()
+
+            elif path.startswith('/stats'):
+                self.do_stats()
+
+            elif path.startswith('/metrics'):
+                self.do_metrics()
+
             elif path.startswith('/favicon.ico'):
-                self.send_response(200)
-                self.end_headers()
-                pass
+                self.send_empty(200)
 
             else:
                 self.do_return_error(code=403)
         else:
-            self.do_AUTHHEAD()
-            self.wfile.write(auth.encode('utf-8'))
-            self.wfile.write('not authenticated'.encode('utf-8'))
-            pass
+            self.do_AUTHHEAD(auth + 'not authenticated')
 
+    @timed
     def do_POST(self):
         """Handles POST requests."""
         ctype, _ = parse_header(self.headers.get('content-type'))
         path = self.path
         postvars = {}
 
-        auth = self.headers.get('Authorization')
+        with self._phase('auth'):
+            auth = self.headers.get('Authorization')
+            authorized = auth == CREDENTIALS
 
         if auth is None:
-            self.do_AUTHHEAD()
-            self.wfile.write('no auth header received'.encode('utf-8'))
-            pass
+            self.close_connection = True
+            self.do_AUTHHEAD('no auth header received')
 
-        elif auth == CREDENTIALS:
+        elif authorized:
             if ctype == 'application/json':
                 try:
-                    length = int(self.headers.get('content-length'))
-                    bytes_val = self.rfile.read(length)
-                    my_json = bytes_val.decode('utf8')
-                    postvars = json.loads(my_json)
-                except Exception as e:
-                    print(e)
+                    with self._phase('parse'):
+                        length = self.headers.get('content-length')
+                        encoding = self.headers.get(
+                            'content-encoding', 'identity')
+                        bytes_val = read_body(
+                            self.rfile, length, encoding,
+                            max_length=self._max_body,
+                            max_decoded=self._max_content)
+                        BODY_BYTES.inc(int(length), encoding=encoding,
+                                       stage='received')
+                        BODY_BYTES.inc(len(bytes_val), encoding=encoding,
+                                       stage='decoded')
+                        my_json = bytes_val.decode('utf8')
+                        postvars = json.loads(my_json)
+                except RequestBodyError as e:
+                    logger.warning("Rejected request body: %s", e)
+                    # The rest of the body is not read, so the connection
+                    # can not be reused.
+                    self.close_connection = True
+                    self.do_return_error(code=e.code)
+                    return
+                except Exception:
+                    logger.exception("Could not parse the request body")
+                    self.close_connection = True
                     self.do_return_error(code=500)
+                    return
+
+                if path.startswith('/store/batch'):
+                    if not isinstance(postvars, list) or not all(
+                            isinstance(doc, dict) and
+                            {'url', 'text', 'title'} <= doc.keys() and
+                            ('index' not in doc or
+                             valid_indexname(doc['index']))
+                            for doc in postvars):
+                        self.do_return_error(code=400)
+                        return
+                    try:
+                        self.do_store_batch(postvars)
+                    except Exception:
+                        logger.exception("Could not store the documents")
+                        self.do_return_error(code=500)
 
-                if path.startswith('/store'):
-                    if not postvars or 'url' not in postvars.keys() or \
+                elif path.startswith('/store'):
+                    if not isinstance(postvars, dict) or \
+                            'url' not in postvars.keys() or \
                             'text' not in postvars.keys() or \
-                            'title' not in postvars.keys():
+                            'title' not in postvars.keys() or \
+                            ('index' in postvars and
+                             not valid_indexname(postvars['index'])):
                         self.do_return_error(code=400)
-                        pass
+                        return
                     try:
                         self.do_store(postvars)
-                    except Exception as e:
-                        print(e)
+                    except Exception:
+                        logger.exception("Could not store the document")
                         self.do_return_error(code=500)
 
-                if path.startswith('/newindex'):
-                    if self._index.createIx(self._default_idx):
-                        self.send_response(201)
+                elif path.startswith('/exists'):
+                    hashes = urls = []
+                    if isinstance(postvars, dict):
+                        hashes = postvars.get('hashes')
+                        urls = postvars.get('urls', hashes)
+                    if not isinstance(hashes, list) or \
+                            not isinstance(urls, list) or \
+                            not 0 < len(hashes) <= MAX_EXISTS or \
+                            len(urls) != len(hashes) or \
+                            not all(isinstance(v, str)
+                                    for v in hashes + urls) or \
+                            ('index' in postvars and
+                             not valid_indexname(postvars['index'])):
+                        self.do_return_error(code=400)
+                        return
+                    self.do_exists(postvars)
+
+                elif path.startswith('/newindex'):
+                    indexname = self._default_idx
+                    analyzer = None
+                    if isinstance(postvars, dict):
+                        indexname = postvars.get('index', indexname)
+                        analyzer = postvars.get('analyzer')
+                    if not valid_indexname(indexname) or \
+                            analyzer not in (None,) + ANALYZERS:
+                        self.do_return_error(code=400)
+                        return
+
+                    if self._write_buffer is not None:
+                        created = self._write_buffer.submit(
+                            self._index.createIx, indexname, False,
+                            analyzer).result()
                     else:
-                        self.send_response(200)
-                    self.end_headers()
-                    pass
+                        created = self._index.createIx(
+                            indexname, analyzer=analyzer)
+
+                    self.send_empty(201 if created else 200)
+
+                else:
+                    self.do_return_error(code=403)
             else:
+                # The body is not read, so the connection can not be reused.
+                self.close_connection = True
                 self.do_return_error(code=406)
         else:
-            self.do_AUTHHEAD()
-            self.wfile.write(self.headers.get('Authorization'))
-            self.wfile.write('not authenticated'.encode('utf-8'))
-            pass
+            self.close_connection = True
+            self.do_AUTHHEAD(auth + 'not authenticated')
 
     def do_OPTIONS(self):
         """Handles OPTIONS request."""
@@ -258,10 +995,211 @@ class WERRequestHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Credentials', 'true')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header("Access-Control-Allow-Headers", "content-type")
+        self.send_header("Access-Control-Allow-Headers",
+                         "content-type, content-encoding")
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 
+def build_server(host: str, port: int, ix_path: str, default_idx: str,
+                 threaded: bool = True, buffer_docs: int = 100,
+                 buffer_delay: float = 1.0, cache_mb: float = 32,
+                 cache_ttl: float = None, shards: int = 1,
+                 fanout: str = 'thread', workers: int = None,
+                 merge_policy: str = 'tiered', merge_interval: float = 30.0,
+                 max_segments: int = 10, merge_idle: float = 60.0,
+                 profile_dir: str = None, profile_threshold: float = 1.0,
+                 profile_sample: float = 1.0, max_body_mb: float = 8,
+                 max_content_mb: float = 32, max_text_chars: int = 200000,
+                 normalize: bool = True, keep_alive: bool = True,
+                 idle_timeout: float = 15.0, max_requests: int = 100,
+                 analyzer: str = 'standard', buffer_mb: float = 64,
+                 writer_mb: int = 128, writer_procs: int = 1,
+                 writer_procs_docs: int = 1000, wal_dir: str = None,
+                 wal_fsync: bool = True, wal_segment_mb: float = 16,
+                 wal_wait: float = 5.0, ranking: str = 'bm25',
+                 processes: int = 1, warmup: bool = True,
+                 warmup_queries: tuple = (), preload: bool = True,
+                 warmup_terms: bool = False,
+                 ram_indexes: tuple = (), snapshot_interval: float = 60.0,
+                 retention: tuple = (), retention_interval: float = 3600.0):
+    """
+      Builds the WER server and the write buffer that performs every write
+      to the index.
+
+      :param host: host name to listen to.
+      :param port: port to listen to.
+      :param ix_path: path to the multiindex directory.
+      :param default_idx: name of the index used by the requests.
+      :param threaded: if True each request is served by its own thread,
+      so searches run in parallel while the buffer thread writes.
+      :param buffer_docs: amount of pending documents that triggers a commit.
+      :param buffer_delay: maximum amount of seconds a document may wait
+      before being committed.
+      :param cache_mb: maximum size in megabytes of the cache of search
+      results and rendered pages.
+      :param cache_ttl: seconds after which a cached search expires even if
+      the index did not change.
+      :param shards: amount of shards of each index.
+      :param fanout: 'thread' or 'process', how the shards are searched in
+      parallel.
+      :param workers: amount of threads or processes searching the shards.
+      :param merge_policy: 'tiered', 'idle' or 'commit', how the segments
+      are merged. See MergeScheduler. With 'commit' the small segments are
+      merged by each commit, as Whoosh does by default.
+      :param merge_interval: seconds between the checks of the segments.
+      :param max_segments: amount of segments of a shard above which the
+      tiered policy merges it.
+      :param merge_idle: seconds without writes after which the idle policy
+      optimizes the indexes.
+      :param profile_dir: if given, a sample of the requests is profiled
+      and the profiles of the slow ones are saved in this directory.
+      :param profile_threshold: seconds above which a request is slow.
+      :param profile_sample: fraction of the requests profiled.
+      :param max_body_mb: maximum size in megabytes of a request body, as
+      received (i.e., compressed).
+      :param max_content_mb: maximum size in megabytes of a decompressed
+      request body.
+      :param max_text_chars: maximum amount of characters of the text of a
+      page kept in the index.
+      :param normalize: if True, the texts are normalized before they are
+      indexed, see normalize_text.
+      :param keep_alive: if True, the server speaks HTTP/1.1 and keeps the
+      connections open between requests.
+      :param idle_timeout: seconds after which an idle connection is closed.
+      :param max_requests: amount of requests after which a connection is
+      closed. 0 means no limit.
+      :param analyzer: analyzer of the content of the new indexes, see
+      analysis.ANALYZERS.
+      :param buffer_mb: megabytes of pending texts that trigger a commit.
+      Requests storing pages wait while the buffer holds more than them.
+      :param writer_mb: megabytes of postings each commit keeps in memory
+      before spilling them to disk.
+      :param writer_procs: amount of processes indexing large batches.
+      :param writer_procs_docs: amount of documents of a batch from which
+      it is indexed by writer_procs processes.
+      :param wal_dir: if given, the stored pages are appended to a
+      write-ahead log in this directory, relative to the server directory,
+      and acknowledged before they are indexed. The log left by a former run
+      is replayed. See WriteAheadLog.
+      :param wal_fsync: if True, the log is synced to disk before the pages
+      are acknowledged.
+      :param wal_segment_mb: megabytes of each segment of the log.
+      :param wal_wait: maximum amount of seconds a search waits for the page
+      of its seq parameter to be indexed.
+      :param ranking: ranking of the searches without a rank parameter, see
+      indexHandler.RANKINGS.
+      :param processes: if greater than 1, the requests are served by this
+      amount of worker processes, which send their writes to this process,
+      see PreforkServer. Otherwise they are served by this process.
+      :param warmup: if True, the indexes are warmed up in background once
+      the server starts, see Warmup. Each worker process warms up its own.
+      :param warmup_queries: queries searched in each index by the warm-up.
+      :param preload: if True, the warm-up reads the files of the segments
+      into the page cache.
+      :param warmup_terms: if True, the warm-up builds the term dictionaries
+      of /suggest, which are otherwise built by the first suggestion.
+      :param ram_indexes: names of the indexes kept in memory and saved to
+      disk every snapshot_interval seconds, see Multiindex. They require a
+      single process and no write-ahead log, which would delete the pages
+      committed to memory before a snapshot saves them.
+      :param snapshot_interval: seconds between the snapshots of the
+      indexes kept in memory.
+      :param retention: retention rules of the indexes, each as accepted by
+      retention.parse_rule, e.g., "*:max_age=90d,max_per_domain=1000". The
+      documents that exceed them are deleted every retention_interval
+      seconds, see Retention.
+      :param retention_interval: seconds between the checks of the
+      retention rules.
+
+      Returns the server, the retention rules (None if none is given), the
+      write buffer, the merge scheduler (None if merge_policy is 'commit')
+      and the write-ahead log (None if wal_dir is not given), which must be
+      closed in this order after the server stops.
+      :rtype: tuple
+    """
+    if ram_indexes and processes > 1:
+        raise ValueError("The indexes kept in memory require a single "
+                         "process.")
+    if ram_indexes and wal_dir is not None:
+        raise ValueError("The indexes kept in memory can not be used with "
+                         "the write-ahead log.")
+    cache = QueryCache(max_bytes=int(cache_mb * 1024 * 1024), ttl=cache_ttl)
+    index = Multiindex.shared(ix_path, cache=cache, shards=shards,
+                              fanout=fanout, workers=workers,
+                              merge_on_commit=merge_policy == 'commit',
+                              analyzer=analyzer, limitmb=writer_mb,
+                              procs=writer_procs,
+                              procs_min_docs=writer_procs_docs,
+                              ram_indexes=ram_indexes,
+                              snapshot_interval=snapshot_interval)
+    writeBuffer = WriteBuffer(index, max_docs=buffer_docs,
+                              max_delay=buffer_delay, max_mb=buffer_mb)
+    wal = None
+    if wal_dir is not None:
+        wal = WriteAheadLog(os.path.join(BASEPATH, wal_dir), writeBuffer,
+                            fsync=wal_fsync, segment_mb=wal_segment_mb)
+        replayed = wal.replay()
+        if replayed:
+            logger.info("Replayed %s pages from the write-ahead log",
+                        replayed)
+    scheduler = None
+    if merge_policy != 'commit':
+        scheduler = MergeScheduler(
+            index, writeBuffer, policy=merge_policy, interval=merge_interval,
+            max_segments=max_segments, idle=merge_idle)
+    rules = None
+    if retention:
+        rules = Retention(index, writeBuffer,
+                          dict(parse_rule(spec) for spec in retention),
+                          interval=retention_interval)
+
+    profile = None
+    if profile_dir is not None:
+        profile = (profile_dir, profile_threshold, profile_sample)
+
+    handler_options = dict(
+        wal_wait=wal_wait, max_body=int(max_body_mb * 1024 * 1024),
+        max_content=int(max_content_mb * 1024 * 1024),
+        max_text=max_text_chars, normalize=normalize,
+        keep_alive=keep_alive, idle_timeout=idle_timeout,
+        max_requests=max_requests, ranking=ranking)
+    warmup_options = None
+    if warmup:
+        warmup_options = dict(queries=tuple(warmup_queries), preload=preload,
+                              ranking=ranking, terms=warmup_terms)
+
+    if processes > 1:
+        writer = WriterService(index, writeBuffer, wal, scheduler, rules)
+        index_options = dict(cache_mb=cache_mb, cache_ttl=cache_ttl,
+                             shards=shards, fanout=fanout, workers=workers,
+                             analyzer=analyzer, warmup=warmup_options)
+        server = PreforkServer((host, port), processes, WERRequestHandler,
+                               ix_path, default_idx, writer, index_options,
+                               handler_options, profile)
+        return server, rules, writeBuffer, scheduler, wal
+
+    profiler = None
+    if profile is not None:
+        profiler = SlowRequestProfiler(*profile)
+
+    # partially applies the first two arguments to the Handler
+    handler = partial(WERRequestHandler, ix_path, default_idx,
+                      write_buffer=writeBuffer, merge_scheduler=scheduler,
+                      profiler=profiler, wal=wal, retention=rules,
+                      warmup=Warmup(index, **warmup_options)
+                      if warmup_options is not None else None,
+                      **handler_options)
+
+    # .. then pass it to HTTPHandler as normal:
+    if threaded:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+    else:
+        server = HTTPServer((host, port), handler)
+    return server, rules, writeBuffer, scheduler, wal
+
+
 if __name__ == "__main__":
     hostName = 'localhost'
     serverPort = 8888
@@ -269,15 +1207,136 @@ if __name__ == "__main__":
     indexDir = 'indexdir'
     defaultIdx = 'Anonimous'
 
-    # partially applies the first two arguments to the Handler
-    handler = partial(WERRequestHandler, indexDir, defaultIdx)
+    parser = argparse.ArgumentParser(description="WER server.")
+    parser.add_argument('--single-threaded', action='store_true',
+                        help="serve one request at a time.")
+    # With --processes N, N worker processes share the port and search the
+    # indexes, while this process is the only one writing them.
+    parser.add_argument('--processes', type=int, default=1)
+    # Documents are grouped and committed when the buffer holds
+    # --buffer-docs documents or after --buffer-delay seconds.
+    parser.add_argument('--buffer-docs', type=int, default=100)
+    parser.add_argument('--buffer-delay', type=float, default=1.0)
+    # Memory budget of the ingest: the buffer holds at most --buffer-mb
+    # megabytes of texts, and each commit keeps at most --writer-mb
+    # megabytes of postings in memory before spilling them to disk. Batches
+    # of --writer-procs-docs documents are indexed by --writer-procs
+    # processes, which share the --writer-mb budget.
+    parser.add_argument('--buffer-mb', type=float, default=64)
+    parser.add_argument('--writer-mb', type=int, default=128)
+    parser.add_argument('--writer-procs', type=int, default=1)
+    parser.add_argument('--writer-procs-docs', type=int, default=1000)
+    # The stored pages are acknowledged once they are appended to the
+    # write-ahead log in --wal-dir, which is replayed on start. A search with
+    # &seq=N waits at most --wal-wait seconds for that page to be indexed.
+    parser.add_argument('--wal-dir', default='wal')
+    parser.add_argument('--no-wal', action='store_true')
+    parser.add_argument('--no-wal-fsync', action='store_true')
+    parser.add_argument('--wal-segment-mb', type=float, default=16)
+    parser.add_argument('--wal-wait', type=float, default=5.0)
+    # Bounds of the cache of search results.
+    parser.add_argument('--cache-mb', type=float, default=32)
+    parser.add_argument('--cache-ttl', type=float, default=None)
+    # Every index is split into --shards indexes, which are searched in
+    # parallel by --workers threads or processes.
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--fanout', choices=['thread', 'process'],
+                        default='thread')
+    parser.add_argument('--workers', type=int, default=None)
+    # Every --merge-interval seconds the segments are merged in background
+    # according to --merge-policy.
+    parser.add_argument('--merge-policy', choices=['tiered', 'idle', 'commit'],
+                        default='tiered')
+    parser.add_argument('--merge-interval', type=float, default=30.0)
+    parser.add_argument('--max-segments', type=int, default=10)
+    parser.add_argument('--merge-idle', type=float, default=60.0)
+    # With --profile-dir, a --profile-sample fraction of the requests is
+    # profiled, and the profiles of those slower than --profile-threshold
+    # seconds are saved.
+    parser.add_argument('--profile-dir', default=None)
+    parser.add_argument('--profile-threshold', type=float, default=1.0)
+    parser.add_argument('--profile-sample', type=float, default=1.0)
+    # Request bodies may be compressed with gzip or deflate. Larger bodies
+    # are rejected, and the texts are normalized and truncated to
+    # --max-text-chars characters.
+    parser.add_argument('--max-body-mb', type=float, default=8)
+    parser.add_argument('--max-content-mb', type=float, default=32)
+    parser.add_argument('--max-text-chars', type=int, default=200000)
+    parser.add_argument('--no-normalize', action='store_true')
+    # Connections are kept open (HTTP/1.1) for at most --max-requests
+    # requests, and closed after --idle-timeout seconds without requests.
+    parser.add_argument('--no-keep-alive', action='store_true')
+    parser.add_argument('--idle-timeout', type=float, default=15.0)
+    parser.add_argument('--max-requests', type=int, default=100)
+    # Analyzer of the indexes created without naming one in /newindex.
+    parser.add_argument('--analyzer', choices=ANALYZERS, default='standard')
+    # Ranking of the searches without a rank parameter: bm25, or recency,
+    # which favours the pages visited recently and often.
+    parser.add_argument('--ranking', choices=RANKINGS, default='bm25')
+    # On start, the indexes are read into the page cache (unless
+    # --no-preload), their term dictionaries are built (if --warmup-terms)
+    # and each --warmup-query is searched in them, while /available answers
+    # WARMING.
+    parser.add_argument('--no-warmup', action='store_true')
+    parser.add_argument('--no-preload', action='store_true')
+    parser.add_argument('--warmup-terms', action='store_true')
+    parser.add_argument('--warmup-query', action='append', default=[])
+    # Each --ram-index is kept in memory and saved to indexdir every
+    # --snapshot-interval seconds and when the server stops. It requires
+    # --no-wal, since the pages committed after the last snapshot are lost.
+    parser.add_argument('--ram-index', action='append', default=[])
+    parser.add_argument('--snapshot-interval', type=float, default=60.0)
+    # Each --retention NAME:key=value,... rule (NAME * for every index) of
+    # max_age (e.g., 30d), max_docs and max_per_domain deletes the pages
+    # that exceed it every --retention-interval seconds.
+    parser.add_argument('--retention', action='append', default=[])
+    parser.add_argument('--retention-interval', type=float, default=3600.0)
+    parser.add_argument('--log-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args()
 
-    # .. then pass it to HTTPHandler as normal:
-    server = HTTPServer((hostName, serverPort), handler)
-    print(f"Server started at {hostName}:{serverPort}")
+    logging.basicConfig(
+        level=args.log_level,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    server, retention, writeBuffer, scheduler, wal = build_server(
+        hostName, serverPort, indexDir, defaultIdx,
+        threaded=not args.single_threaded,
+        buffer_docs=args.buffer_docs, buffer_delay=args.buffer_delay,
+        cache_mb=args.cache_mb, cache_ttl=args.cache_ttl,
+        shards=args.shards, fanout=args.fanout, workers=args.workers,
+        merge_policy=args.merge_policy, merge_interval=args.merge_interval,
+        max_segments=args.max_segments, merge_idle=args.merge_idle,
+        profile_dir=args.profile_dir,
+        profile_threshold=args.profile_threshold,
+        profile_sample=args.profile_sample, max_body_mb=args.max_body_mb,
+        max_content_mb=args.max_content_mb,
+        max_text_chars=args.max_text_chars,
+        normalize=not args.no_normalize, keep_alive=not args.no_keep_alive,
+        idle_timeout=args.idle_timeout, max_requests=args.max_requests,
+        analyzer=args.analyzer, buffer_mb=args.buffer_mb,
+        writer_mb=args.writer_mb, writer_procs=args.writer_procs,
+        writer_procs_docs=args.writer_procs_docs,
+        wal_dir=None if args.no_wal else args.wal_dir,
+        wal_fsync=not args.no_wal_fsync, wal_segment_mb=args.wal_segment_mb,
+        wal_wait=args.wal_wait, ranking=args.ranking,
+        processes=args.processes, warmup=not args.no_warmup,
+        warmup_queries=args.warmup_query, preload=not args.no_preload,
+        warmup_terms=args.warmup_terms,
+        ram_indexes=args.ram_index, snapshot_interval=args.snapshot_interval,
+        retention=args.retention, retention_interval=args.retention_interval)
+    logger.info("Server started at %s:%s", hostName, serverPort)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         pass
     server.server_close()
-    print("Server stopped")
+    if retention is not None:
+        retention.close()
+    if scheduler is not None:
+        scheduler.close()
+    writeBuffer.close()
+    if wal is not None:
+        wal.close()
+    Multiindex.shared(indexDir).close()
+    logger.info("Server stopped")
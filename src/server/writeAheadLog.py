@@ -0,0 +1,381 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from functools import partial
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+WAL_SYNC_SECONDS = METRICS.histogram(
+    "wer_wal_sync_seconds", "Seconds spent syncing the write-ahead log.")
+
+# Extension of the segments of the log.
+SEGMENT_SUFFIX = ".wal"
+
+
+class WriteAheadLog():
+    """
+      Durable log of the documents to store, so they can be acknowledged
+      before they are indexed.
+
+      Each document gets a sequence number and is appended to the log as a
+      line "{crc32} {json}", which is synced to disk before the document is
+      queued in the write buffer. Concurrent appends share their syncs:
+      whoever syncs the file syncs every line written so far, so the
+      requests arriving during a sync wait for a single one.
+
+      The log is split into segments named after the sequence number of
+      their first document. Each start opens a new segment, and the former
+      ones are replayed into the write buffer and deleted once all their
+      documents are indexed, so a crash loses no acknowledged document.
+      Replaying documents already indexed is harmless, since they are
+      discarded by their hash (see Multiindex._add_to_shard), but a clean
+      close replaces the current segment by an empty one once all its
+      documents are indexed, so the next start replays nothing.
+
+      The visible sequence number is the highest one whose document, and
+      every former one, were indexed, which allows a reader to wait for its
+      own writes.
+    """
+
+    def __init__(self, directory: str, write_buffer, fsync: bool = True,
+                 segment_mb: float = 16):
+        """
+          :param directory: directory of the segments. If it does not
+          exist, it is created.
+          :param write_buffer: the WriteBuffer that indexes the documents.
+          :param fsync: if False, the appends are only written to the
+          operating system, which survives a crash of the server but not
+          of the machine.
+          :param segment_mb: megabytes of a segment after which a new one
+          is started.
+        """
+        self._dir = directory
+        self._write_buffer = write_buffer
+        self._fsync = fsync
+        self._segment_bytes = int(segment_mb * 1024 * 1024)
+        os.makedirs(directory, exist_ok=True)
+
+        # Serializes the appends to the current segment.
+        self._lock = threading.Lock()
+        # Serializes the syncs.
+        self._sync_lock = threading.Lock()
+        # Guards the sequence numbers being indexed.
+        self._cond = threading.Condition()
+
+        # First sequence numbers of the former segments, in order.
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX))
+        self._next = 1
+        if self._segments:
+            self._next = self._segments[-1]
+            for seq, _, _ in self._read(self._segments[-1]):
+                self._next = seq + 1
+            if self._next == self._segments[-1]:
+                # The last segment has no documents: it is reused.
+                self._segments.pop()
+
+        # Sequence numbers queued and not indexed yet, in order.
+        self._pending = {}
+        # Lowest sequence number that could not be indexed, whose segment
+        # is kept to be replayed on the next start.
+        self._failed = None
+        self._replayed = False
+
+        self._written = self._synced = self._next - 1
+        self._first = self._next
+        self._size = 0
+        self._file = open(self._path(self._next), "wb")
+        self._sync_dir()
+
+    def _path(self, first: int):
+        """Returns the path of the segment starting at first."""
+        return os.path.join(self._dir, f"{first:020d}{SEGMENT_SUFFIX}")
+
+    def _sync_dir(self):
+        """Syncs the directory, so the new segments survive a crash."""
+        if not self._fsync or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self._dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _read(self, first: int):
+        """
+          Reads the documents of the segment starting at first. A torn or
+          corrupt line, e.g., the last one written before a crash, ends the
+          segment.
+
+          Yields tuples (sequence number, indexname, document).
+          :rtype: generator
+        """
+        path = self._path(first)
+        with open(path, "rb") as f:
+            for line in f:
+                crc, _, payload = line.rstrip(b"\n").partition(b" ")
+                try:
+                    if not line.endswith(b"\n") or \
+                            int(crc, 16) != zlib.crc32(payload):
+                        raise ValueError("Wrong checksum.")
+                    record = json.loads(payload)
+                except ValueError:
+                    logger.warning("Ignoring the end of %s from a corrupt "
+                                   "record", path)
+                    return
+                yield record["seq"], record["index"], record["doc"]
+
+    def append(self, indexname: str, documents: list):
+        """
+          Appends the documents to the log, syncs it and queues them in the
+          write buffer.
+
+          :param indexname: name of the index.
+          :param documents: list of dictionaries, each one containing an
+          url, a title, a content and their hash.
+
+          Returns the sequence number of each document.
+          :rtype: list
+        """
+        if not documents:
+            return []
+
+        with self._lock:
+            seqs = list(range(self._next, self._next + len(documents)))
+            self._next += len(documents)
+            lines = []
+            for seq, doc in zip(seqs, documents):
+                payload = json.dumps({"seq": seq, "index": indexname,
+                                      "doc": doc}).encode("utf-8")
+                lines.append(b"%08x %s\n" % (zlib.crc32(payload), payload))
+            data = b"".join(lines)
+
+            with self._cond:
+                self._pending.update(dict.fromkeys(seqs))
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except Exception:
+                self._abandon(seqs)
+                raise
+            self._written = seqs[-1]
+            self._size += len(data)
+            if self._size >= self._segment_bytes:
+                self._rotate()
+
+        try:
+            self.sync(seqs[-1])
+            self._queue(indexname, documents, seqs)
+        except Exception:
+            self._abandon(seqs)
+            raise
+        return seqs
+
+    def _abandon(self, seqs: list):
+        """
+          Forgets the sequence numbers of documents that could not be logged
+          or queued, so they do not hold back the visible one. Since they
+          may be in the log anyway, its segment is kept and replayed on the
+          next start, as the documents that could not be indexed.
+        """
+        with self._cond:
+            for seq in seqs:
+                self._pending.pop(seq, None)
+            if self._failed is None or seqs[0] < self._failed:
+                self._failed = seqs[0]
+            self._cond.notify_all()
+
+    def _rotate(self):
+        """
+          Syncs and closes the current segment and starts a new one. Must be
+          called holding self._lock.
+        """
+        if self._fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._segments.append(self._first)
+        self._synced = max(self._synced, self._written)
+        self._first = self._next
+        self._size = 0
+        self._file = open(self._path(self._next), "wb")
+        self._sync_dir()
+
+    def sync(self, seq: int):
+        """
+          Makes the log durable at least up to the sequence number seq. If
+          another thread already synced it, it returns at once.
+
+          :param seq: sequence number.
+        """
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                written = self._written
+                # The segment may be rotated while it is synced.
+                fd = os.dup(self._file.fileno())
+            try:
+                if self._fsync:
+                    start = time.perf_counter()
+                    os.fsync(fd)
+                    WAL_SYNC_SECONDS.observe(time.perf_counter() - start)
+            finally:
+                os.close(fd)
+            self._synced = max(self._synced, written)
+
+    def _queue(self, indexname: str, documents: list, seqs: list):
+        """Queues logged documents in the write buffer."""
+        futures = self._write_buffer.add_many(indexname, documents)
+        for seq, future in zip(seqs, futures):
+            future.add_done_callback(partial(self._indexed, seq))
+
+    def _indexed(self, seq: int, future):
+        """
+          Marks the document of the sequence number seq as indexed, and
+          deletes the former segments whose documents were all indexed.
+        """
+        ok = future.exception() is None and future.result()
+        if not ok:
+            logger.error("Could not index the document %s of the log, it "
+                         "will be replayed on the next start", seq)
+        with self._cond:
+            self._pending.pop(seq, None)
+            if not ok and (self._failed is None or seq < self._failed):
+                self._failed = seq
+            self._cond.notify_all()
+        self._clean()
+
+    def visible(self):
+        """
+          Returns the highest sequence number whose document, and every
+          former one, were indexed.
+
+          :rtype: int
+        """
+        with self._cond:
+            return self._visible()
+
+    def _visible(self):
+        """Like visible, must be called holding self._cond."""
+        for seq in self._pending:
+            return seq - 1
+        return self._written
+
+    def wait(self, seq: int, timeout: float = None):
+        """
+          Waits until the document of the sequence number seq is indexed.
+
+          :param seq: sequence number.
+          :param timeout: maximum amount of seconds to wait.
+
+          Returns True if it is visible, False if the timeout expired.
+          :rtype: bool
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._visible() >= seq,
+                                       timeout)
+
+    def _clean(self):
+        """Deletes the former segments whose documents were all indexed."""
+        if not self._segments:
+            return
+        with self._lock, self._cond:
+            if not self._replayed:
+                return
+            kept = self._visible()
+            if self._failed is not None:
+                kept = min(kept, self._failed - 1)
+            limits = self._segments[1:] + [self._first]
+            while self._segments and limits[0] - 1 <= kept:
+                first = self._segments.pop(0)
+                limits.pop(0)
+                try:
+                    os.remove(self._path(first))
+                except OSError:
+                    logger.exception("Could not delete the segment %s",
+                                     first)
+
+    def replay(self):
+        """
+          Queues in the write buffer the documents of the former segments,
+          which are deleted once they are indexed.
+
+          Returns the amount of documents replayed.
+          :rtype: int
+        """
+        count = 0
+        for first in list(self._segments):
+            batch = []
+            for seq, indexname, doc in self._read(first):
+                if batch and batch[-1][1] != indexname:
+                    self._replay_batch(batch)
+                    batch = []
+                batch.append((seq, indexname, doc))
+                count += 1
+            if batch:
+                self._replay_batch(batch)
+        self._replayed = True
+        self._clean()
+        return count
+
+    def _replay_batch(self, batch: list):
+        """Queues replayed documents of the same index."""
+        seqs = [seq for seq, _, _ in batch]
+        with self._cond:
+            self._pending.update(dict.fromkeys(seqs))
+        self._queue(batch[0][1], [doc for _, _, doc in batch], seqs)
+
+    def stats(self):
+        """
+          Returns the last sequence number logged, the visible one, the
+          amount of documents not indexed yet and of segments.
+
+          :rtype: dict
+        """
+        with self._lock, self._cond:
+            return {
+                "seq": self._written,
+                "visible": self._visible(),
+                "pending": len(self._pending),
+                "segments": len(self._segments) + 1
+            }
+
+    def close(self):
+        """
+          Syncs and closes the log. The write buffer must be closed first.
+
+          If every document of the log was indexed, the current segment is
+          replaced by an empty one starting at the next sequence number, so
+          the next start keeps the numbering without replaying them.
+        """
+        self._clean()
+        with self._lock, self._cond:
+            if self._fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if self._first == self._next or self._pending or \
+                    self._failed is not None:
+                return
+            # The empty segment is created first, so a crash in between
+            # only replays documents already indexed.
+            open(self._path(self._next), "wb").close()
+            self._sync_dir()
+            try:
+                os.remove(self._path(self._first))
+            except OSError:
+                logger.exception("Could not delete the segment %s",
+                                 self._first)
@@ -0,0 +1,236 @@
+__author__ = "Marcelo Bianchetti"
+__version__ = "1.0.0"
+__email__ = "mbianchetti@dc.uba.ar"
+__status__ = "Testing"
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer():
+    """
+      Groups the documents received across several requests and commits
+      them to a Multiindex in batches.
+
+      The buffer is flushed whenever it holds max_docs documents or when
+      the oldest pending document has waited for max_delay seconds, so
+      every flush produces a single segment per index instead of one
+      segment per document. It is also flushed once the texts of the pending
+      documents exceed max_mb megabytes, and new documents wait while they
+      do, so the memory held by the buffer is bounded by twice max_mb: the
+      documents being committed and the pending ones.
+
+      The buffer thread is the only one writing to the multiindex: any other
+      write, such as creating an index, is queued with submit and run by
+      that thread, so concurrent requests never contend for the writer lock.
+    """
+
+    def __init__(self, index, max_docs: int = 100, max_delay: float = 1.0,
+                 max_mb: float = None):
+        """
+          :param index: the Multiindex in which documents are stored.
+          :param max_docs: amount of pending documents that triggers a flush.
+          :param max_delay: maximum amount of seconds a document may wait
+          before being committed.
+          :param max_mb: megabytes of pending texts that trigger a flush and
+          make new documents wait. If None, the texts are not bounded.
+        """
+        self._index = index
+        self._max_docs = max_docs
+        self._max_delay = max_delay
+        self._max_bytes = None if max_mb is None else \
+            int(max_mb * 1024 * 1024)
+
+        # {indexname: [(document, future), ...]}
+        self._pending = {}
+        self._size = 0
+        # Characters of the texts of the pending documents.
+        self._bytes = 0
+        self._oldest = None
+        # [(function, args, future), ...]
+        self._tasks = []
+        # time.monotonic() of the last commit of documents.
+        self.last_write = None
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="WriteBuffer", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return self._size
+
+    def pending_bytes(self):
+        """
+          Returns the size of the texts of the pending documents.
+
+          :rtype: int
+        """
+        with self._cond:
+            return self._bytes
+
+    def add(self, indexname: str, url: str, title: str, content: str,
+            hash: str = None):
+        """
+          Queues a document to be added to the index named indexname.
+
+          :param indexname: name of the index.
+          :param url: page url.
+          :param title: page title.
+          :param content: text to search from.
+          :param hash: MD5 of the url and the content.
+
+          Returns a future which is resolved with the result of
+          Multiindex.add_documents once the document is committed.
+          :rtype: concurrent.futures.Future
+        """
+        return self.add_many(indexname, [{
+            "url": url,
+            "title": title,
+            "content": content,
+            "hash": hash
+        }])[0]
+
+    def add_many(self, indexname: str, documents: list):
+        """
+          Queues several documents to be added to the index named indexname.
+          If the pending texts exceed the memory limit of the buffer, it
+          waits until they are taken by a flush.
+
+          :param indexname: name of the index.
+          :param documents: list of dictionaries, each one containing an url,
+          a title, a content and, optionally, their hash.
+
+          Returns the list of futures, one for each document.
+          :rtype: list
+        """
+        futures = [Future() for _ in documents]
+        size = sum(len(doc["content"] or "") for doc in documents)
+
+        with self._cond:
+            while not self._closed and self._full():
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("The write buffer is closed.")
+
+            pending = self._pending.setdefault(indexname, [])
+            pending.extend(zip(documents, futures))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._size += len(documents)
+            self._bytes += size
+            self._cond.notify_all()
+
+        return futures
+
+    def submit(self, function, *args):
+        """
+          Queues a write operation to be run by the buffer thread as soon
+          as possible, before the pending documents are committed.
+
+          :param function: callable that writes to the multiindex.
+          :param args: arguments to call function with.
+
+          Returns a future which is resolved with the result of the call.
+          :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The write buffer is closed.")
+            self._tasks.append((function, args, future))
+            self._cond.notify_all()
+        return future
+
+    def flush(self):
+        """
+          Runs the queued write operations and commits every pending
+          document. Each index receives a single commit with all of its
+          pending documents.
+        """
+        with self._flush_lock:
+            with self._cond:
+                tasks = self._tasks
+                self._tasks = []
+                pending = self._pending
+                self._pending = {}
+                self._size = 0
+                self._bytes = 0
+                self._oldest = None
+                self._cond.notify_all()
+
+            for function, args, future in tasks:
+                try:
+                    future.set_result(function(*args))
+                except Exception as e:
+                    future.set_exception(e)
+
+            for indexname, items in pending.items():
+                documents = [doc for doc, _ in items]
+                try:
+                    ret = self._index.add_documents(indexname, documents)
+                except Exception:
+                    logger.exception("Could not commit the documents of %s",
+                                     indexname)
+                    ret = False
+
+                for _, future in items:
+                    future.set_result(ret)
+
+            if pending:
+                self.last_write = time.monotonic()
+
+    def close(self):
+        """Stops the background thread and commits the pending documents."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def _full(self):
+        """
+          Returns True if the pending texts exceed the memory limit. Must be
+          called holding self._cond.
+
+          :rtype: bool
+        """
+        return self._max_bytes is not None and self._bytes >= self._max_bytes
+
+    def _due(self):
+        """
+          Returns True if the buffer must be flushed. Must be called
+          holding self._cond.
+
+          :rtype: bool
+        """
+        if self._tasks:
+            return True
+        if self._size == 0:
+            return False
+        if self._size >= self._max_docs or self._full():
+            return True
+        return time.monotonic() - self._oldest >= self._max_delay
+
+    def _run(self):
+        """Waits for the size or time thresholds and flushes the buffer."""
+        while True:
+            with self._cond:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = self._max_delay - \
+                            (time.monotonic() - self._oldest)
+                    self._cond.wait(timeout)
+
+                if self._closed:
+                    return
+
+            self.flush()
@@ -0,0 +1,61 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import gzip
+import os
+import unittest
+from server.indexDump import export_index, import_index
+from server.indexHandler import Multiindex
+
+
+TESTPATH = os.path.join(os.getcwd(), "testindex/")
+DUMP = os.path.join(os.getcwd(), "testdump.jsonl.gz")
+
+
+class TestIndexDump(unittest.TestCase):
+    def setUp(self):
+        """Creates a multiindex with a few documents."""
+        self.index = Multiindex(TESTPATH, procs_min_docs=10)
+        self.documents = [{"url": f"http://{i}.com", "title": str(i),
+                           "content": f"apple {i}"} for i in range(25)]
+        self.index.add_documents("Source", self.documents)
+
+    def tearDown(self):
+        """Removes the multiindex and the dump."""
+        self.index.remove_index()
+        if os.path.isfile(DUMP):
+            os.remove(DUMP)
+
+    def test_roundtrip(self):
+        """
+          Exports an index to a compressed dump and imports it into another
+          index in several batches, which must hold the same documents.
+        """
+        assert export_index(self.index, "Source", DUMP) == 25
+        with gzip.open(DUMP, "rt") as f:
+            assert len(f.readlines()) == 25
+
+        read, skipped = import_index(self.index, "Target", DUMP, batch=10)
+        assert (read, skipped) == (25, 0)
+
+        exported = sorted(d["url"] for d in
+                          self.index.export_documents("Target"))
+        assert exported == sorted(d["url"] for d in self.documents)
+        assert self.index.search_page("Target", "apple")["total"] == 25
+
+        # The documents already stored are not imported twice.
+        import_index(self.index, "Target", DUMP)
+        assert self.index.search_page("Target", "apple")["total"] == 25
+
+    def test_multiprocess_import(self):
+        """Imports the dump with several writer processes."""
+        export_index(self.index, "Source", DUMP)
+        import_index(self.index, "Target", DUMP, procs=2)
+
+        res = self.index.search_page("Target", "apple", snippets=True)
+        assert res["total"] == 25
+        assert "apple" in res["results"][0]["snippet"]
+
+
+if __name__ == '__main__':
+    unittest.main()
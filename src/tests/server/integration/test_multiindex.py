@@ -2,8 +2,17 @@ __author__ = "Marcelo Bianchetti"
 __email__ = "mbianchetti@dc.uba.ar"
 
 import os
+import time
 import unittest
-from server.indexHandler import Multiindex
+from unittest import mock
+from whoosh import reading
+from whoosh.fields import ID, Schema, TEXT
+from whoosh.index import create_in
+from server.indexHandler import WRITER_SPILLS, Multiindex, content_hash
+from server.retention import Retention
+from server.warmup import Warmup
+from server.writeAheadLog import WriteAheadLog
+from server.writeBuffer import WriteBuffer
 
 
 TESTPATH = os.path.join(os.getcwd(), "testindex/")
@@ -38,6 +47,593 @@ class TestMultiindex(unittest.TestCase):
         self.index.remove_index(self.indexname)
         assert self.index.available(self.indexname) is False
 
+    def test_add_documents(self):
+        """
+          Adds a batch of documents, including a repeated url, and checks
+          that every distinct document is searchable and that the whole
+          batch was committed as a single segment.
+        """
+        documents = [
+            {"url": "http://a.com", "title": "A", "content": "apple"},
+            {"url": "http://b.com", "title": "B", "content": "apple banana"},
+            {"url": "http://a.com", "title": "A", "content": "apple"},
+        ]
+        assert self.index.add_documents(self.indexname, documents) is True
+
+        res = self.index.search_word(self.indexname, "apple")
+        assert sorted(r["url"] for r in res) == \
+            ["http://a.com", "http://b.com"]
+
+        res = self.index.search_word(self.indexname, "banana")
+        assert [r["url"] for r in res] == ["http://b.com"]
+
+        ix = self.index._storage.open_index(self.indexname)
+        assert len(ix._segments()) == 1
+        ix.close()
+
+    def test_search_page(self):
+        """
+          Checks that search_page returns only the requested page and the
+          total amount of matching documents.
+        """
+        self.index.add_documents(self.indexname, [
+            {"url": f"http://{i}.com", "title": str(i), "content": "apple"}
+            for i in range(5)])
+
+        res = self.index.search_page(self.indexname, "apple", 2, 2)
+        assert res["total"] == 5
+        assert len(res["results"]) == 2
+
+        res = self.index.search_page(self.indexname, "apple", 3, 2)
+        assert len(res["results"]) == 1
+
+        res = self.index.search_page(self.indexname, "apple", 4, 2)
+        assert res["total"] == 5
+        assert res["results"] == []
+
+    def test_cached_search(self):
+        """
+          Checks that repeated searches are answered by the cache and that
+          a commit makes the new documents visible.
+        """
+        self.index.add_document(self.indexname, "http://a.com", "A", "apple")
+        first = self.index.search_page(self.indexname, "apple")
+        assert self.index.search_page(self.indexname, "  apple ") is first
+        assert self.index.cache.stats()["hits"] == 1
+
+        self.index.add_document(self.indexname, "http://b.com", "B", "apple")
+        assert self.index.search_page(self.indexname, "apple")["total"] == 2
+
+    def test_snippets(self):
+        """Checks that the results include the highlighted matches."""
+        self.index.add_document(
+            self.indexname, "http://a.com", "A", "a red apple and a pear")
+
+        res = self.index.search_page(self.indexname, "apple", snippets=True)
+        assert 'red <b class="match term0">apple</b> and' in \
+            res["results"][0]["snippet"]
+        assert res["results"][0]["score"] > 0
+
+    def test_schema_upgrade(self):
+        """
+          Checks that an index created with the former schema, which does
+          not store the content, accepts the new documents and that its
+          former documents are found without snippets.
+        """
+        schema = Schema(url=TEXT(stored=True), title=TEXT(stored=True),
+                        content=TEXT)
+        ix = create_in(TESTPATH, schema, indexname=self.indexname)
+        with ix.writer() as writer:
+            writer.add_document(url="http://a.com", title="A",
+                                content="apple")
+
+        self.index.add_document(self.indexname, "http://b.com", "B", "apple")
+
+        res = self.index.search_page(self.indexname, "apple", snippets=True)
+        snippets = {r["url"]: r["snippet"] for r in res["results"]}
+        assert snippets == {
+            "http://a.com": "",
+            "http://b.com": '<b class="match term0">apple</b>'
+        }
+
+    def test_hash_dedup(self):
+        """
+          Checks that duplicates are detected by hash, that the same url
+          with a different content replaces the former document, and that
+          the hashes are persisted next to the index.
+        """
+        self.index.add_document(self.indexname, "http://a.com", "A", "apple")
+        digest = content_hash("http://a.com", "apple")
+        assert self.index.contains(self.indexname, digest) is True
+
+        # An url that shares its tokens is not a duplicate.
+        self.index.add_document(self.indexname, "http://a.com/a", "A", "pear")
+        assert len(self.index.search_word(self.indexname, "pear")) == 1
+
+        self.index.add_document(self.indexname, "http://a.com", "A", "apple")
+        self.index.add_document(self.indexname, "http://a.com", "A", "plum")
+        with self.index.searcher(self.indexname) as searcher:
+            assert searcher.doc_count() == 2
+        assert self.index.search_word(self.indexname, "apple") == []
+
+        other = Multiindex(TESTPATH)
+        assert other.contains(self.indexname, digest) is True
+        assert other.contains(self.indexname, content_hash("u", "c")) is False
+
+    def test_contains_many(self):
+        """
+          Checks the membership of a batch of hashes, after the recent
+          digests are merged into the sorted array, and that a multiindex of
+          another process sees the digests added by the writer.
+        """
+        documents = [{"url": f"http://{i}.com", "title": str(i),
+                      "content": f"w{i}"} for i in range(1500)]
+        self.index.add_documents(self.indexname, documents)
+        reader = Multiindex(TESTPATH, external_writers=True)
+        missing = content_hash("http://y.com", "new")
+        assert reader.contains_many(self.indexname, [missing]) == [False]
+        self.index.add_document(self.indexname, "http://x.com", "x", "new")
+
+        digests = [content_hash(d["url"], d["content"]) for d in documents]
+        assert self.index.contains_many(
+            self.indexname, digests + [missing, "nope"]) == \
+            [True] * len(digests) + [False, False]
+        assert reader.contains_many(self.indexname, [
+            content_hash("http://x.com", "new").upper(), missing]) == \
+            [True, False]
+        assert reader.contains_many("Unknown", [missing]) == [False]
+        reader.close()
+
+    def test_legacy_revisit(self):
+        """
+          Checks that a changed page stored by a previous version, without
+          url_id nor recorded visits, replaces its former document.
+        """
+        schema = Schema(url=TEXT(stored=True), title=TEXT(stored=True),
+                        content=TEXT, hash=ID(stored=True, unique=True))
+        ix = create_in(TESTPATH, schema, indexname=self.indexname)
+        with ix.writer() as writer:
+            for url in ("http://a.com", "http://b.com"):
+                writer.add_document(url=url, title="A", content="apple",
+                                    hash=content_hash(url, "apple"))
+
+        index = Multiindex(TESTPATH)
+        index.add_document(self.indexname, "http://a.com", "A", "plum")
+        index.add_document(self.indexname, "http://a.com", "A", "pear")
+        res = index.search_page(self.indexname, "apple OR plum OR pear")
+        assert sorted(r["url"] for r in res["results"]) == \
+            ["http://a.com", "http://b.com"]
+        assert index.search_page(self.indexname, "pear")["total"] == 1
+        [doc] = [doc for doc in index.export_documents(self.indexname)
+                 if doc["url"] == "http://a.com"]
+        assert doc["visit_count"] == 2
+        index.close()
+
+    def test_no_legacy_scan(self):
+        """
+          Checks that the documents replaced by new versions of their pages
+          do not make the index be scanned for pages of previous versions.
+        """
+        url = "http://a.com"
+        self.index.add_document(self.indexname, url, "A", "apple")
+        self.index.add_document(self.indexname, url, "A", "plum")
+
+        other = Multiindex(TESTPATH)
+        with mock.patch.object(reading.IndexReader, "iter_docs") as multi, \
+                mock.patch.object(reading.SegmentReader, "iter_docs") as seg:
+            assert other._legacy_pages(self.indexname) == {}
+        assert not multi.called and not seg.called
+        other.close()
+
+    def test_log_restart(self):
+        """
+          Checks that a restart does not replay the documents logged and
+          indexed, so their visits are unchanged.
+        """
+        wal_dir = os.path.join(TESTPATH, "wal")
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=0.01)
+        wal = WriteAheadLog(wal_dir, buffer)
+        wal.replay()
+        url = "http://a.com"
+        seqs = wal.append(self.indexname, [{
+            "url": url, "title": "A", "content": "apple",
+            "hash": content_hash(url, "apple")}])
+        assert wal.wait(seqs[-1], timeout=5)
+        buffer.close()
+        wal.close()
+        [before] = self.index.export_documents(self.indexname)
+
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=0.01)
+        wal = WriteAheadLog(wal_dir, buffer)
+        assert wal.replay() == 0
+        buffer.close()
+        wal.close()
+        [after] = self.index.export_documents(self.indexname)
+        assert after["visit_count"] == before["visit_count"] == 1
+        assert after["last_visited"] == before["last_visited"]
+
+    def test_revisit(self):
+        """
+          Checks that a revisit of an unchanged page only records the visit,
+          without committing, that a resubmitted page is not a visit, that a
+          changed page keeps counting its visits, and that the visits are
+          persisted next to the index.
+        """
+        url = "http://a.com"
+        self.index.add_document(self.indexname, url, "A", "apple")
+        generation = self.index.generation(self.indexname)
+
+        digest = content_hash(url, "apple")
+        assert self.index.visit(self.indexname, url, digest) is True
+        visit = self.index._visit_table(self.indexname).get(url)
+        self.index.add_document(self.indexname, url, "A", "apple")
+        assert self.index.generation(self.indexname) == generation
+        assert self.index._visit_table(self.indexname).get(url) == visit
+        assert self.index.visit(self.indexname, url,
+                                content_hash(url, "plum")) is False
+
+        self.index.add_document(self.indexname, url, "A", "plum")
+        [doc] = self.index.export_documents(self.indexname)
+        assert doc["content"] == "plum" and doc["visit_count"] == 3
+
+        other = Multiindex(TESTPATH)
+        assert other.visit(self.indexname, url, digest) is False
+        assert other.visit(self.indexname, url, doc["hash"]) is True
+        [doc] = other.export_documents(self.indexname)
+        assert doc["visit_count"] == 4
+        assert other.visit_many(self.indexname, [url, url, url],
+                                [doc["hash"], digest, "nope"]) == \
+            [True, False, False]
+
+    def test_recency_ranking(self):
+        """
+          Checks that the recency ranking favours the pages visited recently
+          and often over an equally relevant page.
+        """
+        now = time.time()
+        self.index.add_documents(self.indexname, [
+            {"url": "http://old.com", "title": "old", "content": "apple",
+             "last_visited": now - 90 * 24 * 3600},
+            {"url": "http://new.com", "title": "new", "content": "apple",
+             "last_visited": now - 3600}])
+        res = self.index.search_page(self.indexname, "apple",
+                                     ranking="recency")
+        assert [r["url"] for r in res["results"]] == \
+            ["http://new.com", "http://old.com"]
+
+        digest = content_hash("http://old.com", "apple")
+        for _ in range(20):
+            self.index.visit(self.indexname, "http://old.com", digest)
+        res = self.index.search_page(self.indexname, "apple",
+                                     ranking="recency")
+        assert res["results"][0]["url"] == "http://old.com"
+
+        # The shards merge their results by the blended score.
+        index = Multiindex(TESTPATH, shards=2)
+        index.add_documents("Sharded", [
+            {"url": f"http://{i}.com", "title": str(i), "content": "apple",
+             "last_visited": now - i * 30 * 24 * 3600}
+            for i in range(10)])
+        res = index.search_page("Sharded", "apple", pagesize=3,
+                                ranking="recency")
+        assert res["total"] == 10
+        assert res["results"][0]["url"] == "http://0.com"
+        index.close()
+
+    def test_searcher_pool(self):
+        """
+          Checks that searchers are reused between searches and refreshed
+          only after a commit, so new documents become visible.
+        """
+        self.index.add_document(self.indexname, "http://a.com", "A", "apple")
+        with self.index.searcher(self.indexname) as searcher:
+            first = searcher
+        with self.index.searcher(self.indexname) as searcher:
+            assert searcher is first
+
+        self.index.add_document(self.indexname, "http://b.com", "B", "apple")
+        with self.index.searcher(self.indexname) as searcher:
+            assert searcher is not first
+            assert searcher.doc_count() == 2
+
+    def test_shared(self):
+        """Checks that the shared multiindex is unique per path."""
+        assert Multiindex.shared(TESTPATH) is Multiindex.shared(TESTPATH)
+
+    def test_shards(self):
+        """
+          Checks that the documents of a sharded index are spread among its
+          shards, and that a search merges the results of every shard.
+        """
+        index = Multiindex(TESTPATH, shards=3)
+        documents = [{"url": f"http://{i}.com", "title": str(i),
+                      "content": "apple " * (i + 1)} for i in range(30)]
+        assert index.add_documents(self.indexname, documents) is True
+        assert index.available(self.indexname) is True
+
+        counts = []
+        for shard in index.shards(self.indexname):
+            with index.searcher(shard) as searcher:
+                counts.append(searcher.doc_count())
+        assert sum(counts) == 30 and min(counts) > 0
+
+        digest = content_hash("http://0.com", "apple ")
+        assert index.contains(self.indexname, digest) is True
+
+        res = index.search_page(self.indexname, "apple", 2, 10)
+        assert res["total"] == 30
+        scores = [r["score"] for r in res["results"]]
+        assert len(scores) == 10 and scores == sorted(scores, reverse=True)
+
+        urls = {r["url"] for page in [1, 2, 3]
+                for r in index.search_page(
+                    self.indexname, "apple", page, 10)["results"]}
+        assert len(urls) == 30
+        index.close()
+
+    def test_federated_processes(self):
+        """
+          Checks a search over several indexes run by worker processes,
+          which must see the documents committed after they started.
+        """
+        index = Multiindex(TESTPATH, fanout="process", workers=2)
+        index.add_document("A", "http://a.com", "A", "apple")
+        index.add_document("B", "http://b.com", "B", "apple pear")
+
+        res = index.search_page(["A", "B"], "apple", snippets=True)
+        assert sorted(r["url"] for r in res["results"]) == \
+            ["http://a.com", "http://b.com"]
+
+        index.add_document("B", "http://c.com", "C", "apple")
+        res = index.search_page(["A", "B"], "apple")
+        assert res["total"] == 3
+        index.close()
+
+    def test_merge(self):
+        """
+          Commits several segments without merging them, and checks that
+          the tiered policy merges them once there are enough of them, that
+          optimizing leaves a single segment, and that the obsolete files
+          are deleted.
+        """
+        index = Multiindex(TESTPATH, merge_on_commit=False)
+        for i in range(12):
+            index.add_document(self.indexname, f"http://{i}.com", str(i),
+                               "apple")
+        segments = index.segments(self.indexname)
+        assert segments[0]["segments"] == 12
+        assert segments[0]["docs"] == 12 and segments[0]["bytes"] > 0
+        assert index.indexnames() == [self.indexname]
+
+        index.merge(self.indexname, "tiered")
+        assert index.segments(self.indexname)[0]["segments"] == 1
+
+        index.add_document(self.indexname, "http://a.com", "A", "apple")
+        assert index.segments(self.indexname)[0]["segments"] == 2
+        assert index.merge(self.indexname, "tiered") is None
+        assert index.segments(self.indexname)[0]["segments"] == 2
+
+        index.merge(self.indexname, "optimize")
+        assert index.segments(self.indexname)[0]["segments"] == 1
+        assert len([f for f in os.listdir(TESTPATH)
+                    if f.endswith(".toc")]) == 1
+        assert index.search_page(self.indexname, "apple")["total"] == 13
+        index.close()
+
+    def test_query_syntax(self):
+        """Checks the phrase, prefix and fuzzy queries."""
+        self.index.add_documents(self.indexname, [
+            {"url": "http://a.com", "title": "A",
+             "content": "the quick brown fox"},
+            {"url": "http://b.com", "title": "B",
+             "content": "brown quick dogs"}])
+
+        def total(query):
+            return self.index.search_page(self.indexname, query)["total"]
+
+        assert total('"quick brown"') == 1
+        assert total("qui*") == 2
+        assert total("dog") == 0
+        assert total("dog~") == 1
+        assert total("brwn~2") == 2
+
+    def test_suggest(self):
+        """
+          Checks that the completions come from the terms of the index,
+          most frequent first, and include the documents added afterwards.
+        """
+        self.index.add_documents(self.indexname, [
+            {"url": f"http://{i}.com", "title": str(i),
+             "content": "apple" if i else "apricot"} for i in range(3)])
+
+        res = self.index.suggest(self.indexname, "green AP")
+        assert [(s["text"], s["docs"]) for s in res] == \
+            [("green apple", 2), ("green apricot", 1)]
+        assert self.index.suggest(self.indexname, "ap ") == []
+
+        self.index.add_documents(self.indexname, [
+            {"url": f"http://x{i}.com", "title": str(i),
+             "content": "apricot"} for i in range(3)])
+        res = self.index.suggest(self.indexname, "ap", limit=1)
+        assert res == [{"text": "apricot", "term": "apricot", "docs": 4}]
+
+        # The terms of the replaced versions of a page are forgotten.
+        for content in ("zebra one", "zebra two", "zebra three"):
+            self.index.add_document(self.indexname, "http://z.com", "Z",
+                                    content)
+        res = self.index.suggest(self.indexname, "zeb")
+        assert [(s["term"], s["docs"]) for s in res] == [("zebra", 1)]
+        assert self.index.suggest(self.indexname, "on") == []
+
+    def test_warmup(self):
+        """
+          Checks that the warm-up reads the segments, loads the structures
+          kept in memory of every index and searches the warm-up queries.
+        """
+        self.index.add_documents(self.indexname, [
+            {"url": f"http://{i}.com", "title": str(i),
+             "content": f"hello w{i}"} for i in range(10)])
+        reader = Multiindex(TESTPATH, external_writers=True)
+        warmup = Warmup(reader, queries=["hello", "w3"])
+        assert warmup.wait(30)
+
+        stats = warmup.stats()
+        assert stats["status"] == "ready"
+        assert stats["indexes"] == 1 and stats["bytes"] > 0
+        assert stats["queries"] == 2 and stats["seconds"] > 0
+        assert self.indexname in reader._digests
+        assert self.indexname not in reader._terms
+        assert reader.cache.stats()["entries"] == 2
+        assert reader.warm(self.indexname, preload=False, terms=True) == 0
+        assert self.indexname in reader._terms
+        reader.close()
+
+    def test_ram_index(self):
+        """
+          Checks that an index kept in memory is only written to disk by its
+          snapshots, which are incremental, and that it is loaded from the
+          last one, losing the pages committed afterwards.
+        """
+        def documents(start, end):
+            return [{"url": f"http://{i}.com", "title": str(i),
+                     "content": f"hello w{i}"} for i in range(start, end)]
+
+        index = Multiindex(TESTPATH, ram_indexes=[self.indexname],
+                           snapshot_interval=None)
+        index.add_documents(self.indexname, documents(0, 10))
+        assert index.search_page(self.indexname, "hello")["total"] == 10
+        # Only the empty index created on disk, without segments.
+        assert [file for file in os.listdir(TESTPATH)
+                if not file.startswith("_")] == []
+        assert index.indexnames() == [self.indexname]
+
+        assert index.snapshot() > 0
+        assert index.snapshot() == 0
+        assert self.index.search_page(self.indexname, "hello")["total"] == 10
+
+        index.add_documents(self.indexname, documents(10, 20))
+        lost = content_hash("http://15.com", "hello w15")
+        assert index.contains(self.indexname, lost)
+        # The pages committed after the snapshot are lost.
+        restored = Multiindex(TESTPATH, ram_indexes=[self.indexname],
+                              snapshot_interval=None)
+        assert restored.search_page(self.indexname, "hello")["total"] == 10
+        assert not restored.contains(self.indexname, lost)
+        assert not restored.visit(self.indexname, "http://15.com", lost)
+
+        index.close()
+        restored = Multiindex(TESTPATH, ram_indexes=[self.indexname],
+                              snapshot_interval=None)
+        assert restored.search_page(self.indexname, "hello")["total"] == 20
+        assert restored.contains(self.indexname, lost)
+        assert restored.visit(self.indexname, "http://15.com", lost)
+        assert restored.snapshot_stats()["indexes"] == [self.indexname]
+
+    def test_retention(self):
+        """
+          Checks the selection of the pages that exceed the retention rules
+          and that their deletion compacts the segments and forgets their
+          hashes, visits and terms.
+        """
+        index = Multiindex(TESTPATH, shards=2)
+        now = time.time()
+        documents = [{"url": f"http://{'a' if i % 2 else 'b'}.com/{i}",
+                      "title": str(i), "content": f"hello w{i}",
+                      "last_visited": now - i * 86400} for i in range(20)]
+        index.add_documents(self.indexname, documents[:10])
+        index.add_documents(self.indexname, documents[10:])
+
+        def urls(digests):
+            return sorted(doc["url"] for doc in documents
+                          if content_hash(doc["url"], doc["content"])
+                          in digests)
+
+        assert index.expired(self.indexname) == []
+        assert len(index.expired(self.indexname, max_docs=5)) == 15
+        assert urls(index.expired(self.indexname, max_docs=4,
+                                  max_per_domain=1)) == \
+            urls(index.expired(self.indexname, max_docs=2)) == \
+            sorted(doc["url"] for doc in documents[2:])
+        # A revisit makes the page recent again.
+        old = documents[19]
+        index.visit(self.indexname, old["url"],
+                    content_hash(old["url"], old["content"]))
+        assert old["url"] not in urls(index.expired(self.indexname,
+                                                    max_docs=2))
+
+        assert "w10" in [s["term"] for s in index.suggest(
+            self.indexname, "w1", 10)]
+        buffer = WriteBuffer(index, max_docs=100, max_delay=0.01)
+        retention = Retention(index, buffer, {"*": {"max_age": 5.5 * 86400}})
+        try:
+            # 14 pages are older, one of them visited again.
+            assert retention.check() == 13
+        finally:
+            retention.close()
+            buffer.close()
+        stats = retention.stats()[self.indexname]
+        assert stats["deleted"] == 13 and stats["docs"] == 7
+        assert stats["bytes_reclaimed"] > 0
+
+        assert index.search_page(self.indexname, "hello")["total"] == 7
+        assert all(shard["segments"] == 1 and shard["deleted"] == 0
+                   for shard in index.segments(self.indexname))
+        expired = documents[10]
+        digest = content_hash(expired["url"], expired["content"])
+        assert not index.contains(self.indexname, digest)
+        assert not index.visit(self.indexname, expired["url"], digest)
+        assert "w10" not in [s["term"] for s in index.suggest(
+            self.indexname, "w1", 10)]
+
+        assert index.delete_by_query(self.indexname, "url:b.com") == 3
+        assert index.search_page(self.indexname, "hello")["total"] == 4
+        index.add_documents(self.indexname, [expired])
+        assert index.contains(self.indexname, digest)
+        index.close()
+
+    def test_writer_limit(self):
+        """
+          Adds a batch whose postings exceed the memory limit of the writer,
+          which must spill them to disk and still index every document.
+        """
+        spills = WRITER_SPILLS.value()
+        index = Multiindex(TESTPATH, limitmb=1)
+        index.add_documents(self.indexname, [
+            {"url": f"http://{i}.com", "title": str(i),
+             "content": " ".join(f"w{i}x{j}" for j in range(100))}
+            for i in range(200)])
+
+        assert WRITER_SPILLS.value() > spills
+        assert index.search_page(self.indexname, "w199x99")["total"] == 1
+        assert index.segments(self.indexname)[0]["docs"] == 200
+        index.close()
+
+    def test_analyzers(self):
+        """
+          Checks that indexes created with a language analyzer match the
+          variants of the words, and that auto indexes analyze each page
+          with the analyzer of its language.
+        """
+        documents = [
+            {"url": "http://en.com", "title": "EN",
+             "content": "The runners were running to the stadium"},
+            {"url": "http://es.com", "title": "ES",
+             "content": "Los corredores están corriendo hacia la canción"},
+        ]
+        for analyzer in ["en", "auto"]:
+            name = analyzer.capitalize()
+            assert self.index.createIx(name, analyzer=analyzer) is True
+            self.index.add_documents(name, documents)
+            assert self.index.search_page(name, "run")["total"] == 1
+            assert self.index.search_page(name, "cancion")["total"] == 1
+
+        res = self.index.search_page("Auto", "corredor", snippets=True)
+        assert [r["url"] for r in res["results"]] == ["http://es.com"]
+        assert "<b" in res["results"][0]["snippet"]
+
+        self.index.add_documents("Standard", documents)
+        assert self.index.search_page("Standard", "run")["total"] == 0
+
 
 if __name__ == '__main__':
     unittest.main()
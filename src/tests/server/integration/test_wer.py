@@ -0,0 +1,76 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                                "server"))
+
+from indexHandler import Multiindex  # noqa: E402
+from wer import CREDENTIALS, build_server  # noqa: E402
+
+TESTPATH = os.path.join(os.getcwd(), "testwer/")
+INDEXNAME = "Testing"
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        """Starts a server on a free port, without warm-up."""
+        self.server, _, self.buffer, self.scheduler, _ = build_server(
+            "localhost", 0, TESTPATH, INDEXNAME, merge_policy="commit",
+            warmup=False, idle_timeout=30)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.buffer.add_many(INDEXNAME, [{
+            "url": "http://apple.com", "title": "Apple",
+            "content": "apple pie"}])[0].result()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.buffer.close()
+        Multiindex.shared(TESTPATH).remove_index()
+
+    def test_http10_keep_alive_stream(self):
+        """
+          Checks that a streamed response to an HTTP/1.0 request that asks
+          to keep the connection alive closes it, since the body has no
+          length.
+        """
+        sock = socket.create_connection(self.server.server_address,
+                                        timeout=5)
+        try:
+            sock.sendall(b"GET /search/q=apple HTTP/1.0\r\n"
+                         b"Connection: keep-alive\r\n"
+                         b"Authorization: " + CREDENTIALS.encode() +
+                         b"\r\n\r\n")
+            response = b""
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                response += data
+        finally:
+            sock.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        assert head.split(b" ")[1] == b"200"
+        assert b"Connection: close" in head
+        assert b"apple" in body
+
+    def test_ram_index_without_wal(self):
+        """
+          Checks that the indexes kept in memory are rejected with the
+          write-ahead log, which would lose the pages it acknowledged.
+        """
+        with self.assertRaises(ValueError):
+            build_server("localhost", 0, TESTPATH, INDEXNAME, wal_dir="wal",
+                         ram_indexes=[INDEXNAME])
+
+
+if __name__ == '__main__':
+    unittest.main()
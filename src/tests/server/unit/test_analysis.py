@@ -0,0 +1,42 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from whoosh.fields import Schema
+from server.analysis import analyzer, content_document, content_fields, \
+    detect_language
+
+
+class TestAnalysis(unittest.TestCase):
+    def terms(self, name, text):
+        return [t.text for t in analyzer(name)(text)]
+
+    def test_analyzers(self):
+        """Checks the stopwords, stemming and accent folding."""
+        assert self.terms("standard", "The Canción") == ["canción"]
+        assert self.terms("folding", "The Canción") == ["cancion"]
+        assert self.terms("en", "the runners running") == ["runner", "run"]
+        assert self.terms("es", "las canciones") == ["cancion"]
+
+    def test_detect_language(self):
+        """Checks that the language is detected from its stopwords."""
+        assert detect_language("the cat is on the table and it is") == "en"
+        assert detect_language("el gato está en la mesa y no se") == "es"
+        assert detect_language("lorem ipsum") is None
+
+    def test_content_document(self):
+        """
+          Checks that the pages of auto indexes are stored in the field of
+          their language.
+        """
+        schema = Schema(**content_fields("auto"))
+        doc = content_document(schema, "el gato está en la mesa y no se")
+        assert doc == {"content_es": "el gato está en la mesa y no se",
+                       "lang": "es"}
+        assert content_document(schema, "lorem") == {"content": "lorem"}
+        assert content_document(Schema(**content_fields("en")), "x") == \
+            {"content": "x"}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import time
+import unittest
+from server.mergeScheduler import MergeScheduler
+from server.writeBuffer import WriteBuffer
+
+
+class FakeIndex():
+    """Holds a fixed amount of segments per index and records merges."""
+
+    def __init__(self, segments, unmerged=()):
+        self._segments = segments
+        # Indexes whose segments are left as they are by merge.
+        self._unmerged = unmerged
+        self.merged = []
+        self.cleaned = []
+
+    def indexnames(self):
+        return sorted(self._segments)
+
+    def segments(self, indexname):
+        return [{"shard": indexname, "segments": self._segments[indexname],
+                 "docs": 0, "deleted": 0, "bytes": 0}]
+
+    def merge(self, indexname, policy):
+        self.merged.append((indexname, policy))
+        if indexname in self._unmerged:
+            return None
+        self._segments[indexname] = 1
+        return 0.5
+
+    def clean(self, indexname):
+        self.cleaned.append(indexname)
+
+    def add_documents(self, indexname, documents):
+        return True
+
+
+class TestMergeScheduler(unittest.TestCase):
+    def test_tiered(self):
+        """
+          Checks that only the indexes with too many segments are merged,
+          and that the merges are reported.
+        """
+        index = FakeIndex({"A": 20, "B": 3})
+        buffer = WriteBuffer(index)
+        scheduler = MergeScheduler(index, buffer, interval=60,
+                                   max_segments=10)
+
+        assert scheduler.check() == ["A"]
+        assert index.merged == [("A", "tiered")]
+        assert index.cleaned == ["B"]
+
+        stats = scheduler.stats()
+        assert stats["segments"]["A"][0]["segments"] == 1
+        assert stats["merges"]["count"] == 1
+        assert stats["merges"]["last_seconds"] == 0.5
+        scheduler.close()
+        buffer.close()
+
+    def test_nothing_merged(self):
+        """
+          Checks that a merge that leaves the segments as they are is not
+          counted, and that the obsolete files are still deleted.
+        """
+        index = FakeIndex({"A": 20}, unmerged=["A"])
+        buffer = WriteBuffer(index)
+        scheduler = MergeScheduler(index, buffer, interval=60,
+                                   max_segments=10)
+
+        assert scheduler.check() == []
+        assert index.merged == [("A", "tiered")]
+        assert index.cleaned == ["A"]
+        assert scheduler.stats()["merges"]["count"] == 0
+        scheduler.close()
+        buffer.close()
+
+    def test_idle(self):
+        """Checks that the idle policy waits until there are no writes."""
+        index = FakeIndex({"A": 2})
+        buffer = WriteBuffer(index, max_delay=0.01)
+        scheduler = MergeScheduler(index, buffer, policy="idle",
+                                   interval=60, idle=0.2)
+
+        buffer.add("A", "http://a", "t", "c").result(timeout=5)
+        assert scheduler.check() == []
+
+        time.sleep(0.3)
+        assert scheduler.check() == ["A"]
+        assert index.merged == [("A", "optimize")]
+        scheduler.close()
+        buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
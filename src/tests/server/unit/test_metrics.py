@@ -0,0 +1,64 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from server.metrics import Metrics
+from server.profiler import SlowRequestProfiler
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        """
+          Checks that the observations are counted in cumulative buckets
+          and rendered in the Prometheus text format.
+        """
+        metrics = Metrics()
+        histogram = metrics.histogram("latency", "Latency.", ("route",),
+                                      buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 5]:
+            histogram.observe(value, route="/search")
+        assert metrics.histogram("latency", "Latency.") is histogram
+        assert histogram.count(route="/search") == 3
+
+        text = metrics.render()
+        assert "# TYPE latency histogram" in text
+        assert 'latency_bucket{route="/search",le="0.1"} 1' in text
+        assert 'latency_bucket{route="/search",le="1.0"} 2' in text
+        assert 'latency_bucket{route="/search",le="+Inf"} 3' in text
+        assert 'latency_count{route="/search"} 3' in text
+
+    def test_counter(self):
+        """Checks that each combination of labels is counted apart."""
+        metrics = Metrics()
+        counter = metrics.counter("requests", "Requests.", ("code",))
+        counter.inc(code=200)
+        counter.inc(code=200)
+        counter.inc(code='a"b')
+        assert counter.value(code=200) == 2
+        text = metrics.render()
+        assert 'requests{code="200"} 2' in text
+        assert 'requests{code="a\\"b"} 1' in text
+
+    def test_slow_request_profiler(self):
+        """Checks that only the profiles of the slow requests are saved."""
+        directory = tempfile.mkdtemp()
+        try:
+            profiler = SlowRequestProfiler(directory, threshold=0.05)
+            with profiler.profile("GET /search"):
+                pass
+            assert os.listdir(directory) == []
+
+            with profiler.profile("GET /search"):
+                time.sleep(0.1)
+            files = os.listdir(directory)
+            assert len(files) == 1 and files[0].endswith(".prof")
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server.normalizer import normalize_text
+
+
+class TestNormalizer(unittest.TestCase):
+    def test_normalize(self):
+        """
+          Checks that the whitespace is collapsed and the empty and repeated
+          paragraphs are removed.
+        """
+        text = "Menu\n\n  Hello \t big   world \nMenu\n\nBye"
+        assert normalize_text(text) == "Menu\nHello big world\nBye"
+
+    def test_single_line(self):
+        """
+          Checks that the repeated sentences of a text sent as a single
+          line are removed.
+        """
+        text = ("Sign in. Hello big world! Is it round? Sign in.  "
+                "Is it round? Bye")
+        assert normalize_text(text) == \
+            "Sign in.\nHello big world!\nIs it round?\nBye"
+
+    def test_truncate(self):
+        """Checks that the text is truncated at a word boundary."""
+        text = "one two three\nfour five"
+        assert normalize_text(text, 10) == "one two"
+        assert normalize_text(text, 13) == "one two three"
+        assert normalize_text("abcdefghij", 4) == "abcd"
+
+
+if __name__ == '__main__':
+    unittest.main()
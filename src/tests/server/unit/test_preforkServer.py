@@ -0,0 +1,85 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server.preforkServer import RemoteWriteBuffer, WriterClient, \
+    WriterService
+from server.writeBuffer import WriteBuffer
+
+
+class FakeIndex():
+    """Records the documents and the indexes created through the writer."""
+
+    def __init__(self):
+        self.documents = []
+        self.created = []
+
+    def add_documents(self, indexname, documents):
+        self.documents.extend((indexname, d["url"]) for d in documents)
+        return True
+
+    def createIx(self, indexname, ovewrite=False, analyzer=None):
+        self.created.append((indexname, analyzer))
+        return True
+
+    def visit(self, indexname, url, digest):
+        return url == "http://seen"
+
+    def visit_many(self, indexname, urls, digests):
+        return [self.visit(indexname, url, digest)
+                for url, digest in zip(urls, digests)]
+
+    def remove_index(self, indexname=None):
+        return True
+
+
+class TestWriterService(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.buffer = WriteBuffer(self.index, max_docs=100, max_delay=0.01)
+        self.service = WriterService(self.index, self.buffer)
+        address, authkey, wal, merge_scheduler, retention = \
+            self.service.endpoint()
+        assert not wal and not merge_scheduler and not retention
+        self.client = WriterClient(address, authkey)
+
+    def tearDown(self):
+        self.service.close()
+        self.buffer.close()
+
+    def test_writes(self):
+        """
+          Checks that the documents and the indexes sent by a worker are
+          written by the write buffer of the writer.
+        """
+        remote = RemoteWriteBuffer(self.client)
+        remote.add_many("A", [{"url": "http://1", "title": "t",
+                               "content": "c", "hash": None}])
+        assert remote.submit(self.index.createIx, "B", False,
+                             "es").result() is True
+        self.buffer.flush()
+        assert self.index.documents == [("A", "http://1")]
+        assert self.index.created == [("B", "es")]
+        assert len(remote) == 0
+
+        assert self.client.visit("A", "http://seen", "0" * 32) is True
+        assert self.client.visit("A", "http://new", "0" * 32) is False
+        assert self.client.visit_many(
+            "A", ["http://new", "http://seen"], ["0" * 32] * 2) == \
+            [False, True]
+
+    def test_forbidden(self):
+        """
+          Checks that the writer only runs the allowed functions, and that
+          a failed call leaves the connection usable.
+        """
+        remote = RemoteWriteBuffer(self.client)
+        with self.assertRaises(RuntimeError):
+            remote.submit(self.index.remove_index, "A")
+        with self.assertRaises(RuntimeError):
+            self.client.call("append", "A", [])
+        assert self.client.visit("A", "http://seen", "0" * 32) is True
+
+
+if __name__ == '__main__':
+    unittest.main()
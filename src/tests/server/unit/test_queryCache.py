@@ -0,0 +1,72 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server.queryCache import QueryCache
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache(max_bytes=100, max_entries=3)
+
+    def tearDown(self):
+        self.cache = None
+
+    def test_hit_and_miss(self):
+        """Checks that a cached value is returned only for its generation."""
+        self.cache.put("A", 1, "q", "value", 10)
+
+        assert self.cache.get("A", 1, "q") == "value"
+        assert self.cache.get("A", 2, "q") is None
+        assert self.cache.get("B", 1, "q") is None
+        assert self.cache.stats()["hits"] == 1
+        assert self.cache.stats()["misses"] == 2
+
+    def test_new_generation(self):
+        """
+          Checks that adding an entry of a newer generation drops the
+          entries of the older ones of the same index only.
+        """
+        self.cache.put("A", 1, "q", "old", 10)
+        self.cache.put("B", 1, "q", "other", 10)
+        self.cache.put("A", 2, "q", "new", 10)
+
+        assert len(self.cache) == 2
+        assert self.cache.stats()["bytes"] == 20
+        assert self.cache.get("B", 1, "q") == "other"
+
+        # Values computed from an older generation are not cached.
+        self.cache.put("A", 1, "r", "stale", 10)
+        assert self.cache.get("A", 1, "r") is None
+
+    def test_eviction(self):
+        """
+          Checks that the least recently used entries are evicted when the
+          cache exceeds its bounds, and that too large values are ignored.
+        """
+        for q in ["a", "b", "c"]:
+            self.cache.put("A", 1, q, q, 10)
+        self.cache.get("A", 1, "a")
+        self.cache.put("A", 1, "d", "d", 10)
+
+        assert self.cache.get("A", 1, "b") is None
+        assert self.cache.get("A", 1, "a") == "a"
+        assert self.cache.stats()["evictions"] == 1
+
+        self.cache.put("A", 1, "e", "e", 90)
+        assert self.cache.stats()["bytes"] <= 100
+
+        self.cache.put("A", 1, "f", "f", 101)
+        assert self.cache.get("A", 1, "f") is None
+
+    def test_ttl(self):
+        """Checks that entries expire after their time to live."""
+        cache = QueryCache(ttl=0)
+        cache.put("A", 1, "q", "value", 10)
+
+        assert cache.get("A", 1, "q") is None
+        assert len(cache) == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
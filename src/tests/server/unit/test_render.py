@@ -95,6 +95,32 @@ class TestRender(unittest.TestCase):
 
         assert ret == html
 
+    def test_render_builder_pages(self):
+        """
+          Checks that the html generated for a page of results shows the
+          position of the page and links the previous and next pages, keeping
+          the indexes and the ranking, and that it is the same whether it is
+          streamed or built at once.
+        """
+        elem = {
+            'url': "http://localhost:8888",
+            'title': "Server"
+          }
+        kwargs = {'query': "a b", 'page': 2, 'pagesize': 1, 'total': 3}
+
+        ret = self.render.build_list_response([elem], **kwargs)
+        chunks = list(self.render.iter_list_response([elem], **kwargs))
+
+        assert "".join(chunks) == ret
+        assert "<p>Results 2 to 2 of 3.</p>" in ret
+        assert '<a href="/search/q=a+b&pagesize=1&page=1">' in ret
+        assert '<a href="/search/q=a+b&pagesize=1&page=3">' in ret
+
+        kwargs.update(index="team1,team2", ranking="recency")
+        ret = self.render.build_list_response([elem], **kwargs)
+        assert '<a href="/search/q=a+b&pagesize=1&index=team1%2Cteam2' \
+            '&rank=recency&page=1">' in ret
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import gzip
+import io
+import unittest
+import zlib
+from server.requestBody import RequestBodyError, read_body
+
+
+class TestRequestBody(unittest.TestCase):
+    def read(self, data, encoding=None, length=None, **kwargs):
+        """Reads data as the body of a request."""
+        length = len(data) if length is None else length
+        return read_body(io.BytesIO(data), str(length), encoding, **kwargs)
+
+    def code(self, *args, **kwargs):
+        """Returns the status code of the error raised by read."""
+        try:
+            self.read(*args, **kwargs)
+        except RequestBodyError as e:
+            return e.code
+        return None
+
+    def test_encodings(self):
+        """Checks that gzip and both kinds of deflate bodies are decoded."""
+        body = b'{"text": "' + b"hello " * 50000 + b'"}'
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+
+        assert self.read(body) == body
+        assert self.read(gzip.compress(body), "gzip") == body
+        assert self.read(zlib.compress(body), "deflate") == body
+        assert self.read(raw.compress(body) + raw.flush(), "deflate") == body
+
+    def test_limits(self):
+        """
+          Checks that bodies exceeding either limit, as received or once
+          decompressed, are rejected.
+        """
+        body = b"a" * 100000
+        assert self.code(body, max_length=1000) == 413
+        assert self.code(gzip.compress(body), "gzip", max_decoded=1000) == 413
+        assert self.code(gzip.compress(body), "gzip") is None
+
+    def test_errors(self):
+        """Checks the errors of missing, unsupported and corrupt bodies."""
+        assert self.code(b"{}", length="x") == 411
+        assert self.code(b"{}", "compress") == 415
+        assert self.code(b"{}", "br") == 415
+        assert self.code(gzip.compress(b"{}")[:-4], "gzip") == 400
+        assert self.code(b"not gzip", "gzip") == 400
+        assert self.code(b"{}", length=10) == 400
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import gzip
+import unittest
+import zlib
+from server.responseBody import accepted_encoding, compress, compressor, \
+    etag, matches
+
+
+class TestResponseBody(unittest.TestCase):
+    def test_accepted_encoding(self):
+        """Checks the negotiation of the content encoding."""
+        assert accepted_encoding(None) is None
+        assert accepted_encoding('') is None
+        assert accepted_encoding('identity') is None
+        assert accepted_encoding('gzip, deflate, br') == 'gzip'
+        assert accepted_encoding('deflate') == 'deflate'
+        assert accepted_encoding('gzip;q=0.5, deflate') == 'deflate'
+        assert accepted_encoding('gzip;q=0, deflate;q=0') is None
+        assert accepted_encoding('GZIP;Q=1') == 'gzip'
+        assert accepted_encoding('*') == 'gzip'
+        assert accepted_encoding('*, gzip;q=0') == 'deflate'
+        assert accepted_encoding('gzip;q=x') is None
+
+    def test_compress(self):
+        """Checks that whole and incremental bodies are decoded back."""
+        body = b'<p>' + b'hello world ' * 5000 + b'</p>'
+        assert gzip.decompress(compress(body, 'gzip')) == body
+        assert zlib.decompress(compress(body, 'deflate')) == body
+        assert len(compress(body, 'gzip')) < len(body) // 10
+
+        encoder = compressor('gzip')
+        data = b''.join(encoder.compress(body[i:i + 100])
+                        for i in range(0, len(body), 100))
+        assert gzip.decompress(data + encoder.flush()) == body
+
+    def test_etag(self):
+        """Checks the tags and the If-None-Match comparison."""
+        tag = etag('search', 3, ('html', 'hello', 1))
+        assert tag.startswith('W/"') and tag.endswith('"')
+        assert tag == etag('search', 3, ('html', 'hello', 1))
+        assert tag != etag('search', 4, ('html', 'hello', 1))
+
+        assert matches(tag, tag)
+        assert matches(tag[2:], tag)
+        assert matches(f'W/"other", {tag}', tag)
+        assert matches('*', tag)
+        assert not matches(None, tag)
+        assert not matches('W/"other"', tag)
@@ -0,0 +1,25 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server.retention import parse_age, parse_rule
+
+
+class TestRetention(unittest.TestCase):
+    def test_parse_age(self):
+        """Checks the ages with and without unit."""
+        assert parse_age("90") == 90
+        assert parse_age("15m") == 15 * 60
+        assert parse_age("12H") == 12 * 3600
+        assert parse_age("1.5d") == 36 * 3600
+        assert parse_age("2w") == 14 * 24 * 3600
+
+    def test_parse_rule(self):
+        """Checks the rules and rejects the malformed ones."""
+        assert parse_rule("*:max_age=30d") == ("*", {"max_age": 30 * 86400})
+        assert parse_rule("team1: max_docs=1000, max_per_domain=50") == (
+            "team1", {"max_docs": 1000, "max_per_domain": 50})
+        for spec in ("max_age=30d", ":max_docs=1", "*:max_size=1",
+                     "*:max_docs=-1", "*:max_age=soon", "*"):
+            with self.assertRaises(ValueError):
+                parse_rule(spec)
@@ -0,0 +1,50 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server import termDictionary
+from server.termDictionary import TermDictionary
+
+
+class TestTermDictionary(unittest.TestCase):
+    def test_complete(self):
+        """
+          Checks that the completions start with the prefix and are sorted
+          by frequency, then by term.
+        """
+        terms = TermDictionary({"apple": 3, "apply": 5, "apricot": 3,
+                                "banana": 9})
+        assert terms.complete("ap") == [("apply", 5), ("apple", 3),
+                                        ("apricot", 3)]
+        assert terms.complete("ap", limit=1) == [("apply", 5)]
+        assert terms.complete("c") == []
+        assert len(terms) == 4
+
+    def test_add(self):
+        """Checks that added documents update the completions."""
+        terms = TermDictionary({"apple": 1})
+        terms.add({"apple", "apricot"})
+        terms.add({"apricot"})
+        assert terms.complete("ap") == [("apple", 2), ("apricot", 2)]
+
+    def test_kept_completions(self):
+        """
+          Checks that the completions kept for prefixes matching many terms
+          are updated by the added documents.
+        """
+        scan_terms = termDictionary.SCAN_TERMS
+        termDictionary.SCAN_TERMS = 2
+        try:
+            terms = TermDictionary({"aa": 1, "ab": 2, "ac": 3})
+            assert terms.complete("a", 2) == [("ac", 3), ("ab", 2)]
+            terms.add({"aa"})
+            terms.add({"aa"})
+            terms.add({"ad"})
+            assert terms.complete("a", 2) == [("aa", 3), ("ac", 3)]
+            assert ("ad", 1) in terms.complete("a", 10)
+        finally:
+            termDictionary.SCAN_TERMS = scan_terms
+
+
+if __name__ == '__main__':
+    unittest.main()
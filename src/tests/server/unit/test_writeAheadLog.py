@@ -0,0 +1,145 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import os
+import shutil
+import unittest
+from server.writeAheadLog import SEGMENT_SUFFIX, WriteAheadLog
+from server.writeBuffer import WriteBuffer
+
+
+TESTPATH = os.path.join(os.getcwd(), "testwal/")
+
+
+class FakeIndex():
+    """Records the documents received by add_documents."""
+
+    def __init__(self, ok=True):
+        self.documents = []
+        self.ok = ok
+
+    def add_documents(self, indexname, documents):
+        if self.ok:
+            self.documents.extend((indexname, d["url"]) for d in documents)
+        return self.ok
+
+
+def document(i):
+    return {"url": f"http://{i}", "title": "t", "content": "c", "hash": None}
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.buffer = WriteBuffer(self.index, max_docs=100, max_delay=0.01)
+
+    def tearDown(self):
+        self.buffer.close()
+        shutil.rmtree(TESTPATH, ignore_errors=True)
+
+    def segments(self):
+        return sorted(f for f in os.listdir(TESTPATH)
+                      if f.endswith(SEGMENT_SUFFIX))
+
+    def test_append(self):
+        """
+          Checks that the appended documents get increasing sequence numbers
+          and become visible once they are indexed.
+        """
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        wal.replay()
+        assert wal.append("A", [document(1), document(2)]) == [1, 2]
+        assert wal.append("B", [document(3)]) == [3]
+
+        assert wal.wait(3, timeout=5)
+        assert wal.visible() == 3
+        assert self.index.documents == [("A", "http://1"), ("A", "http://2"),
+                                        ("B", "http://3")]
+        assert wal.stats()["pending"] == 0
+        wal.close()
+
+    def test_failed_append(self):
+        """
+          Checks that the documents of a failed append do not hold back the
+          visible sequence number, and that their segment is kept.
+        """
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        wal.replay()
+        add_many = self.buffer.add_many
+        self.buffer.add_many = lambda *args: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            wal.append("A", [document(1)])
+        self.buffer.add_many = add_many
+
+        assert wal.append("A", [document(2)]) == [2]
+        assert wal.wait(2, timeout=5)
+        assert wal.stats()["pending"] == 0
+        wal.close()
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        assert wal.replay() == 2
+        wal.close()
+
+    def test_replay(self):
+        """
+          Checks that the documents that could not be indexed are replayed
+          by the next log, which keeps the sequence numbers and ignores a
+          torn record.
+        """
+        failing = WriteBuffer(FakeIndex(ok=False), max_docs=100,
+                              max_delay=0.01)
+        wal = WriteAheadLog(TESTPATH, failing)
+        wal.replay()
+        wal.append("A", [document(1), document(2)])
+        wal.wait(2, timeout=5)
+        failing.close()
+        wal.close()
+        with open(os.path.join(TESTPATH, self.segments()[-1]), "ab") as f:
+            f.write(b"0000 {\"seq\": 3")
+
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        assert wal.replay() == 2
+        assert wal.wait(2, timeout=5)
+        assert self.index.documents == [("A", "http://1"), ("A", "http://2")]
+
+        # The replayed segment is deleted, and the numbering goes on.
+        assert len(self.segments()) == 1
+        assert wal.append("A", [document(3)]) == [3]
+        wal.close()
+
+    def test_close(self):
+        """
+          Checks that after a clean close the next log replays nothing and
+          goes on with the numbering.
+        """
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        wal.replay()
+        wal.append("A", [document(1), document(2)])
+        assert wal.wait(2, timeout=5)
+        wal.close()
+
+        wal = WriteAheadLog(TESTPATH, self.buffer)
+        assert wal.replay() == 0
+        assert wal.append("A", [document(3)]) == [3]
+        assert wal.wait(3, timeout=5)
+        assert self.index.documents == [("A", "http://1"), ("A", "http://2"),
+                                        ("A", "http://3")]
+        assert len(self.segments()) == 1
+        wal.close()
+
+    def test_rotation(self):
+        """
+          Checks that full segments are rotated and deleted once their
+          documents are indexed.
+        """
+        wal = WriteAheadLog(TESTPATH, self.buffer, segment_mb=1e-4)
+        wal.replay()
+        for i in range(5):
+            wal.append("A", [document(i)])
+        assert wal.wait(5, timeout=5)
+        assert len(self.segments()) == 1
+        assert len(self.index.documents) == 5
+        wal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+__author__ = "Marcelo Bianchetti"
+__email__ = "mbianchetti@dc.uba.ar"
+
+import unittest
+from server.writeBuffer import WriteBuffer
+
+
+class FakeIndex():
+    """Records the batches received by add_documents."""
+
+    def __init__(self):
+        self.batches = []
+
+    def add_documents(self, indexname, documents):
+        self.batches.append((indexname, documents))
+        return True
+
+
+class TestWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+
+    def test_flush_on_size(self):
+        """
+          Checks that reaching max_docs commits every pending document
+          in a single batch.
+        """
+        buffer = WriteBuffer(self.index, max_docs=3, max_delay=60)
+        futures = [buffer.add("Testing", f"http://{i}", "t", "c")
+                   for i in range(3)]
+
+        assert all(f.result(timeout=5) for f in futures)
+        assert len(self.index.batches) == 1
+        assert len(self.index.batches[0][1]) == 3
+        buffer.close()
+
+    def test_flush_on_time(self):
+        """Checks that a lonely document is committed after max_delay."""
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=0.05)
+        future = buffer.add("Testing", "http://a", "t", "c")
+
+        assert future.result(timeout=5) is True
+        assert len(self.index.batches) == 1
+        buffer.close()
+
+    def test_flush_on_close(self):
+        """Checks that closing the buffer commits the pending documents."""
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=60)
+        buffer.add_many("A", [{"url": "u", "title": "t", "content": "c"}])
+        buffer.add_many("B", [{"url": "u", "title": "t", "content": "c"}])
+        buffer.close()
+
+        assert len(buffer) == 0
+        assert sorted(name for name, _ in self.index.batches) == ["A", "B"]
+
+    def test_flush_on_bytes(self):
+        """
+          Checks that the pending texts exceeding max_mb commit them before
+          max_docs or max_delay are reached.
+        """
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=60,
+                             max_mb=100 / 1024 / 1024)
+        future = buffer.add("Testing", "http://a", "t", "c" * 200)
+
+        assert future.result(timeout=5) is True
+        assert buffer.pending_bytes() == 0
+        assert len(self.index.batches) == 1
+        buffer.close()
+
+    def test_submit(self):
+        """
+          Checks that submitted operations are run by the buffer thread
+          before the pending documents are committed.
+        """
+        buffer = WriteBuffer(self.index, max_docs=100, max_delay=60)
+        buffer.add("Testing", "http://a", "t", "c")
+
+        calls = []
+        future = buffer.submit(
+            lambda name: calls.append(len(self.index.batches)) or name, "X")
+
+        assert future.result(timeout=5) == "X"
+        assert calls == [0]
+        assert len(self.index.batches) == 1
+        buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()